@@ -0,0 +1,313 @@
+'''The script runs a suite of benchmarks on synthetic data and writes
+the results in JSON format.
+
+Each benchmark generates a genome and alignments with synth_data.py,
+runs gimme.py with --profile and records the total time, time of each
+stage, peak memory usage and counters. get_min_paths is also timed on
+combinatorial graphs with an increasing number of cassette exons.
+
+Startup time of the command line (gimme.py --version) and of importing
+gimme as a library is checked against STARTUP_BUDGETS.
+
+Results can be compared with results of another version to find
+regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py -o new.json --compare old.json
+
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import networkx as nx
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'src')
+GIMME = os.path.join(SOURCE_DIR, 'gimme.py')
+
+sys.path.insert(0, SOURCE_DIR)
+
+from synth_data import Generator
+from utils.get_min_isoforms import get_min_paths
+
+'''Benchmarks: a name, parameters of Generator and options of gimme.py.'''
+SUITE = [
+    ('small', {'genes': 200}, []),
+    ('medium', {'genes': 2000, 'chroms': 4}, []),
+    ('deep', {'genes': 300, 'reads': 300}, []),
+    ('many_exons', {'genes': 300, 'exons': (15, 40)}, []),
+    ('long_introns', {'genes': 500, 'intron_size': (5000, 60000)}, []),
+    ('noisy', {'genes': 500, 'noise': 3.0}, []),
+    ('combinatorial', {'genes': 200, 'combinatorial': 10, 'cassettes': 12},
+        []),
+    ('combinatorial_max', {'genes': 200, 'combinatorial': 5,
+                            'cassettes': 10}, ['-x']),
+    ('threads', {'genes': 2000, 'chroms': 4}, ['-t', '4']),
+]
+
+MIN_PATHS_CASSETTES = [4, 8, 12, 16, 24, 32]
+
+'''Startup time budgets in seconds, including about 20 ms
+for starting the Python interpreter.'''
+STARTUP_BUDGETS = {'cli': 0.15, 'import': 0.15}
+STARTUP_COMMANDS = {'python': ['-c', 'pass'],
+                    'cli': [GIMME, '--version'],
+                    'import': ['-c', 'import gimme']}
+
+
+def get_version():
+    '''Returns a version of gimme.py and a git commit if available.'''
+
+    version = None
+    for line in open(GIMME):
+        if line.startswith('VERSION'):
+            version = line.split('=')[1].strip().strip('\'"')
+            break
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                    cwd=BENCHMARK_DIR,
+                                    stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return version, commit
+
+
+def run_gimme(name, params, options, work_dir, scale, output_format):
+    '''Returns results of gimme.py on synthetic data.'''
+
+    params = dict(params)
+    params['genes'] = max(1, int(params['genes'] * scale))
+    params['combinatorial'] = int(params.get('combinatorial', 0) * scale)
+
+    prefix = os.path.join(work_dir, name)
+    alignments = Generator(**params).write(prefix, output_format)
+
+    profile = prefix + '.profile.json'
+    command = [sys.executable, GIMME, '-r', prefix + '.fa',
+                '--profile', profile, '-o', os.devnull] + options + \
+                [prefix + '.' + output_format]
+
+    start = time.time()
+    with open(prefix + '.log', 'w') as log:
+        subprocess.check_call(command, stderr=log)
+    seconds = time.time() - start
+
+    report = json.load(open(profile))
+    stages = dict((stage, values['wall_seconds'])
+                    for stage, values in report['stages'].iteritems())
+
+    if isinstance(params.get('exons'), tuple):
+        params['exons'] = list(params['exons'])
+    if isinstance(params.get('intron_size'), tuple):
+        params['intron_size'] = list(params['intron_size'])
+
+    return {'params': params,
+            'options': options,
+            'alignments': alignments,
+            'seconds': round(seconds, 3),
+            'stages': stages,
+            'peak_rss_kb': max(report['peak_rss_kb'],
+                                report['peak_rss_children_kb']),
+            'counters': report['counters'],
+            'slowest_loci': report['slowest_loci'][:3]}
+
+
+def make_combinatorial_graph(cassettes):
+    '''Returns a splice graph with alternating constitutive
+    and cassette exons.
+
+    '''
+    graph = nx.DiGraph()
+    for i in range(1, 2 * cassettes, 2):
+        graph.add_path([i - 1, i, i + 1])
+        graph.add_edge(i - 1, i + 1)
+    graph.add_edge('Start', 0)
+    graph.add_edge(2 * cassettes, 'End')
+    return graph
+
+
+def run_min_paths(repeat=3):
+    '''Returns time of get_min_paths on combinatorial graphs.'''
+
+    results = {}
+    for cassettes in MIN_PATHS_CASSETTES:
+        graph = make_combinatorial_graph(cassettes)
+        best = None
+        for i in range(repeat):
+            stats = {}
+            start = time.time()
+            paths = get_min_paths(graph, False, stats)
+            seconds = time.time() - start
+            best = seconds if best is None else min(best, seconds)
+
+        results[str(cassettes)] = {'seconds': round(best, 6),
+                                    'edges': graph.number_of_edges(),
+                                    'paths': len(paths),
+                                    'rounds': stats['rounds']}
+    return results
+
+
+def run_startup(repeat=10):
+    '''Returns the minimum and median time of starting Python,
+    gimme.py --version and importing gimme.
+
+    '''
+    results = {}
+    with open(os.devnull, 'w') as devnull:
+        for name, command in sorted(STARTUP_COMMANDS.iteritems()):
+            times = []
+            for i in range(repeat):
+                start = time.time()
+                subprocess.check_call([sys.executable] + command,
+                                        cwd=SOURCE_DIR, stdout=devnull,
+                                        stderr=devnull)
+                times.append(time.time() - start)
+            times.sort()
+            results[name] = {'seconds': round(times[0], 4),
+                            'median_seconds': round(times[repeat // 2], 4),
+                            'budget_seconds': STARTUP_BUDGETS.get(name)}
+    return results
+
+
+def check_startup(startup):
+    '''Prints startup times over budget and returns their number.'''
+
+    over = 0
+    for name, result in sorted(startup.iteritems()):
+        budget = result['budget_seconds']
+        if budget and result['seconds'] > budget:
+            print >> sys.stderr, 'Startup of %s took %.3f s (budget %.3f s)' \
+                                    % (name, result['seconds'], budget)
+            over += 1
+    return over
+
+
+def compare(results, baseline, threshold, min_seconds=0.05):
+    '''Prints times that changed by more than threshold and
+    returns the number of regressions.
+
+    '''
+    regressions = 0
+    rows = []
+    for name, result in sorted(results['benchmarks'].iteritems()):
+        try:
+            old_result = baseline['benchmarks'][name]
+        except KeyError:
+            continue
+
+        times = [('total', result['seconds'], old_result['seconds'])]
+        for stage, seconds in sorted(result['stages'].iteritems()):
+            if stage in old_result['stages']:
+                times.append((stage, seconds, old_result['stages'][stage]))
+
+        for stage, seconds, old_seconds in times:
+            if max(seconds, old_seconds) < min_seconds:
+                continue
+            ratio = seconds / max(old_seconds, 1e-6)
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = 'SLOWER'
+                regressions += 1
+            elif ratio < 1 - threshold:
+                flag = 'faster'
+            rows.append((name, stage, old_seconds, seconds, ratio, flag))
+
+    for name, result in sorted(results.get('startup', {}).iteritems()):
+        try:
+            old_seconds = baseline['startup'][name]['seconds']
+        except KeyError:
+            continue
+        seconds = result['seconds']
+        ratio = seconds / max(old_seconds, 1e-6)
+        flag = ''
+        if ratio > 1 + threshold and seconds - old_seconds > 0.01:
+            flag = 'SLOWER'
+            regressions += 1
+        elif ratio < 1 - threshold and old_seconds - seconds > 0.01:
+            flag = 'faster'
+        rows.append(('startup', name, old_seconds, seconds, ratio, flag))
+
+    print '%-20s %-32s %10s %10s %7s' % ('benchmark', 'stage',
+                                            'old (s)', 'new (s)', 'ratio')
+    for row in rows:
+        print '%-20s %-32s %10.3f %10.3f %7.2f %s' % row
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='run_benchmarks.py',
+            description='Run benchmarks of gimme.py on synthetic data.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+            help='a results file (default: %(default)s)')
+    parser.add_argument('--compare', metavar='path',
+            help='compare results with a results file of another version')
+    parser.add_argument('--threshold', type=float, default=0.2,
+            help='a relative change reported as a regression ' +
+            '(default: %(default)s)')
+    parser.add_argument('--scale', type=float, default=1.0,
+            help='multiply the number of genes in each benchmark ' +
+            '(default: %(default)s)')
+    parser.add_argument('--only', nargs='+', metavar='name',
+            help='run only these benchmarks: ' +
+            ', '.join([name for name, params, options in SUITE]))
+    parser.add_argument('--format', choices=['psl', 'bed'], default='psl',
+            help='input format (default: %(default)s)')
+    parser.add_argument('--work_dir',
+            help='keep generated data in this directory')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='gimme_bench')
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+
+    version, commit = get_version()
+    results = {'version': version,
+                'commit': commit,
+                'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python': sys.version.split()[0],
+                'scale': args.scale,
+                'benchmarks': {}}
+    try:
+        for name, params, options in SUITE:
+            if args.only and name not in args.only:
+                continue
+            print >> sys.stderr, 'Running %s...' % name,
+            result = run_gimme(name, params, options, work_dir,
+                                args.scale, args.format)
+            results['benchmarks'][name] = result
+            print >> sys.stderr, '%.2f s' % result['seconds']
+
+        print >> sys.stderr, 'Running get_min_paths...'
+        results['get_min_paths'] = run_min_paths()
+        print >> sys.stderr, 'Running startup...'
+        results['startup'] = run_startup()
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+    print >> sys.stderr, 'Results are written to %s' % args.output
+
+    regressions = check_startup(results['startup'])
+    if args.compare:
+        regressions += compare(results, json.load(open(args.compare)),
+                                args.threshold)
+    if regressions:
+        print >> sys.stderr, '%d regression(s) found.' % regressions
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
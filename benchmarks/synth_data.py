@@ -0,0 +1,249 @@
+'''The script generates a synthetic genome and alignments in PSL or
+BED format for benchmarking Gimme.
+
+Genes are placed along chromosomes of a random genome with GT-AG
+(or CT-AC on the negative strand) splice sites. Reads of each gene
+start and end at random exons, skip alternative exons and have
+ragged ends and small gaps. Single-exon reads are added as noise.
+
+Combinatorial loci alternate constitutive and cassette exons.
+Each cassette exon can be skipped independently, so a locus
+with n cassettes has 2^n putative isoforms.
+
+Usage: python synth_data.py [options] <output prefix>
+
+Output files are <prefix>.fa and <prefix>.psl (or <prefix>.bed).
+
+'''
+
+import sys
+import random
+import argparse
+
+MARGIN = 5000  # bases before the first and after the last gene
+
+
+def get_range(text):
+    '''Returns a tuple of two integers from "min,max".'''
+
+    low, high = [int(x) for x in text.split(',')]
+    return low, high
+
+
+class Generator(object):
+    def __init__(self, genes=1000, chroms=1, reads=20, exons=(2, 12),
+                    exon_size=(60, 300), intron_size=(80, 3000),
+                    skip_rate=0.3, noise=0.3, combinatorial=0, cassettes=10,
+                    seed=1):
+        self.genes = genes
+        self.chroms = chroms
+        self.reads = reads
+        self.exons = exons
+        self.exon_size = exon_size
+        self.intron_size = intron_size
+        self.skip_rate = skip_rate
+        self.noise = noise
+        self.combinatorial = combinatorial
+        self.cassettes = cassettes
+        self.random = random.Random(seed)
+
+    def make_exons(self, start, n):
+        '''Returns n exons starting at start.'''
+
+        exons = []
+        for i in range(n):
+            size = self.random.randint(*self.exon_size)
+            exons.append((start, start + size))
+            start += size + self.random.randint(*self.intron_size)
+        return exons
+
+    def make_reads(self, exons):
+        '''Returns reads from a gene with alternative exons.'''
+
+        reads = []
+        for i in range(self.random.randint(1, 2 * self.reads)):
+            first = self.random.randint(0, len(exons) - 1)
+            last = self.random.randint(first, len(exons) - 1)
+            blocks = [list(exons[first])]
+            for exon in exons[first + 1:last]:
+                if self.random.random() >= self.skip_rate:
+                    blocks.append(list(exon))
+            if last > first:
+                blocks.append(list(exons[last]))
+
+            blocks[0][0] += self.random.randint(-50, 50)
+            blocks[-1][1] += self.random.randint(-150, 50)
+            if blocks[-1][1] <= blocks[-1][0]:
+                blocks[-1][1] = blocks[-1][0] + 10
+
+            if (self.random.random() < 0.1 and
+                    blocks[0][1] - blocks[0][0] > 40):
+                middle = blocks[0][0] + 20  # a small gap from an indel
+                blocks[0:1] = [[blocks[0][0], middle],
+                                [middle + 3, blocks[0][1]]]
+            reads.append(blocks)
+        return reads
+
+    def make_combinatorial_reads(self, exons):
+        '''Returns reads including and skipping each cassette exon.
+
+        Exons at odd positions are cassette exons between
+        constitutive exons.
+
+        '''
+        reads = []
+        for i in range(1, len(exons) - 1, 2):
+            for blocks in ([exons[i - 1], exons[i], exons[i + 1]],
+                            [exons[i - 1], exons[i + 1]]):
+                for k in range(self.random.randint(1, 3)):
+                    reads.append([list(b) for b in blocks])
+        return reads
+
+    def generate(self):
+        '''Returns chromosome sizes, splice sites and reads.
+
+        Reads are lists of blocks sorted by chromosome and start.
+
+        '''
+        loci = ['gene'] * self.genes + ['combinatorial'] * self.combinatorial
+        self.random.shuffle(loci)
+
+        chroms = {}
+        sites = {}
+        reads = []
+        for n in range(self.chroms):
+            chrom = 'chr%d' % (n + 1)
+            start = MARGIN
+            chrom_sites = sites[chrom] = []
+            chrom_reads = []
+            for locus in loci[n::self.chroms]:
+                strand = self.random.choice('+-')
+                if locus == 'gene':
+                    exons = self.make_exons(start,
+                                        self.random.randint(*self.exons))
+                    locus_reads = self.make_reads(exons)
+                else:
+                    exons = self.make_exons(start, 2 * self.cassettes + 1)
+                    locus_reads = self.make_combinatorial_reads(exons)
+
+                for exon, next_exon in zip(exons[:-1], exons[1:]):
+                    chrom_sites.append((exon[1], next_exon[0], strand))
+                for blocks in locus_reads:
+                    chrom_reads.append((blocks, strand))
+
+                end = exons[-1][1]
+                if self.random.random() < self.noise:
+                    noise_start = self.random.randint(start, end)
+                    noise_end = noise_start + self.random.randint(200, 1500)
+                    chrom_reads.append(([[noise_start, noise_end]], '+'))
+                start = end + self.random.randint(500, 20000)
+
+            chroms[chrom] = start + MARGIN
+            chrom_reads.sort(key=lambda read: read[0][0][0])
+            reads.extend((chrom, blocks, strand)
+                            for blocks, strand in chrom_reads)
+
+        return chroms, sites, reads
+
+    def write(self, prefix, output_format='psl'):
+        chroms, sites, reads = self.generate()
+
+        with open(prefix + '.fa', 'w') as fp:
+            for chrom in sorted(chroms):
+                seq = bytearray(self.random.choice('ACGT')
+                                    for i in xrange(chroms[chrom]))
+                for end, start, strand in sites[chrom]:
+                    if strand == '+':
+                        seq[end:end + 2] = 'GT'
+                        seq[start - 2:start] = 'AG'
+                    else:
+                        seq[end:end + 2] = 'CT'
+                        seq[start - 2:start] = 'AC'
+                fp.write('>%s\n' % chrom)
+                for i in xrange(0, len(seq), 60):
+                    fp.write('%s\n' % seq[i:i + 60])
+
+        with open('%s.%s' % (prefix, output_format), 'w') as fp:
+            for n, (chrom, blocks, strand) in enumerate(reads, start=1):
+                if output_format == 'psl':
+                    fp.write(get_psl(chrom, chroms[chrom], blocks,
+                                        strand, 'r%d' % n))
+                else:
+                    fp.write(get_bed(chrom, blocks, strand, 'r%d' % n))
+
+        return len(reads)
+
+
+def get_psl(chrom, chrom_size, blocks, strand, name):
+    '''Returns a PSL line of a read.'''
+
+    sizes = [end - start for start, end in blocks]
+    query_size = sum(sizes)
+    query_starts = [sum(sizes[:i]) for i in range(len(sizes))]
+    return '\t'.join([str(x) for x in
+                        (query_size, 0, 0, 0, 0, 0, len(blocks) - 1, 0,
+                        strand, name, query_size, 0, query_size,
+                        chrom, chrom_size, blocks[0][0], blocks[-1][1],
+                        len(blocks),
+                        ''.join(['%d,' % x for x in sizes]),
+                        ''.join(['%d,' % x for x in query_starts]),
+                        ''.join(['%d,' % x[0] for x in blocks]))]) + '\n'
+
+
+def get_bed(chrom, blocks, strand, name):
+    '''Returns a BED line of a read.'''
+
+    start = blocks[0][0]
+    end = blocks[-1][1]
+    return '\t'.join([str(x) for x in
+                        (chrom, start, end, name, 1000, strand, start, end,
+                        '0,0,0', len(blocks),
+                        ','.join([str(e - s) for s, e in blocks]),
+                        ','.join([str(s - start) for s, e in blocks]))]) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='synth_data.py',
+            description='Generate a synthetic genome and alignments.')
+    parser.add_argument('prefix', help='a prefix of output files')
+    parser.add_argument('--genes', type=int, default=1000,
+            help='the number of genes (default: %(default)s)')
+    parser.add_argument('--chroms', type=int, default=1,
+            help='the number of chromosomes (default: %(default)s)')
+    parser.add_argument('--reads', type=int, default=20,
+            help='the average number of reads per gene ' +
+            '(default: %(default)s)')
+    parser.add_argument('--exons', type=get_range, default='2,12',
+            help='min,max number of exons per gene (default: %(default)s)')
+    parser.add_argument('--exon_size', type=get_range, default='60,300',
+            help='min,max exon size (default: %(default)s)')
+    parser.add_argument('--intron_size', type=get_range, default='80,3000',
+            help='min,max intron size (default: %(default)s)')
+    parser.add_argument('--skip_rate', type=float, default=0.3,
+            help='the probability that a read skips an internal exon ' +
+            '(default: %(default)s)')
+    parser.add_argument('--noise', type=float, default=0.3,
+            help='the probability of a single-exon read near a gene ' +
+            '(default: %(default)s)')
+    parser.add_argument('--combinatorial', type=int, default=0,
+            help='the number of combinatorial loci (default: %(default)s)')
+    parser.add_argument('--cassettes', type=int, default=10,
+            help='the number of cassette exons in a combinatorial locus ' +
+            '(default: %(default)s)')
+    parser.add_argument('--format', choices=['psl', 'bed'], default='psl',
+            help='output format (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1,
+            help='a random seed (default: %(default)s)')
+    args = parser.parse_args()
+
+    generator = Generator(args.genes, args.chroms, args.reads, args.exons,
+                            args.exon_size, args.intron_size,
+                            args.skip_rate, args.noise, args.combinatorial,
+                            args.cassettes, args.seed)
+    n = generator.write(args.prefix, args.format)
+    print >> sys.stderr, 'Wrote %d alignments to %s.%s' % \
+                                    (n, args.prefix, args.format)
+
+
+if __name__ == '__main__':
+    main()
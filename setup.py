@@ -11,7 +11,7 @@ setup(
 
         install_requires = [
                             'networkx == 1.7',
-                            'pygr == 0.8.2',
+                            'numpy',
                             'bx-python == 0.7.1',
                             'bsddb3 == 6.0.1',
                             ]
@@ -20,18 +20,27 @@
 '''
 #!/usr/bin/env python
 
+import os
 import sys
-import csv
+import cPickle
+import heapq
+import time
+import struct
 import argparse
 
+from array import array
 from sys import stderr, stdout
-
-import networkx as nx
+from cStringIO import StringIO
+from collections import namedtuple
+from itertools import chain, islice, izip, repeat
 
 #from matplotlib import pyplot as plt
-from utils import pslparser, get_min_isoforms, split_strand
-from bx.intervals.intersection import Interval, IntervalTree
-from pygr import seqdb
+from utils import get_min_isoforms, split_strand, output_writer
+from utils import input_reader
+from utils.profiler import Profiler
+
+# numpy, networkx, multiprocessing and modules depending on them
+# are imported by functions that need them to keep startup fast
 
 
 gap_size = 50  # a minimum intron size (bp)
@@ -41,11 +50,128 @@ min_transcript_len = 300  # a minimum length for multiple exon transcript(bp)
 min_single_exon_len = 500  # a minimum length for a single exon(bp)
 max_isoforms = 20   # minimal isoforms will be searched
                     #if the number of isoforms exceed this number
+max_paths = 100000  # minimal isoforms are reported with -x if a gene
+                    # has more paths than this number
+max_gene_edges = 10000  # a gene with more edges gets greedy paths
+max_gene_seconds = 60  # time allowed for searching paths of a gene
 VERSION = '0.98'
 
+profiler = Profiler(enabled=False)  # enabled by --profile
+
+FALLBACK_RGB = '255,0,0'  # item RGB of genes exceeding a budget
+# a BED line ending with CRLF as written by csv excel-tab dialect
+BED_LINE = '%s\t%d\t%d\t%s\t%d\t%s\t%d\t%d\t%s\t%d\t%s\t%s\r\n'
+
+
+class Config(object):
+    '''Parameters of assembling passed to functions building
+    gene models. Parameters not given are set to defaults above.
+
+    find_max reports all putative isoforms as -x does.
+
+    '''
+    def __init__(self, **params):
+        self.gap_size = gap_size
+        self.max_intron = max_intron
+        self.min_utr = min_utr
+        self.min_transcript_len = min_transcript_len
+        self.min_single_exon_len = min_single_exon_len
+        self.max_isoforms = max_isoforms
+        self.find_max = False
+        self.max_paths = max_paths
+        self.max_gene_edges = max_gene_edges
+        self.max_gene_seconds = max_gene_seconds
+
+        for name, value in params.iteritems():
+            if name not in self.__dict__:
+                raise TypeError('Unknown parameter: %s' % name)
+            setattr(self, name, value)
+
+        if (self.max_paths < 0 or self.max_gene_edges < 0 or
+                self.max_gene_seconds < 0):
+            raise ValueError('Invalid complexity budget (<0)')
+
+    def get_alignment_params(self):
+        '''Returns parameters that exon chains of alignments depend on.'''
+
+        return self.gap_size, self.max_intron
+
+    def get_params(self):
+        '''Returns parameters that multi-exon gene models depend on.'''
+
+        return (self.gap_size, self.max_intron, self.min_utr,
+                self.min_transcript_len, self.max_isoforms, self.find_max,
+                self.max_paths, self.max_gene_edges, self.max_gene_seconds)
+
+
+class Transcript(namedtuple('Transcript', ['chrom', 'strand', 'gene_id',
+                                            'transcript_id', 'starts',
+                                            'ends', 'fallback'])):
+    '''A transcript of a gene model.
+
+    starts and ends are arrays of exon starts and ends in BED
+    coordinates. fallback is a reason why the gene exceeds
+    a complexity budget (see get_paths()) or None.
+
+    '''
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return '%s:%d.%d' % (self.chrom, self.gene_id, self.transcript_id)
+
+
+class BedWriter(object):
+    '''Writes transcripts to an output in BED format and keeps
+    names and reasons of genes exceeding a complexity budget.
+
+    '''
+    def __init__(self, output=stdout):
+        self.output = output
+        self.fallbacks = []
+
+    def add(self, transcript):
+        if transcript.fallback:
+            item_RGB = FALLBACK_RGB
+            if transcript.transcript_id == 1:
+                self.fallbacks.append(('%s:%d' % (transcript.chrom,
+                                                    transcript.gene_id),
+                                        transcript.fallback))
+        else:
+            item_RGB = '0,0,0'
+
+        starts = transcript.starts
+        ends = transcript.ends
+        chrom_start = starts[0]
+        chrom_end = ends[-1]
+
+        block_starts = ','.join([str(start - chrom_start)
+                                    for start in starts])
+        block_sizes = ','.join([str(end - start)
+                                    for start, end in izip(starts, ends)])
+
+        score = 1000
+        thick_start = chrom_start
+        thick_end = chrom_end
+        block_count = len(starts)
+
+        self.output.write(BED_LINE % (transcript.chrom,
+                                        chrom_start,
+                                        chrom_end,
+                                        transcript.name,
+                                        score,
+                                        transcript.strand,
+                                        thick_start,
+                                        thick_end,
+                                        item_RGB,
+                                        block_count,
+                                        block_sizes,
+                                        block_starts))
+
 
 class ExonObj:
     def __init__(self, chrom, start, end):
+        self.id = None  # assigned when the exon is added to AlignmentDB
         self.chrom = chrom
         self.start = start
         self.end = end
@@ -62,316 +188,562 @@ class ExonObj:
         return self.end - self.start + 1
 
 
-class AlignmentDB(object):
+class DisjointSet(object):
+    '''A disjoint-set forest with union by rank and path compression.
+
+    Elements are integers from 0 to n - 1.
+
+    '''
     def __init__(self):
-        self.exon_db = {}  # store all exon objects
-        self.intron_db = {}  # store all intron objects
-        self.single_exons_db = {}  # store all single exon objects
-        self.single_exons_intervals = {}  # store intersecter objects for
-                                          # single exons
+        self.parent = array('l')
+        self.rank = array('B')
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self):
+        '''Returns a new element in its own set.'''
+
+        x = len(self.parent)
+        self.parent.append(x)
+        self.rank.append(0)
+        return x
+
+    def find(self, x):
+        '''Returns a representative element of a set containing x.'''
+
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x, y):
+        '''Merges sets containing x and y.'''
+
+        x = self.find(x)
+        y = self.find(y)
+        if x == y:
+            return x
+        if self.rank[x] < self.rank[y]:
+            x, y = y, x
+        self.parent[y] = x
+        if self.rank[x] == self.rank[y]:
+            self.rank[x] += 1
+        return x
+
+    def groups(self):
+        '''Returns lists of elements in each set ordered by
+        the smallest element.
 
+        '''
+        groups = {}
+        for x in xrange(len(self.parent)):
+            root = self.find(x)
+            try:
+                groups[root].append(x)
+            except KeyError:
+                groups[root] = [x]
+        return sorted(groups.itervalues())
 
-def parse_bed(bed_file):
-    '''Reads alignments from BED format and creates
-    exon objects from a transcript.
 
-    '''
-    reader = csv.reader(bed_file, dialect='excel-tab')
-    for row in reader:
-        exons = []
-        chrom = row[0]
-        chrom_start = int(row[1])
+class IntronDB(object):
+    '''Stores introns in columnar arrays indexed by an intron ID.
 
-        exon_sizes = [int(s) for s in row[10].split(',')]
-        exon_starts = [chrom_start + int(s) for s in row[11].split(',')]
+    Each intron has a chromosome, start and end positions and a list
+    of pairs of exons it connects. Introns from the same gene are
+    grouped into a component in a disjoint set.
 
-        for i in range(len(exon_starts)):
-            exon_start = exon_starts[i]
-            exon_end = exon_start + exon_sizes[i]
+    Introns that are new or get a new pair of exons are recorded
+    in changed, so that unchanged components can be reused.
 
-            exon = ExonObj(chrom, exon_start, exon_end)
-            exons.append(exon)
+    '''
+    def __init__(self):
+        self.ids = {}  # chromosome -> packed (start, end) -> intron ID
+        self.chrom_names = []
+        self.chrom_ids = {}
+        self.chrom = array('i')
+        self.start = array('l')
+        self.end = array('l')
+        self.clusters = DisjointSet()
+        self.edges = []  # pairs of exons connected by each intron
+        self.changed = set()
+
+    def __len__(self):
+        return len(self.start)
+
+    def add(self, chrom, start, end):
+        '''Returns an intron ID and whether the intron is new.'''
 
-        exons = delete_gap(exons, gap_size)
-        yield exons
+        try:
+            chrom_introns = self.ids[chrom]
+        except KeyError:
+            chrom_introns = self.ids[chrom] = {}
+            self.chrom_ids[chrom] = len(self.chrom_names)
+            self.chrom_names.append(chrom)
 
+        key = (start << 32) | end
+        try:
+            return chrom_introns[key], False
+        except KeyError:
+            intron = chrom_introns[key] = len(self.start)
+            self.chrom.append(self.chrom_ids[chrom])
+            self.start.append(start)
+            self.end.append(end)
+            self.clusters.add()
+            self.edges.append([])
+            self.changed.add(intron)
+            return intron, True
 
-def parse_psl(psl_file):
-    '''Reads alignments from PSL format and creates
-    exon objects from each transcript.
+    def get_components(self):
+        '''Returns lists of introns from the same gene.'''
 
-    '''
-    for pslobj in pslparser.read(psl_file):
-        exons = []
+        return self.clusters.groups()
 
-        for i in range(len(pslobj.tStarts)):
-            exon_start = pslobj.tStarts[i]
-            exon_end = exon_start + pslobj.blockSizes[i]
+    def add_edge(self, intron, exon1, exon2):
+        '''Adds a pair of exons connected by an intron.'''
 
-            exon = ExonObj(pslobj.tName, exon_start, exon_end)
-            exons.append(exon)
+        edge = (exon1, exon2)
+        if edge not in self.edges[intron]:
+            self.edges[intron].append(edge)
+            self.changed.add(intron)
 
-        exons = delete_gap(exons, gap_size)
-        yield exons
+    def get_name(self, intron):
+        return '%s:%d-%d' % (self.chrom_names[self.chrom[intron]],
+                                self.start[intron],
+                                self.end[intron])
 
 
-def remove_large_intron(exons, max_intron=1e6):
-    '''Returns groups of exons split by introns longer than
-    max_intron or return a list containing the original exons.
+class AlignmentDB(object):
+    def __init__(self):
+        self.exon_ids = {}  # chromosome -> packed (start, end) -> exon ID
+        self.exon_db = []  # store all exon objects indexed by exon ID
+        self.intron_db = IntronDB()  # store all introns
+        self.single_exons_db = {}  # chromosome -> starts and ends of
+                                   # single exons
+        self.single_exons_intervals = {}  # chromosome -> an interval
+                                          # index and removed flags of
+                                          # merged single exons
+        self.chain_counts = {}  # exon chain -> number of alignments
+        self.chain_log = None  # keys of new exon chains in order of
+                               # addition if it is a list
+
+    def add_single_exon(self, chrom, start, end):
+        try:
+            starts, ends = self.single_exons_db[chrom]
+        except KeyError:
+            starts, ends = self.single_exons_db[chrom] = (array('l'),
+                                                            array('l'))
+        starts.append(start)
+        ends.append(end)
 
-    Exons is a list of exons sorted by start position.
+    def intern_exon(self, exon):
+        '''Returns an ID of an exon and whether the exon is new.
 
-    '''
-    if max_intron < 0:
-        return [exons]  # disable
+        A new exon is stored in the exon database. The ID is also
+        assigned to an id attribute of the exon.
 
-    all_exon_groups = []
-    subgroup = []
-    for i in range(len(exons)):
-        curr_exon = exons[i]
+        '''
         try:
-            next_exon = exons[i + 1]
-        except IndexError:  # end of list
-            subgroup.append(curr_exon)
-            all_exon_groups.append(subgroup[:])
-            break
+            chrom_exons = self.exon_ids[exon.chrom]
+        except KeyError:
+            chrom_exons = self.exon_ids[exon.chrom] = {}
+
+        key = (exon.start << 32) | exon.end
+        try:
+            exon.id = chrom_exons[key]
+        except KeyError:
+            exon.id = chrom_exons[key] = len(self.exon_db)
+            self.exon_db.append(exon)
+            return exon.id, True
         else:
-            intron_start = curr_exon.end + 1
-            intron_end = next_exon.start - 1
+            return exon.id, False
 
-            if intron_end - intron_start > max_intron:
-                subgroup.append(curr_exon)
-                all_exon_groups.append(subgroup[:])
 
-                subgroup = []  # start new subgroup
-            else:
-                subgroup.append(curr_exon)
+class ExonGraph(object):
+    '''A splice graph of a component over integer node numbers
+    for collapsing exons.
 
-    return all_exon_groups
+    Exons are numbered in order of their starts and ends, so a sweep
+    from the left visits nodes in order of their numbers and a sweep
+    from the right follows by_end. Coordinates and both orders are
+    computed once and shared by subgraphs of the component.
 
+    '''
+    def __init__(self, exon_db, edges):
+        '''edges are pairs of exon IDs. Terminal exons are marked
+        by exon objects in exon_db.
+
+        '''
+        edges = list(edges)
+        exons = sorted([exon_db[e] for e in set(chain.from_iterable(edges))],
+                        key=lambda x: (x.start, x.end))
+        self.ids = [exon.id for exon in exons]
+        self.index = dict((e, i) for i, e in enumerate(self.ids))
+        self.starts = [exon.start for exon in exons]
+        self.ends = [exon.end for exon in exons]
+        self.by_end = sorted(xrange(len(exons)),
+                                key=lambda i: (self.ends[i], self.starts[i]))
+        self.set_edges(edges)
+        self.terminals = [exon.terminal for exon in exons]
+
+    def set_edges(self, edges):
+        n = len(self.ids)
+        self.succs = [set() for i in xrange(n)]
+        self.preds = [set() for i in xrange(n)]
+        self.alive = [False] * n
+        index = self.index
+        for u, v in edges:
+            u = index[u]
+            v = index[v]
+            self.succs[u].add(v)
+            self.preds[v].add(u)
+            self.alive[u] = self.alive[v] = True
+
+    def subgraph(self, edges):
+        '''Returns a graph of given edges sharing coordinates with
+        this graph. Exons without predecessors are left terminals
+        and other exons without successors are right terminals.
+
+        '''
+        graph = ExonGraph.__new__(ExonGraph)
+        graph.__dict__.update(self.__dict__)
+        graph.set_edges(edges)
+        graph.terminals = [None] * len(self.ids)
+        for i in xrange(len(self.ids)):
+            if graph.alive[i]:
+                if not graph.preds[i]:
+                    graph.terminals[i] = 1  # left end
+                elif not graph.succs[i]:
+                    graph.terminals[i] = 2  # right end
+        return graph
+
+    def nodes(self):
+        return [self.ids[i] for i in xrange(len(self.ids)) if self.alive[i]]
+
+    def edges(self):
+        ids = self.ids
+        return [(ids[u], ids[v]) for u in xrange(len(ids)) if self.alive[u]
+                    for v in self.succs[u]]
+
+    def remove_node(self, node):
+        for succ in self.succs[node]:
+            self.preds[succ].discard(node)
+        for pred in self.preds[node]:
+            self.succs[pred].discard(node)
+        self.succs[node] = set()
+        self.preds[node] = set()
+        self.alive[node] = False
+
+    def merge_right(self, node, other):
+        '''Moves successors of node to other and removes node.'''
+
+        for succ in self.succs[node]:
+            self.succs[other].add(succ)
+            self.preds[succ].add(other)
+        self.remove_node(node)
+
+    def merge_left(self, node, other):
+        '''Moves predecessors of node to other and removes node.'''
+
+        for pred in self.preds[node]:
+            self.preds[other].add(pred)
+            self.succs[pred].add(other)
+        self.remove_node(node)
+
+    def collapse(self, min_utr):
+        '''Merges terminal exons into overlapping exons sharing
+        the same end (right sweep) or start (left sweep).
+
+        A left terminal exon is merged into an exon with the same end
+        and a smaller start, or a larger start within min_utr.
+        A right terminal exon is merged into an exon with the same start
+        and a larger end, or a smaller end within min_utr.
+
+        '''
+        starts, ends, terminals = self.starts, self.ends, self.terminals
+
+        nodes = [i for i in self.by_end if self.alive[i]]
+        if not nodes:
+            return
+        curr = nodes[0]
+        for node in nodes[1:]:
+            if ends[curr] == ends[node]:
+                if terminals[node] == 1:  # left terminal
+                    self.merge_right(node, curr)
+                    if terminals[curr] == 2:
+                        terminals[curr] = None
+                    continue
+                if (terminals[curr] == 1 and
+                        starts[node] - starts[curr] <= min_utr):
+                    self.merge_right(curr, node)
+            curr = node
+
+        nodes = [i for i in xrange(len(self.ids)) if self.alive[i]]
+        curr = nodes[0]
+        for node in nodes[1:]:
+            if starts[curr] == starts[node]:
+                if terminals[curr] == 2:  # right terminal
+                    self.merge_left(curr, node)
+                elif (terminals[node] == 2 and
+                        ends[node] - ends[curr] <= min_utr):
+                    self.merge_left(node, curr)
+                    continue
+            curr = node
+
+    def update(self, g):
+        '''Removes collapsed exons from a networkx graph g of
+        the same edges and adds edges moved to remaining exons.
+
+        '''
+        g.remove_nodes_from([self.ids[i] for i in xrange(len(self.ids))
+                                if not self.alive[i] and self.ids[i] in g])
+        g.add_edges_from([edge for edge in self.edges()
+                            if not g.has_edge(*edge)])
 
-def add_intron(exons, align_db, clusters, cluster_no):
-    '''Get introns from a set of exons.
 
-    Intron object is created for each intron with all connected exons
-    as an attribute.
+def read_chunks(fobj, chunk_size=100000):
+    '''Yields lists of up to chunk_size lines from a file object
+    or a list of lines.
+
     '''
+    fobj = iter(fobj)
+    while True:
+        lines = list(islice(fobj, chunk_size))
+        if not lines:
+            break
+        yield lines
 
-    introns = []
-    existing_clusters = set()
 
-    for i in range(len(exons)):
-        curr_exon = exons[i]
-        try:
-            next_exon = exons[i + 1]
-        except IndexError:
-            pass
+def to_array(fields):
+    '''Returns a flat integer array from comma-separated lists.'''
+
+    import numpy
+
+    text = ' '.join(fields).replace(',', ' ')
+    return numpy.fromstring(text, dtype=numpy.int64, sep=' ')
+
+
+def parse_bed_chunk(lines):
+    '''Returns chromosomes, block counts and flat arrays of exon starts
+    and ends of alignments in BED format.
+
+    '''
+    import numpy
+
+    rows = []
+    for line in lines:
+        row = line.split()
+        if len(row) < 12 or row[9] == '0':
+            print >> stderr, 'Skipped:', line,
         else:
-            intron_start = curr_exon.end + 1
-            intron_end = next_exon.start - 1
+            rows.append(row)
+    if not rows:
+        return [], numpy.zeros(0, numpy.int64), None, None
 
-            curr_exon.next_exons.add(str(next_exon))
+    cols = zip(*rows)
+    counts = numpy.array(cols[9]).astype(numpy.int64)
+    sizes = to_array(cols[10])
+    starts = to_array(cols[11])
+    if len(sizes) != counts.sum() or len(starts) != counts.sum():
+        raise ValueError('Block count does not match block sizes or starts.')
 
-            intron_name = '%s:%d-%d' % (curr_exon.chrom,
-                                            intron_start,
-                                            intron_end)
-            intron = nx.DiGraph(name=intron_name, cluster=None)
+    starts += numpy.repeat(numpy.array(cols[1]).astype(numpy.int64), counts)
+    return cols[0], counts, starts, starts + sizes
 
-            try:
-                intron_ = align_db.intron_db[intron.graph['name']]
-            except KeyError:
-                align_db.intron_db[intron.graph['name']] = intron
-                intron.add_edge(str(curr_exon), str(next_exon))
-                introns.append(intron)
 
-                curr_exon.introns.add(intron.graph['name'])
-                next_exon.introns.add(intron.graph['name'])
-            else:
-                intron_.add_edge(str(curr_exon), str(next_exon))
-                introns.append(intron_)
-                existing_clusters.add(intron_.graph['cluster'])
-
-                curr_exon.introns.add(intron_.graph['name'])
-                next_exon.introns.add(intron_.graph['name'])
-
-    if introns:
-        cluster_no += 1  # create new cluster index
-        if not existing_clusters:
-            cluster = nx.DiGraph()
-            if len(introns) > 1:
-                cluster.add_path([i.graph['name'] for i in introns])
-                for intron in introns:
-                    intron.graph['cluster'] = cluster_no
-            else:
-                cluster.add_node(introns[0].graph['name'])
-                introns[0].graph['cluster'] = cluster_no
+def parse_psl_chunk(lines):
+    '''Returns chromosomes, block counts and flat arrays of exon starts
+    and ends of alignments in PSL format.
+
+    '''
+    import numpy
+
+    rows = []
+    for line in lines:
+        row = line.split()
+        if len(row) != 21 or row[17] == '0':
+            print >> stderr, 'Skipped:', line,
         else:
-            cluster = nx.DiGraph(exons=set())
-            for cl in existing_clusters:
-                cluster.add_edges_from(clusters[cl].edges())
-                clusters.pop(cl)
+            rows.append(row)
+    if not rows:
+        return [], numpy.zeros(0, numpy.int64), None, None
 
-            for intron in cluster.nodes():
-                align_db.intron_db[intron].graph['cluster'] = cluster_no
+    cols = zip(*rows)
+    counts = numpy.array(cols[17]).astype(numpy.int64)
+    sizes = to_array(cols[18])
+    starts = to_array(cols[20])
+    if len(sizes) != counts.sum() or len(starts) != counts.sum():
+        raise ValueError('Block count does not match block sizes or starts.')
 
-            if len(introns) > 1:
-                cluster.add_path([i.graph['name'] for i in introns])
+    return cols[13], counts, starts, starts + sizes
 
-                for intron in introns:
-                    intron.graph['cluster'] = cluster_no
-            else:
-                cluster.add_node(introns[0].graph['name'])
-                introns[0].graph['cluster'] = cluster_no
 
-        clusters[cluster_no] = cluster
+def get_chain_key(group):
+    '''Returns a key of an exon chain from a group of exons.'''
 
-    return cluster_no
+    key = [group[0].chrom]
+    for exon in group:
+        key.append(exon.start)
+        key.append(exon.end)
+    return tuple(key)
 
 
-def collapse_exon(g, align_db):
-    '''Merge overlapped exons together.
+def get_exon_groups(chroms, counts, starts, ends, chain_counts=None,
+                        config=None):
+    '''Yields exon groups of each alignment from flat arrays
+    of exon starts and ends.
 
-    An exon gets extended when they are merged with a larger exon.
+    Gaps no longer than gap_size between exons are filled and
+    exons are split into groups at introns longer than max_intron.
 
-    A smaller exon is then removed from the graph.
+    If chain_counts is given, each exon group (an exon chain) is
+    counted in it and only groups not seen before are yielded.
+    Alignments without new groups are skipped.
+
+    gap_size and max_intron are taken from config (defaults if None).
 
     '''
+    import numpy
 
-    exons = [align_db.exon_db[e] for e in g.nodes()]
-    sorted_exons = sorted(exons, key=lambda x: (x.end, x.start))
-    chromosome = exons[0].chrom
+    if not len(counts):
+        return
+    if config is None:
+        config = Config()
+
+    offsets = numpy.cumsum(counts) - counts
+    first = numpy.zeros(len(starts), dtype=bool)
+    first[offsets] = True  # the first exon of each alignment
+
+    merged = first.copy()  # the first exon of each merged exon
+    merged[1:] |= starts[1:] - ends[:-1] > config.gap_size
+    merged_idx = numpy.flatnonzero(merged)
+    last_idx = numpy.append(merged_idx[1:], len(starts)) - 1
+    starts = starts[merged_idx]
+    ends = ends[last_idx]
+    first = first[merged_idx]
+
+    new_group = first.copy()
+    if config.max_intron >= 0:
+        new_group[1:] |= starts[1:] - ends[:-1] - 2 > config.max_intron
+
+    def get_groups(chrom, chains):
+        groups = []
+        for chain_ in chains:
+            key = tuple([chrom] + chain_)
+            if chain_counts is not None:
+                if key in chain_counts:
+                    chain_counts[key] += 1
+                    continue
+                chain_counts[key] = 1
+            groups.append([ExonObj(chrom, chain_[i], chain_[i + 1])
+                            for i in xrange(0, len(chain_), 2)])
+        return groups
+
+    chroms = iter(chroms)
+    chains = None
+    for start, end, new_alignment, new_group_ in izip(starts.tolist(),
+                                                        ends.tolist(),
+                                                        first.tolist(),
+                                                        new_group.tolist()):
+        if new_alignment:
+            if chains:
+                groups = get_groups(chrom, chains)
+                if groups:
+                    yield groups
+            chrom = next(chroms)
+            chains = []
+        if new_group_:
+            chain_ = []
+            chains.append(chain_)
+        chain_.append(start)
+        chain_.append(end)
+
+    if chains:
+        groups = get_groups(chrom, chains)
+        if groups:
+            yield groups
+
+
+def add_intron(exons, align_db):
+    '''Get introns from a set of exons.
 
-    i = 0
-    curr_exon = sorted_exons[i]
-    while i <= len(sorted_exons):
-        try:
-            next_exon = sorted_exons[i + 1]
-        except IndexError:
-            pass
-        else:
-            if curr_exon.end == next_exon.end:
-                if next_exon.terminal == 1:  # left terminal
-                    g.add_edges_from([(str(curr_exon), n)\
-                            for n in g.successors(str(next_exon))])
-                    g.remove_node(str(next_exon))
-                    if curr_exon.terminal == 2:
-                        curr_exon.terminal = None
-                else:
-                    if (curr_exon.terminal == 1 and
-                            next_exon.start - curr_exon.start <= min_utr):
-                        g.add_edges_from([(str(next_exon), n) for n in
-                                            g.successors(str(curr_exon))])
-                        g.remove_node(str(curr_exon))
-                    curr_exon = next_exon
-            else:
-                curr_exon = next_exon
-        i += 1
-
-    i = 0
-    exons = [align_db.exon_db[e] for e in g.nodes()]
-    sorted_exons = sorted(exons, key=lambda x: (x.start, x.end))
-    curr_exon = sorted_exons[0]
-    while i <= len(sorted_exons):
+    Each intron is stored in the intron database with all pairs of
+    exons it connects. Introns from the same alignment or connected
+    to the same exon are merged into the same component.
+    '''
+
+    intron_db = align_db.intron_db
+    first_intron = None
+
+    for i in range(len(exons)):
+        curr_exon = exons[i]
         try:
-            next_exon = sorted_exons[i + 1]
+            next_exon = exons[i + 1]
         except IndexError:
             pass
         else:
-            if curr_exon.start == next_exon.start:
-                if curr_exon.terminal == 2:
-                    g.add_edges_from([(n, str(next_exon))\
-                            for n in g.predecessors(str(curr_exon))])
-                    g.remove_node(str(curr_exon))
-                    curr_exon = next_exon
-                else:
-                    if next_exon.terminal == 2:
-                        if next_exon.end - curr_exon.end <= min_utr:
-                            g.add_edges_from([(n, str(curr_exon))\
-                                    for n in g.predecessors(str(next_exon))])
-                            g.remove_node(str(next_exon))
-                        else:
-                            curr_exon = next_exon
-                    else:
-                        curr_exon = next_exon
-            else:
-                curr_exon = next_exon
-        i += 1
-    try:
-        '''If there are single exons in this chromosome,
-        remove or extend them according to how they overlap with
-        exons in the cluster.
-
-        '''
-        singles = align_db.single_exons_intervals[chromosome]
-    except KeyError:
-        pass
-    else:
-        for node in g.nodes():
-            exon = align_db.exon_db[node]
-            remove_redundant_exon(exon, singles, set())
+            intron_start = curr_exon.end + 1
+            intron_end = next_exon.start - 1
 
+            curr_exon.next_exons.add(next_exon.id)
 
-def remove_redundant_exon(exon, singles, unmergables):
-    '''Recursively remove exons that are subset of a given exon.'''
+            intron, is_new = intron_db.add(curr_exon.chrom,
+                                            intron_start,
+                                            intron_end)
+            intron_db.add_edge(intron, curr_exon.id, next_exon.id)
 
-    overlaps = [o for o in singles.find(exon.start, exon.end) \
-                                if not o.value['exon'].remove and \
-                                str(o.value['exon']) not in unmergables]
-    if not overlaps:
-        return
-    for o in overlaps:
-        if o.start >= exon.start and o.end <= exon.end:
-            o.value['exon'].remove = True  # mark the exon as removed
-        elif o.start >= exon.start and o.end > exon.end:
-            if o.end - exon.end < min_utr:
-                o.value['exon'].remove = True
-            else:
-                unmergables.add(str(o.value['exon']))
-        elif o.start < exon.start and o.end <= exon.end:
-            if exon.start - o.start < min_utr:
-                o.value['exon'].remove = True
-            else:
-                unmergables.add(str(o.value['exon']))
-        elif o.start < exon.start and o.end > exon.end:
-            if (exon.start - o.start) + (o.end - exon.end) < min_utr:
-                o.value['exon'].remove = True
+            if first_intron is None:
+                first_intron = intron
             else:
-                unmergables.add(str(o.value['exon']))
-        else:
-            unmergables.add(str(o.value['exon']))
+                intron_db.clusters.union(first_intron, intron)
 
-    remove_redundant_exon(exon, singles, unmergables)
+            for exon in (curr_exon, next_exon):
+                if exon.id is not None:
+                    exon = align_db.exon_db[exon.id]  # a stored exon
+                if exon.introns:
+                    intron_db.clusters.union(intron, iter(exon.introns).next())
+                exon.introns.add(intron)
 
 
-def delete_gap(exons, gap_size=0):
-    '''Alignments may contain small gaps from indels and etc.
+def collapse_exon(g, align_db, min_utr=min_utr):
+    '''Merge overlapped exons together.
 
-    The program fills up gaps to obtain a complete exon.
+    An exon gets extended when they are merged with a larger exon.
 
-    A maximum size of a gap can be adjusted by assigning a new
-    value to gap_size parameter on a command line.
+    A smaller exon is then removed from the graph.
+
+    See ExonGraph.collapse() for the rules. Terminal exons are
+    marked by exon objects in align_db.
 
     '''
+    graph = ExonGraph(align_db.exon_db, g.edges())
+    graph.collapse(min_utr)
+    graph.update(g)
 
-    i = 0
-    new_exons = []
-    curr_exon = exons[i]
 
-    while True:
-        try:
-            next_exon = exons[i + 1]
-        except IndexError:
-            break
-        else:
-            if next_exon.start - curr_exon.end <= gap_size:
-                curr_exon.end = next_exon.end
-            else:
-                new_exons.append(curr_exon)
-                curr_exon = next_exon
-        i += 1
+def remove_redundant_exon(exons, singles, min_utr=min_utr):
+    '''Marks single exons that are redundant with exons of
+    multi-exon genes in a chromosome as removed.
 
-    new_exons.append(curr_exon)
-    return new_exons
+    singles are an interval index and removed flags of merged single
+    exons. A single exon is redundant if it overlaps an exon and
+    extends beyond it by less than min_utr bases in total
+    (or not at all). All exons are queried in a single batch.
+
+    '''
+    import numpy
+
+    index, removed = singles
+    starts = numpy.array([exon.start for exon in exons], dtype=numpy.int64)
+    ends = numpy.array([exon.end for exon in exons], dtype=numpy.int64)
+    queries, hits = index.find_all(starts, ends)
+
+    overhangs = (numpy.maximum(starts[queries] - index.starts[hits], 0) +
+                numpy.maximum(index.ends[hits] - ends[queries], 0))
+    removed[hits[(overhangs == 0) | (overhangs < min_utr)]] = True
 
 
 def add_exon(align_db, exons):
@@ -387,130 +759,138 @@ def add_exon(align_db, exons):
     exons[-1].terminal = 2  # right end
 
     for exon in exons:
-        try:
-            exon_ = align_db.exon_db[str(exon)]
-        except KeyError:
-            align_db.exon_db[str(exon)] = exon
-        else:
+        exon_id, is_new = align_db.intern_exon(exon)
+        if not is_new:
+            exon_ = align_db.exon_db[exon_id]
             if ((exon.terminal and exon_.terminal) and
                         exon.terminal != exon_.terminal):
                 exon.terminal = None
 
             if not exon.terminal and exon_.terminal:
                 exon_.terminal = None
+                align_db.intron_db.changed.update(exon_.introns)
 
 
-def merge_cluster(align_db):
-    '''Connect introns from the same gene together.'''
-
-    big_cluster = nx.Graph()
-    paths = []
-    for exon in align_db.exon_db.itervalues():
-        pth = []
-        for intron in exon.introns:
-            cluster = align_db.intron_db[intron].graph['cluster']
-            pth.append(cluster)
-            # exon.clusters.add(cluster)
-        paths.append(pth)
-
-    for pth in paths:
-        if len(pth) > 2:
-            big_cluster.add_path(pth)
-        elif len(pth) == 2:
-            big_cluster.add_edges_from([pth])
-        elif len(pth) == 1:
-            big_cluster.add_nodes_from(pth)
-        else:
-            pass
+def count_paths(g, source='Start', target='End', limit=None):
+    '''Returns the number of paths from source to target in
+    a directed acyclic graph.
+
+    Paths are counted in topological order without enumerating them.
+    If limit is given, counting stops at limit + 1.
 
-    return big_cluster
-
-
-def print_bed(align_db, transcript, strand, gene_id, tran_id):
-    '''Print a splice graph in BED format.'''
-
-    exons = [align_db.exon_db[e] for e in transcript]
-
-    chrom_start = exons[0].start
-    chrom_end = exons[-1].end
-    chrom = exons[0].chrom
-
-    block_starts = ','.join([str(exon.start - chrom_start) for exon in exons])
-    block_sizes = ','.join([str(exon.end - exon.start) for exon in exons])
-
-    name = '%s:%d.%d' % (chrom, gene_id, tran_id)
-    score = 1000
-    item_RGB = '0,0,0'
-    thick_start = chrom_start
-    thick_end = chrom_end
-    block_count = len(exons)
-
-    writer = csv.writer(stdout, dialect='excel-tab')
-    writer.writerow((chrom,
-                    chrom_start,
-                    chrom_end,
-                    name,
-                    score,
-                    strand,
-                    thick_start,
-                    thick_end,
-                    item_RGB,
-                    block_count,
-                    block_sizes,
-                    block_starts))
-
-
-def print_bed_single(exon, gene_id, tran_id):
-    '''Print a splice graph in BED format.'''
-
-    chrom_start = exon.start
-    chrom_end = exon.end
-    chrom = exon.chrom
-
-    block_starts = ','.join([str(exon.start - chrom_start)])
-    block_sizes = ','.join([str(exon.end - exon.start)])
-
-    name = '%s:%d.%d' % (chrom, gene_id, tran_id)
-    score = 1000
-    item_RGB = '0,0,0'
-    thick_start = chrom_start
-    thick_end = chrom_end
-    strand = '+'
-    block_count = 1
-
-    writer = csv.writer(stdout, dialect='excel-tab')
-    writer.writerow((chrom,
-                    chrom_start,
-                    chrom_end,
-                    name,
-                    score,
-                    strand,
-                    thick_start,
-                    thick_end,
-                    item_RGB,
-                    block_count,
-                    block_sizes,
-                    block_starts))
-
-
-def build_gene_model(genome,
+    '''
+    import networkx as nx
+
+    paths = dict.fromkeys(g.nodes(), 0)
+    paths[source] = 1
+    for node in nx.topological_sort(g):
+        n = paths[node]
+        if not n:
+            continue
+        for succ in g.successors_iter(node):
+            paths[succ] += n
+            if limit is not None and paths[succ] > limit:
+                paths[succ] = limit + 1
+
+    return paths[target]
+
+
+def get_paths(g, config, key=None):
+    '''Returns transcripts of a gene graph and a reason why
+    the gene exceeds its complexity budget (None if it does not).
+
+    Parameters below are taken from config.
+    All paths are reported with find_max or if there are at most
+    max_isoforms paths; otherwise minimal paths are reported.
+    A gene with more than max_gene_edges edges gets greedy paths,
+    a gene with more than max_paths paths gets minimal paths
+    instead of all paths, and a search longer than max_gene_seconds
+    falls back to minimal paths (with another max_gene_seconds)
+    or greedy paths. Budgets of zero are not checked.
+
+    Minimal and greedy paths are searched with nodes ordered by key
+    (see get_min_isoforms.sort_nodes()), so they do not depend on
+    the order in which exons were read.
+
+    '''
+    import networkx as nx
+
+    max_gene_seconds = config.max_gene_seconds
+    if (config.max_gene_edges and
+            g.number_of_edges() > config.max_gene_edges):
+        with profiler.stage('gene_models/get_greedy_paths'):
+            return get_min_isoforms.get_greedy_paths(g, key=key), 'edges'
+
+    reason = None
+    if config.find_max:
+        limit = config.max_paths or None
+    else:
+        limit = config.max_isoforms
+
+    if limit is None or count_paths(g, limit=limit) <= limit:
+        if max_gene_seconds:
+            deadline = time.time() + max_gene_seconds
+        with profiler.stage('gene_models/all_simple_paths'):
+            transcripts = []
+            for path in nx.all_simple_paths(g, 'Start', 'End'):
+                transcripts.append(path[1:-1])
+                if max_gene_seconds and time.time() > deadline:
+                    reason = 'time'
+                    break
+            else:
+                return transcripts, None
+    elif config.find_max:
+        reason = 'paths'
+
+    deadline = None
+    if max_gene_seconds:
+        deadline = time.time() + max_gene_seconds
+    with profiler.stage('gene_models/get_min_paths'):
+        stats = {}
+        transcripts = get_min_isoforms.get_min_paths(g, False, stats,
+                                                        deadline, key)
+        profiler.count('max_matching_rounds', stats['rounds'])
+    if stats.get('timeout'):
+        reason = 'time'
+
+    return transcripts, reason
+
+
+def build_gene_model(splice_sites,
                         align_db,
-                        clusters,
-                        big_cluster,
-                        find_max,
-                        min_transcript_len=0,
-                        max_isoforms=1e6,
+                        config,
+                        add_transcript,
+                        verbose=True,
+                        gene_id=0,
+                        models=None,
                     ):
 
-    '''Build and print out gene models.'''
+    '''Build gene models and pass each transcript to add_transcript
+    as a Transcript.
+
+    Gene IDs are numbered from gene_id + 1.
+
+    If models is given, it maps the smallest intron ID of each component
+    to gene models built in an earlier run. Models of components without
+    changed introns are printed again without rebuilding them and
+    models is updated with models of all components. Models keep
+    transcripts before duplicated two-exon transcripts are removed,
+    which is done for reused and rebuilt models alike.
+
+    '''
 
-    visited_clusters = set()
     transcripts_num = 0
-    gene_id = 0
     excluded = 0
     two_exon_trns = set()
+    reused = 0
+    multi_exons = {}  # chromosome -> exons of multi-exon genes
+    if models is None:
+        old_models = {}
+    else:
+        old_models = models.copy()
+        models.clear()
 
-    def check_criteria(transcript, two_exon_trns):
+    def check_criteria(transcript):
         '''Return True or False whether a transcript pass or
         fail the criteria.
 
@@ -518,160 +898,177 @@ def build_gene_model(genome,
         transcript_length = sum([align_db.exon_db[e].get_size() \
                                                 for e in transcript])
 
-        if transcript_length <= min_transcript_len:
-            return False  # fail
-        else:
-            if len(transcript) == 2:
-                trns = ','.join(transcript)
-                if trns in two_exon_trns:
-                    return False  # fail
-                else:
-                    two_exon_trns.add(trns)
-                    return True  # pass
-            else:
+        return transcript_length > config.min_transcript_len
+
+    def is_duplicate(transcript, two_exon_trns):
+        '''Return True if a two-exon transcript was reported before.'''
+
+        if len(transcript) == 2:
+            trns = tuple(transcript)
+            if trns in two_exon_trns:
                 return True
+            two_exon_trns.add(trns)
+        return False
 
-    def exon_to_exonobj(exon):
-        '''Returns an exon objects from a given exon coordinate.'''
-        chrom, coord = exon.split(':')
-        start, end = coord.split('-')
-        return ExonObj(chrom, int(start), int(end))
-
-    for cl_num, cl in enumerate(big_cluster.nodes(), start=1):
-        if cl not in visited_clusters:
-            g = nx.DiGraph()
-            for intron in clusters[cl].nodes():
-                g.add_edges_from(align_db.intron_db[intron].edges())
-
-            visited_clusters.add(cl)
-
-            for neighbor in nx.dfs_tree(big_cluster, cl):
-                neighbor_cluster = clusters[neighbor]
-                for intron in neighbor_cluster.nodes():
-                    g.add_edges_from(align_db.intron_db[intron].edges())
-
-                visited_clusters.add(neighbor)
-            # # nx.draw_spring(nx.algorithms.dfs_tree(g))
-            # nx.draw_spring(g)
-            # plt.show()
-            # for node in g.nodes():
-            #     print node, g[node]
-            # raise SystemExit
-            collapse_exon(g, align_db)
-            for g in split_strand.split(g, genome):
-                if g.nodes():
-                    subalign_db = AlignmentDB()
-                    for edge in g.edges():
-                        exon1 = exon_to_exonobj(edge[0])
-                        exon2 = exon_to_exonobj(edge[1])
-                        add_exon(subalign_db, [exon1, exon2])
-                    collapse_exon(g, subalign_db)
-
-                    trans_id = 0
-                    gene_id += 1
-                    strand = g.graph['strand']
-                    for node in g.nodes():
-                        if not g.predecessors(node):
-                            g.add_edge('Start', node)
-                        if not g.successors(node):
-                            g.add_edge(node, 'End')
-
-                    max_paths = [path for path in \
-                                    nx.all_simple_paths(g, 'Start', 'End')]
-
-                    if find_max:
-                        '''Report all maximum isoforms.'''
-
-                        for transcript in max_paths:
-                            transcript = transcript[1:-1]
-                            if check_criteria(transcript, two_exon_trns):
-                                transcripts_num += 1
-                                trans_id += 1
-                                print_bed(align_db,
-                                            transcript,
-                                            strand,
-                                            gene_id,
-                                            trans_id)
-                            else:
-                                excluded += 1
+    def exon_position(exon_id):
+        exon = align_db.exon_db[exon_id]
+        return exon.start, exon.end
+
+    def build_component(component):
+        '''Returns nodes after exons are collapsed, strands,
+        transcripts and reasons of fallbacks (see get_paths())
+        of each gene and the number of excluded transcripts
+        in a component.
+
+        '''
+        graph = ExonGraph(align_db.exon_db, chain.from_iterable(
+                            align_db.intron_db.edges[i] for i in component))
+        with profiler.stage('gene_models/collapse_exon'):
+            graph.collapse(config.min_utr)
+        nodes = graph.nodes()
+        genes = []
+        excluded = 0
+        with profiler.stage('gene_models/split_strand'):
+            strand_graphs = split_strand.split(graph, splice_sites,
+                                                align_db.exon_db)
+        for g in strand_graphs:
+            if g.nodes():
+                with profiler.stage('gene_models/collapse_exon'):
+                    subgraph = graph.subgraph(g.edges())
+                    subgraph.collapse(config.min_utr)
+                    subgraph.update(g)
+
+                for node in g.nodes():
+                    if not g.predecessors(node):
+                        g.add_edge('Start', node)
+                    if not g.successors(node):
+                        g.add_edge(node, 'End')
+
+                transcripts, reason = get_paths(g, config, exon_position)
+
+                passed = []
+                for transcript in transcripts:
+                    if check_criteria(transcript):
+                        passed.append(transcript)
+                    else:
+                        excluded += 1
+                profiler.count('paths', len(transcripts))
+                genes.append((g.graph['strand'], passed, reason))
+
+        return nodes, genes, excluded
+
+    changed = align_db.intron_db.changed
+    components = align_db.intron_db.get_components()
+    profiler.count('components', len(components))
+    for component in components:
+        key = component[0]
+        model = old_models.get(key)
+        start_time = time.time()
+        if (model and model[0] == len(component) and
+                not any(intron in changed for intron in component)):
+            nodes, genes, excluded_ = model[1:]
+            reused += 1
+        else:
+            nodes, genes, excluded_ = build_component(component)
+            if profiler.enabled:
+                intron_db = align_db.intron_db
+                profiler.add_locus(time.time() - start_time,
+                    chrom=intron_db.chrom_names[intron_db.chrom[key]],
+                    start=min(intron_db.start[i] for i in component),
+                    end=max(intron_db.end[i] for i in component),
+                    introns=len(component),
+                    exons=len(set(chain.from_iterable(chain.from_iterable(
+                                    intron_db.edges[i] for i in component)))),
+                    edges=sum(len(intron_db.edges[i]) for i in component),
+                    genes=len(genes),
+                    transcripts=sum(len(t) for strand, t, reason in genes))
+
+        if models is not None:
+            models[key] = (len(component), nodes, genes, excluded_)
+        chrom = align_db.exon_db[nodes[0]].chrom
+        multi_exons.setdefault(chrom, []).extend(nodes)
+
+        excluded += excluded_
+        profiler.count('multi_exon_genes', len(genes))
+        with profiler.stage('gene_models/output'):
+            for strand, transcripts, reason in genes:
+                gene_id += 1
+                passed = []
+                for transcript in transcripts:
+                    if is_duplicate(transcript, two_exon_trns):
+                        excluded += 1
                     else:
-                        '''Report minimal isoforms if maximum isoforms exceeds
-                        max_isoforms.
-
-                        '''
-                        if len(max_paths) > max_isoforms:
-                            for transcript in \
-                                    get_min_isoforms.get_min_paths(g, False):
-                                if check_criteria(transcript, two_exon_trns):
-                                    transcripts_num += 1
-                                    trans_id += 1
-                                    print_bed(align_db,
-                                                transcript,
-                                                strand,
-                                                gene_id,
-                                                trans_id)
-                                else:
-                                    excluded += 1
-                        else:
-                            for transcript in max_paths:
-                                transcript = transcript[1:-1]
-                                if check_criteria(transcript, two_exon_trns):
-                                    transcripts_num += 1
-                                    trans_id += 1
-                                    print_bed(align_db,
-                                                transcript,
-                                                strand,
-                                                gene_id,
-                                                trans_id)
-                                else:
-                                    excluded += 1
-
-        print >> stderr, '\r  |--Multi-exon\t\t%d genes, %d isoforms ' % \
-                                            (gene_id, transcripts_num),
+                        passed.append(transcript)
+                if reason and passed:
+                    profiler.count('fallback_genes')
+                for trans_id, transcript in enumerate(passed, start=1):
+                    transcripts_num += 1
+                    exons = [align_db.exon_db[e] for e in transcript]
+                    add_transcript(Transcript(chrom, strand, gene_id,
+                                    trans_id,
+                                    array('l', [e.start for e in exons]),
+                                    array('l', [e.end for e in exons]),
+                                    reason))
+
+        if verbose:
+            print >> stderr, '\r  |--Multi-exon\t\t%d genes, %d isoforms ' % \
+                                                (gene_id, transcripts_num),
+
+    if verbose and models is not None:
+        print >> stderr, '\n  |--Reused\t\t%d components' % reused,
+    profiler.count('reused_components', reused)
+
+    '''Remove single exons redundant with exons of multi-exon genes.'''
+    with profiler.stage('gene_models/remove_redundant_exon'):
+        singles = align_db.single_exons_intervals
+        for chrom, nodes in multi_exons.iteritems():
+            if chrom in singles:
+                remove_redundant_exon([align_db.exon_db[node]
+                                            for node in nodes],
+                                        singles[chrom], config.min_utr)
 
     return gene_id, transcripts_num, excluded
 
 
 def merge_exon(align_db):
-    '''Return merged exons from exons overlapped to each other.'''
-
-    exons = {}
-    for chrom in align_db.single_exons_db:
-        exons[chrom] = []
-        for exn in align_db.single_exons_db[chrom]:
-            if not exn.remove:
-                exons[chrom].append(exn)
-        exons[chrom] = sorted(exons[chrom], key=lambda x: x.start)
-
-    new_exons = {}
-
-    for chrom in exons:
-        i = 0
-        new_exons[chrom] = []
-        curr_exon = exons[chrom][i]
-        while i < len(exons[chrom]):
-            try:
-                next_exon = exons[chrom][i + 1]
-            except IndexError:
-                new_exons[chrom].append(curr_exon)
-                break
-            else:
-                if next_exon.start <= curr_exon.end:
-                    if next_exon.end > curr_exon.end:
-                        next_exon.start = curr_exon.start
-                        curr_exon = next_exon
-                else:
-                    new_exons[chrom].append(curr_exon)
-                    curr_exon = next_exon
-            i += 1
+    '''Returns starts and ends of merged single exons of
+    each chromosome sorted by start.
+
+    Exons are sorted by start and an exon starting at or before
+    the running maximum end of preceding exons is merged with them,
+    so a merged exon begins where a start exceeds that maximum.
+
+    '''
+    import numpy
 
-    return new_exons
+    merged = {}
+    for chrom, (starts, ends) in align_db.single_exons_db.iteritems():
+        if not starts:
+            continue
+        starts = numpy.frombuffer(starts, dtype=starts.typecode)
+        ends = numpy.frombuffer(ends, dtype=ends.typecode)
+        order = numpy.argsort(starts, kind='mergesort')
+        starts = starts[order]
+        max_ends = numpy.maximum.accumulate(ends[order])
+
+        first = numpy.ones(len(starts), dtype=bool)
+        first[1:] = starts[1:] > max_ends[:-1]
+        last = numpy.append(first[1:], True)
+        merged[chrom] = (starts[first], max_ends[last])
+
+    return merged
 
 
 def detect_format(input_file):
     '''Returns a file format detected from input file.'''
 
-    fp = open(input_file)
+    from utils import bam_reader
+
+    input_format = bam_reader.detect_format(input_file)
+    if input_format:
+        return input_format
+
+    fp = input_reader.open_input(input_file)
     cols = fp.readline().split()
     fp.close()
 
@@ -685,94 +1082,973 @@ def detect_format(input_file):
         return None
 
 
-def main(input_files):
-    print >> stderr, 'Gimme : Alignment-based assembler'
-    print >> stderr, 'Version : %s' % (VERSION)
-    print >> stderr, 'Source code : https://github.com/ged-lab/gimme.git\n'
-    print >> stderr, 'Building a sequence DB...'
-    genome = seqdb.SequenceFileDB(args.reference)
+def add_alignment(align_db, groups):
+    '''Adds exon groups from an alignment to the database.
 
-    if args.debug:
-        print >> stderr, 'DEBBUG MODE\t' + \
-                'Use this mode for debugging only!\n'
+    A group with more than one exon is added to exon and
+    intron databases, a lone exon is added to a single exon database.
 
-    print >> stderr, '[Run...]'
+    '''
+    for group in groups:
+        add_exon_group(align_db, group)
 
-    cluster_no = 0
-    clusters = {}
-    align_db = AlignmentDB()
 
-    '''======Detect input format======'''
-    for input_file in input_files:
-        input_format = detect_format(input_file)
-        if input_format == 'PSL':
-            parse = parse_psl
-        elif input_format == 'BED':
-            parse = parse_bed
-        else:
-            print >> stderr, 'ERROR: Unrecognized input format. ' + \
-                    'Use utils/gff2bed.py to convert GFF to BED.'
-            raise SystemExit
+def add_exon_group(align_db, group):
+    '''Adds a group of exons to the database.'''
 
-        '''====Parse alignments and build exon objects===='''
-        print >> stderr, 'Input\t\t\t%s' % input_file
-        for n, exons in enumerate(parse(open(input_file)), start=1):
-            for group in remove_large_intron(exons, max_intron):
-                if len(group) > 1:
-                    add_exon(align_db, group)  # add exons to exon db
-                    cluster_no = add_intron(group, align_db,
-                                                clusters, cluster_no)
-                else:
-                    exon = group[0]  # add a lone exon to single exon db
-                    if exon.chrom not in align_db.single_exons_db:
-                        align_db.single_exons_db[exon.chrom] = [exon]
-                    else:
-                        align_db.single_exons_db[exon.chrom].append(exon)
+    if align_db.chain_log is not None:
+        align_db.chain_log.append(get_chain_key(group))
+    if len(group) > 1:
+        add_exon(align_db, group)  # add exons to exon db
+        add_intron(group, align_db)
+    else:
+        exon = group[0]  # add a lone exon to single exon db
+        align_db.add_single_exon(exon.chrom, exon.start, exon.end)
 
-            if n % 100 == 0:
-                print >> stderr, '\r  |--Parsing\t\t%d alignments' % n,
-        print >> stderr, '\r  |--Parsing\t\t%d alignments' % n
 
-    '''====Merge overlapped single exons===='''
-    merged_single_exons = merge_exon(align_db)
+def fetch_splice_sites(splice_sites, intron_db):
+    '''Looks up splice sites of all introns, one chromosome at a time.'''
+
+    junctions = {}
+    for intron in xrange(len(intron_db)):
+        chrom = intron_db.chrom_names[intron_db.chrom[intron]]
+        junction = (intron_db.start[intron] - 1, intron_db.end[intron] + 1)
+        try:
+            junctions[chrom].append(junction)
+        except KeyError:
+            junctions[chrom] = [junction]
+
+    for chrom in sorted(junctions):
+        splice_sites.fetch(chrom, junctions[chrom])
+
+
+def assemble_db(splice_sites, align_db, config, add_transcript,
+                verbose=True, gene_id=0, models=None):
+    '''Builds multi-exon and single-exon gene models from
+    alignments in the database and passes each transcript
+    to add_transcript as a Transcript.
+
+    Returns the last gene ID and numbers of transcripts,
+    single-exon genes and transcripts that do not pass the criteria.
+    See build_gene_model() for models.
+
+    '''
+    import numpy
+    import networkx  # imported before gene loci are timed
+    from utils.interval_index import IntervalIndex
 
-    '''====Build intervals from single exons.===='''
-    for chrom in merged_single_exons:
-        align_db.single_exons_intervals[chrom] = IntervalTree()
-        for exon in merged_single_exons[chrom]:
-            interval = Interval(exon.start, exon.end, value={'exon': exon})
-            align_db.single_exons_intervals[chrom].insert_interval(interval)
+    profiler.count('exons', len(align_db.exon_db))
+    profiler.count('introns', len(align_db.intron_db))
 
-    '''====Connect introns from the same gene to each other===='''
-    big_cluster = merge_cluster(align_db)
+    '''====Merge overlapped single exons===='''
+    with profiler.stage('single_exons'):
+        merged_single_exons = merge_exon(align_db)
+        for chrom, (starts, ends) in merged_single_exons.iteritems():
+            align_db.single_exons_intervals[chrom] = (
+                                        IntervalIndex(starts, ends),
+                                        numpy.zeros(len(starts), dtype=bool))
 
     '''====Build gene models===='''
-    print >> stderr, 'Constructing'
-    return_items = build_gene_model(genome,
-                                        align_db,
-                                        clusters,
-                                        big_cluster,
-                                        args.max,
-                                        min_transcript_len,
-                                        max_isoforms,
-                                    )
+    with profiler.stage('splice_sites'):
+        fetch_splice_sites(splice_sites, align_db.intron_db)
+    with profiler.stage('gene_models'):
+        return_items = build_gene_model(splice_sites,
+                                            align_db,
+                                            config,
+                                            add_transcript,
+                                            verbose,
+                                            gene_id,
+                                            models,
+                                        )
 
-    print >> stderr, ''
+    if verbose:
+        print >> stderr, ''
     gene_id, transcripts_num, excluded = return_items
 
     single_exon_gene_num = 0
-    for chrom in merged_single_exons:
-        for exon in merged_single_exons[chrom]:
-            if (exon.get_size() > min_single_exon_len
-                                    and not exon.remove):
+    with profiler.stage('single_exons'):
+        for chrom in merged_single_exons:
+            index, removed = align_db.single_exons_intervals[chrom]
+            starts, ends = index.starts, index.ends
+            passed = ((ends - starts + 1 > config.min_single_exon_len) &
+                        ~removed)
+            excluded += len(passed) - int(passed.sum())
+            for start, end in izip(starts[passed].tolist(),
+                                    ends[passed].tolist()):
                 gene_id += 1
                 transcripts_num += 1
                 single_exon_gene_num += 1
-                print_bed_single(exon, gene_id, 1)
-                print >> stderr, '\r  |--Single-exon\t%d genes' % \
+                add_transcript(Transcript(chrom, '+', gene_id, 1,
+                                            array('l', [start]),
+                                            array('l', [end]), None))
+                if verbose:
+                    print >> stderr, '\r  |--Single-exon\t%d genes' % \
                                                     single_exon_gene_num,
+
+    profiler.count('single_exon_genes', single_exon_gene_num)
+    profiler.count('transcripts', transcripts_num)
+    profiler.count('excluded_transcripts', excluded)
+    return gene_id, transcripts_num, single_exon_gene_num, excluded
+
+
+def get_parser(input_format):
+    '''Returns a chunk parse function for a given input format.'''
+
+    if input_format == 'PSL':
+        return parse_psl_chunk
+    elif input_format == 'BED':
+        return parse_bed_chunk
+    else:
+        print >> stderr, 'ERROR: Unrecognized input format. ' + \
+                'Use utils/gff2bed.py to convert GFF to BED.'
+        raise SystemExit
+
+
+def read_blocks(input_file, cache=False, verbose=True):
+    '''Yields chunks of raw alignment blocks from an input file.
+
+    Each chunk is a tuple of chromosomes, block counts, block starts
+    and block ends. If cache is True, chunks are read from a binary
+    cache next to the input file, or the cache is written while
+    the input file is parsed. Compressed files are decompressed
+    on a background thread (see utils/input_reader.py).
+
+    '''
+    from utils import alignment_cache
+
+    cache_path = input_file + alignment_cache.EXTENSION
+    writer = None
+    fp = None
+    if cache and alignment_cache.is_valid(input_file, cache_path):
+        if verbose:
+            print >> stderr, '  |--Cache\t\t%s' % cache_path
+        chunks = alignment_cache.read(cache_path)
+    else:
+        input_format = detect_format(input_file)
+        if input_format in ('BAM', 'CRAM'):
+            from utils import bam_reader
+            chunks = bam_reader.read_chunks(input_file)
+        else:
+            parse_chunk = get_parser(input_format)
+            fp = input_reader.open_input(input_file)
+            chunks = (parse_chunk(lines) for lines in read_chunks(fp))
+        if cache:
+            writer = alignment_cache.Writer(input_file, cache_path)
+
+    try:
+        while True:
+            with profiler.stage('parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            profiler.count('alignments', len(chunk[1]))
+            if writer:
+                writer.write(*chunk)
+            yield chunk
+    except:
+        if writer:
+            writer.discard()
+        raise
+    finally:
+        if fp:
+            fp.close()
+
+    if writer:
+        writer.close()
+
+
+def read_alignments(input_file, cache=False, chain_counts=None,
+                    config=None):
+    '''Yields exon groups of each alignment in an input file.
+
+    See get_exon_groups() for chain_counts and config.
+
+    '''
+    for chunk in read_blocks(input_file, cache):
+        for groups in get_exon_groups(*chunk, chain_counts=chain_counts,
+                                        config=config):
+            yield groups
+
+
+def report_chains(unique, total):
+    '''Prints numbers of unique and all exon chains to standard error.'''
+
+    profiler.count('exon_chains', unique)
+    duplicates = 100.0 * (total - unique) / max(total, 1)
+    print >> stderr, '  |--Exon chains\t\t%d unique of %d ' \
+                        '(%.1f%% duplicates)' % (unique, total, duplicates)
+
+
+def partition_file(input_file, cache=False):
+    '''Returns alignments of an input file grouped by chromosome
+    (see partition_alignments()) and the number of alignments,
+    which is None if alignments are fetched by read_partition().
+
+    '''
+    import numpy
+    from utils import bam_reader
+
+    partitions = {}
+    if not cache and detect_format(input_file) in ('BAM', 'CRAM'):
+        regions = bam_reader.get_regions(input_file)
+        if regions is not None:
+            for chrom in regions:
+                partitions[chrom] = [input_file]
+            return partitions, None
+
+    n = 0
+    for chroms, counts, starts, ends in read_blocks(input_file, cache,
+                                                    verbose=False):
+        if not len(counts):
+            continue
+        names, chrom_ids = numpy.unique(chroms, return_inverse=True)
+        alignment_nums = numpy.bincount(chrom_ids)
+        block_nums = numpy.bincount(chrom_ids,
+                                    weights=counts).astype(numpy.int64)
+
+        '''Stable sorts keep the input order in each chromosome.'''
+        order = numpy.argsort(chrom_ids, kind='mergesort')
+        block_order = numpy.argsort(numpy.repeat(chrom_ids, counts),
+                                    kind='mergesort')
+        counts = counts[order]
+        starts = starts[block_order]
+        ends = ends[block_order]
+        i = j = 0
+        for chrom, alignment_num, block_num in izip(names.tolist(),
+                                                alignment_nums.tolist(),
+                                                block_nums.tolist()):
+            partitions.setdefault(chrom, []).append(
+                                (counts[i:i + alignment_num],
+                                starts[j:j + block_num],
+                                ends[j:j + block_num]))
+            i += alignment_num
+            j += block_num
+        n += len(counts)
+
+    return partitions, n
+
+
+def partition_input_file(job):
+    '''Calls partition_file() in a worker process.'''
+
+    return partition_file(*job)
+
+
+def partition_alignments(input_files, cache=False, verbose=True,
+                            pool=None):
+    '''Returns alignments from all input files grouped by chromosome.
+
+    Each chromosome maps to a list of chunks of block counts,
+    block starts and block ends in the order of input.
+    Alignments in indexed BAM/CRAM files are not read unless
+    cache is True; the path of the file is added to the list of each
+    chromosome in its index instead, and alignments are fetched
+    by read_partition().
+
+    If a multiprocessing pool is given, input files are partitioned
+    concurrently by its workers and merged in the order of input.
+
+    '''
+    jobs = [(input_file, cache) for input_file in input_files]
+    if pool and len(jobs) > 1:
+        results = pool.imap(partition_input_file, jobs)
+    else:
+        results = (partition_file(*job) for job in jobs)
+
+    partitions = {}
+    for input_file, (file_partitions, n) in izip(input_files, results):
+        for chrom, chunks in file_partitions.iteritems():
+            partitions.setdefault(chrom, []).extend(chunks)
+        if verbose:
+            print >> stderr, 'Input\t\t\t%s' % input_file
+            if n is None:
+                print >> stderr, '  |--Regions\t\t%d references' % \
+                                                    len(file_partitions)
+            else:
+                print >> stderr, '  |--Reading\t\t%d alignments' % n
+
+    return partitions
+
+
+_worker_splice_sites = None
+
+
+def init_worker(reference, cache_path):
+    '''Opens the packed genome in each worker process.'''
+
+    from utils import packed_genome
+
+    global _worker_splice_sites
+    profiler.reset()  # drop records copied from the main process
+    genome = packed_genome.open_genome(reference, verbose=False)
+    _worker_splice_sites = split_strand.SpliceSiteCache(genome,
+                                                        cache_path,
+                                                        reference)
+
+
+def read_partition(chrom, chunks):
+    '''Yields block counts, block starts and block ends of chunks
+    of a chromosome from partition_alignments(). Alignments in
+    the chromosome are fetched from indexed BAM/CRAM files.
+
+    '''
+    for chunk in chunks:
+        if isinstance(chunk, basestring):
+            from utils import bam_reader
+            for chroms, counts, starts, ends in bam_reader.read_chunks(
+                                                                chunk, chrom):
+                profiler.count('alignments', len(counts))
+                yield counts, starts, ends
+        else:
+            yield chunk
+
+
+def assemble_partition(splice_sites, chrom, chunks, config,
+                        add_transcript):
+    '''Builds gene models from alignments of a single chromosome
+    grouped by partition_alignments().
+
+    Returns the alignment database and numbers reported
+    by assemble_db().
+
+    '''
+    align_db = AlignmentDB()
+
+    with profiler.stage('add_alignments'):
+        for counts, starts, ends in read_partition(chrom, chunks):
+            for groups in get_exon_groups(repeat(chrom), counts, starts,
+                                            ends, align_db.chain_counts,
+                                            config):
+                add_alignment(align_db, groups)
+
+    counts = assemble_db(splice_sites, align_db, config, add_transcript,
+                            verbose=False)
+    return align_db, counts
+
+
+def assemble_chromosome(job):
+    '''Builds gene models from alignments of a single chromosome.
+
+    Returns a chromosome name, gene models in BED format,
+    numbers reported by assemble_db(), new splice junctions,
+    numbers of unique and all exon chains, a profile report
+    if profiling is enabled and genes exceeding a budget.
+
+    '''
+    chrom, chunks, config = job
+    writer = BedWriter(StringIO())
+    align_db, counts = assemble_partition(_worker_splice_sites, chrom,
+                                            chunks, config, writer.add)
+
+    junctions = _worker_splice_sites.updated
+    _worker_splice_sites.updated = {}
+    chains = (len(align_db.chain_counts),
+                sum(align_db.chain_counts.itervalues()))
+    report = None
+    if profiler.enabled:
+        report = profiler.get_report()
+        profiler.reset()
+    return (chrom, writer.output.getvalue(), counts, junctions, chains,
+            report, writer.fallbacks)
+
+
+def run_parallel(input_files, splice_sites, reference, threads, config,
+                    writer, cache=False):
+    '''Assembles each chromosome in a separate worker process.
+
+    Each worker opens the genome at reference. Gene models are
+    written in sorted order of chromosomes. Gene IDs are numbered
+    per chromosome.
+
+    '''
+    import multiprocessing
+
+    gene_id = transcripts_num = single_exon_gene_num = excluded = 0
+    unique_chains = total_chains = 0
+    pool = multiprocessing.Pool(threads, init_worker,
+                                (reference, splice_sites.path))
+    try:
+        partitions = partition_alignments(input_files, cache, pool=pool)
+        jobs = [(chrom, partitions[chrom], config)
+                    for chrom in sorted(partitions)]
+
+        print >> stderr, 'Constructing'
+        for n, result in enumerate(pool.imap(assemble_chromosome, jobs),
+                                        start=1):
+            chrom, bed, counts, junctions, chains, report, fallbacks = result
+            if report:
+                profiler.merge(report)
+            writer.fallbacks.extend(fallbacks)
+            writer.output.write(bed)
+            unique_chains += chains[0]
+            total_chains += chains[1]
+            splice_sites.update(junctions)
+            gene_id += counts[0]
+            transcripts_num += counts[1]
+            single_exon_gene_num += counts[2]
+            excluded += counts[3]
+            print >> stderr, \
+                '\r  |--Chromosomes\t%d/%d, %d genes, %d isoforms ' % \
+                    (n, len(jobs), gene_id, transcripts_num),
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    print >> stderr, ''
+    report_chains(unique_chains, total_chains)
+
+    return gene_id, transcripts_num, single_exon_gene_num, excluded
+
+
+def get_chromosomes(input_file):
+    '''Returns chromosomes of an input file in order of
+    their first alignments or, for BAM and CRAM, in order of
+    references in the header.
+
+    '''
+    from utils import bam_reader
+
+    input_format = detect_format(input_file)
+    if input_format in ('BAM', 'CRAM'):
+        return bam_reader.get_references(input_file)
+    if input_format == 'PSL':
+        chrom_col, start_col = 13, 15
+    else:
+        chrom_col, start_col = 0, 1
+
+    chroms = []
+    seen = set()
+    fp = input_reader.open_input(input_file)
+    try:
+        for line in fp:
+            cols = line.split(None, start_col + 1)
+            if len(cols) > start_col + 1 and cols[start_col].isdigit():
+                chrom = cols[chrom_col]
+                if chrom not in seen:
+                    seen.add(chrom)
+                    chroms.append(chrom)
+    finally:
+        fp.close()
+    return chroms
+
+
+def get_chromosome_order(orders):
+    '''Returns a rank of each chromosome in an order following all
+    orders of chromosomes, e.g. of sorted input files. Chromosomes
+    not ordered by any of them are ranked by their first appearance.
+    Raises ValueError if the orders conflict.
+
+    '''
+    first = {}
+    succs = {}
+    indegree = {}
+    for order in orders:
+        for i, chrom in enumerate(order):
+            if chrom not in first:
+                first[chrom] = len(first)
+                succs[chrom] = set()
+                indegree[chrom] = 0
+            if i and chrom not in succs[order[i - 1]]:
+                succs[order[i - 1]].add(chrom)
+                indegree[chrom] += 1
+
+    heap = [(first[chrom], chrom) for chrom in first if not indegree[chrom]]
+    heapq.heapify(heap)
+    ranks = {}
+    while heap:
+        _, chrom = heapq.heappop(heap)
+        ranks[chrom] = len(ranks)
+        for succ in succs[chrom]:
+            indegree[succ] -= 1
+            if not indegree[succ]:
+                heapq.heappush(heap, (first[succ], succ))
+
+    if len(ranks) < len(first):
+        raise ValueError('Input files are sorted in different orders '
+                            'of chromosomes')
+    return ranks
+
+
+def read_sorted(input_files, config, cache=False):
+    '''Returns alignments from coordinate-sorted input files.
+
+    Alignments of each chromosome must be together and sorted by
+    start position in each file, but chromosomes can be in any order,
+    e.g. chr2 before chr10. Alignments from all files are merged by
+    chromosome and start position. With many files, chromosomes are
+    merged in an order following all files (see get_chromosome_order()),
+    so each file is scanned for its chromosomes first.
+    Raises ValueError if a file is not sorted.
+
+    '''
+    if len(input_files) > 1:
+        ranks = get_chromosome_order([get_chromosomes(input_file)
+                                        for input_file in input_files])
+    else:
+        ranks = {}  # ranked as chromosomes appear
+
+    def read(file_no, input_file):
+        last_key = None
+        alignments = read_alignments(input_file, cache, config=config)
+        for n, groups in enumerate(alignments):
+            chrom = groups[0][0].chrom
+            try:
+                rank = ranks[chrom]
+            except KeyError:
+                rank = ranks[chrom] = len(ranks)
+            key = (rank, groups[0][0].start)
+            if last_key and key < last_key:
+                raise ValueError('%s is not sorted by chromosome and '
+                                    'start position at %s:%d' %
+                                    (input_file, chrom, key[1]))
+            last_key = key
+            yield key, file_no, n, groups
+
+    for input_file in input_files:
+        print >> stderr, 'Input\t\t\t%s' % input_file
+
+    readers = [read(i, f) for i, f in enumerate(input_files)]
+    for key, file_no, n, groups in heapq.merge(*readers):
+        yield groups
+
+
+def sweep_loci(alignments):
+    '''Yields exon groups of each locus from sorted alignments.
+
+    A locus is closed as soon as the next alignment starts after
+    the end of the locus, i.e. no later alignment can overlap it.
+
+    '''
+    pending = []  # exon groups ordered by start position
+    locus = []
+    locus_chrom = None
+    locus_end = None
+
+    for n, groups in enumerate(chain(alignments, [None])):
+        if groups is None or groups[0][0].chrom != locus_chrom:
+            limit = float('inf')  # close all loci in the chromosome
+        else:
+            limit = groups[0][0].start  # later alignments start after this
+
+        while pending and pending[0][0] <= limit:
+            start, _, group = heapq.heappop(pending)
+            if locus and start > locus_end:
+                yield locus
+                locus = []
+            if locus:
+                locus_end = max(locus_end, group[-1].end)
             else:
-                excluded += 1
+                locus_end = group[-1].end
+            locus.append(group)
+
+        if limit == float('inf'):
+            if locus:
+                yield locus
+                locus = []
+            if groups is None:
+                break
+            locus_chrom = groups[0][0].chrom
+
+        for i, group in enumerate(groups):
+            heapq.heappush(pending, (group[0].start, (n, i), group))
+
+
+def run_sorted(input_files, splice_sites, config, writer, cache=False):
+    '''Assembles coordinate-sorted alignments one locus at a time.
+
+    Memory usage depends on the size of the largest locus
+    rather than the size of input.
+
+    '''
+    print >> stderr, 'Constructing'
+    gene_id = transcripts_num = single_exon_gene_num = excluded = 0
+    unique_chains = total_chains = 0
+    alignments = read_sorted(input_files, config, cache)
+    for n, locus in enumerate(sweep_loci(alignments), start=1):
+        align_db = AlignmentDB()
+        with profiler.stage('add_alignments'):
+            for group in locus:
+                key = get_chain_key(group)
+                if key in align_db.chain_counts:
+                    align_db.chain_counts[key] += 1
+                else:
+                    align_db.chain_counts[key] = 1
+                    add_exon_group(align_db, group)
+        unique_chains += len(align_db.chain_counts)
+        total_chains += sum(align_db.chain_counts.itervalues())
+
+        gene_id, trns_num, single_num, excl = assemble_db(splice_sites,
+                                                        align_db,
+                                                        config,
+                                                        writer.add,
+                                                        verbose=False,
+                                                        gene_id=gene_id)
+        transcripts_num += trns_num
+        single_exon_gene_num += single_num
+        excluded += excl
+
+        if n % 100 == 0:
+            print >> stderr, \
+                '\r  |--Loci\t\t%d loci, %d genes, %d isoforms ' % \
+                    (n, gene_id, transcripts_num),
+
+    print >> stderr, ''
+    report_chains(unique_chains, total_chains)
+    return gene_id, transcripts_num, single_exon_gene_num, excluded
+
+
+def parse_input_file(job):
+    '''Parses an input file into a partial database of exon chains
+    in a worker process.
+
+    Returns the number of alignments, pairs of a key of each exon
+    chain (see get_chain_key()) and its number of copies in order of
+    first appearance, and a profile report if profiling is enabled.
+
+    '''
+    input_file, cache, config = job
+    chain_counts = {}
+    keys = []
+    n = 0
+    for chunk in read_blocks(input_file, cache, verbose=False):
+        n += len(chunk[1])
+        with profiler.stage('add_alignments'):
+            for groups in get_exon_groups(*chunk, chain_counts=chain_counts,
+                                            config=config):
+                keys.extend([get_chain_key(group) for group in groups])
+
+    report = None
+    if profiler.enabled:
+        report = profiler.get_report()
+        profiler.reset()
+    return n, [(key, chain_counts[key]) for key in keys], report
+
+
+def add_chains(align_db, chains):
+    '''Adds exon chains from parse_input_file() to the database.
+
+    Chains are added in the same order as by add_alignment(), so
+    the database is the same as if the file were added directly.
+
+    '''
+    chain_counts = align_db.chain_counts
+    for key, count in chains:
+        if key in chain_counts:
+            chain_counts[key] += count
+        else:
+            chain_counts[key] = count
+            chrom = key[0]
+            add_exon_group(align_db, [ExonObj(chrom, key[i], key[i + 1])
+                                        for i in xrange(1, len(key), 2)])
+
+
+def add_input_files(align_db, input_files, config, threads=1, cache=False):
+    '''Adds alignments from input files to the database.
+
+    With threads > 1, input files are parsed concurrently into
+    partial databases by parse_input_file(), which are merged into
+    the database in the order of input files.
+
+    '''
+    if threads > 1 and len(input_files) > 1:
+        add_input_files_parallel(align_db, input_files, config, threads,
+                                    cache)
+        return
+
+    for input_file in input_files:
+        '''====Parse alignments and build exon objects===='''
+        print >> stderr, 'Input\t\t\t%s' % input_file
+        n = 0
+        for chunk in read_blocks(input_file, cache):
+            with profiler.stage('add_alignments'):
+                for groups in get_exon_groups(*chunk,
+                                    chain_counts=align_db.chain_counts,
+                                    config=config):
+                    add_alignment(align_db, groups)
+                    n += 1
+
+                    if n % 100 == 0:
+                        print >> stderr, \
+                            '\r  |--Parsing\t\t%d alignments' % n,
+        print >> stderr, '\r  |--Parsing\t\t%d alignments' % n
+    report_chains(len(align_db.chain_counts),
+                    sum(align_db.chain_counts.itervalues()))
+
+
+def add_input_files_parallel(align_db, input_files, config, threads,
+                                cache=False):
+    '''Parses input files in worker processes and adds them
+    to the database (see add_input_files()).
+
+    '''
+    import multiprocessing
+
+    jobs = [(input_file, cache, config) for input_file in input_files]
+    pool = multiprocessing.Pool(min(threads, len(jobs)), profiler.reset)
+    try:
+        for input_file, result in izip(input_files,
+                                        pool.imap(parse_input_file, jobs)):
+            n, chains, report = result
+            print >> stderr, 'Input\t\t\t%s' % input_file
+            if report:
+                profiler.merge(report)
+            with profiler.stage('add_alignments'):
+                add_chains(align_db, chains)
+            print >> stderr, '  |--Parsing\t\t%d alignments' % n
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    report_chains(len(align_db.chain_counts),
+                    sum(align_db.chain_counts.itervalues()))
+
+
+def run_serial(input_files, splice_sites, config, writer, cache=False):
+    '''Assembles all alignments in a single process.'''
+
+    align_db = AlignmentDB()
+    add_input_files(align_db, input_files, config, cache=cache)
+
+    print >> stderr, 'Constructing'
+    return assemble_db(splice_sites, align_db, config, writer.add)
+
+
+RECORD_HEADER = struct.Struct('<Q')  # length of a splice graph record
+
+
+def load_splice_graph(path):
+    '''Returns alignment parameters, an alignment database, parameters
+    of gene models, gene models and the size of complete records
+    of a splice graph file.
+
+    The file starts with alignment parameters (see
+    Config.get_alignment_params()), followed by a record of each run
+    with exon chains added in order, parameters of gene models, whether
+    models were rebuilt and models changed and removed in the run.
+    The database is rebuilt by adding chains of all runs in order, so
+    exons and introns get the same IDs as when the models were built.
+    Each record is preceded by its length (see RECORD_HEADER), so
+    an incomplete record of an interrupted run is detected and ignored.
+
+    '''
+    align_db = AlignmentDB()
+    models = {}
+    model_params = None
+    with open(path, 'rb') as fp:
+        align_params = cPickle.load(fp)
+        size = fp.tell()
+        while True:
+            header = fp.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, = RECORD_HEADER.unpack(header)
+            data = fp.read(length)
+            if len(data) < length:
+                break
+            record = cPickle.loads(data)
+            chains, model_params, rebuilt, changed, removed = record
+            add_chains(align_db, chains)
+            if rebuilt:
+                models = {}
+            models.update(changed)
+            for key in removed:
+                del models[key]
+            size = fp.tell()
+    align_db.intron_db.changed = set()
+    return align_params, align_db, model_params, models, size
+
+
+def save_splice_graph(path, align_params, record, size=None):
+    '''Writes a record of a run (see load_splice_graph()) to a splice
+    graph file. The record is appended to complete records of size
+    bytes of an existing file, or a new file is written if size
+    is None.
+
+    '''
+    data = cPickle.dumps(record, cPickle.HIGHEST_PROTOCOL)
+    if size is None:
+        with open(path + '.tmp', 'wb') as fp:
+            cPickle.dump(align_params, fp, cPickle.HIGHEST_PROTOCOL)
+            fp.write(RECORD_HEADER.pack(len(data)))
+            fp.write(data)
+        os.rename(path + '.tmp', path)
+    else:
+        with open(path, 'r+b') as fp:
+            fp.seek(size)
+            fp.truncate()
+            fp.write(RECORD_HEADER.pack(len(data)))
+            fp.write(data)
+
+
+def run_db(input_files, splice_sites, db_path, add, config, writer,
+            threads=1, cache=False):
+    '''Adds alignments to a splice graph database and assembles
+    all alignments in the database.
+
+    Only components with introns or exons changed by new alignments
+    are rebuilt. Other gene models are reused from the database.
+    Without add, the database is rebuilt from input files.
+    All models are rebuilt if their parameters differ from those
+    of the database. Raises ValueError if alignment parameters
+    differ, because exon chains in the database depend on them.
+
+    '''
+    align_params = config.get_alignment_params()
+    params = config.get_params()
+    size = None
+    if add and os.path.exists(db_path):
+        print >> stderr, 'Database\t\t%s' % db_path
+        db_align_params, align_db, db_params, models, size = \
+                                                load_splice_graph(db_path)
+        if db_align_params != align_params:
+            raise ValueError('%s was built with gap_size=%d and '
+                                'max_intron=%d; run without --add to '
+                                'rebuild it with other values' %
+                                ((db_path,) + db_align_params))
+        if db_params != params:
+            print >> stderr, '  |--Parameters changed, ' + \
+                                'rebuilding all gene models'
+            models = {}
+    else:
+        align_db, models = AlignmentDB(), {}
+    rebuilt = not models
+    old_models = models.copy()
+
+    align_db.chain_log = []
+    add_input_files(align_db, input_files, config, threads, cache)
+    chains = [(key, align_db.chain_counts[key])
+                for key in align_db.chain_log]
+
+    print >> stderr, 'Constructing'
+    return_items = assemble_db(splice_sites, align_db, config, writer.add,
+                                models=models)
+
+    changed = dict((key, model) for key, model in models.iteritems()
+                    if old_models.get(key) != model)
+    removed = [key for key in old_models if key not in models]
+    save_splice_graph(db_path, align_params,
+                        (chains, params, rebuilt, changed, removed), size)
+    return return_items
+
+
+def assemble(alignments, genome, cache_alignments=False, **params):
+    '''Yields transcripts (see Transcript) of gene models assembled
+    from alignments without writing them in BED format.
+
+    alignments is an input file or a list of input files in
+    PSL/BED/BAM/CRAM format. genome is a path of a reference genome,
+    a genome opened by utils.packed_genome.open_genome() or
+    a SpliceSiteCache. Pass the same genome or SpliceSiteCache to
+    assemble many samples in one process without opening the genome
+    or looking up splice sites again.
+    Parameters are given as keywords, e.g. min_utr=200, find_max=True
+    (see Config). See --cache_alignments for cache_alignments.
+
+    Chromosomes are assembled one at a time in sorted order and
+    gene IDs are numbered per chromosome as with --threads.
+
+    '''
+    config = Config(**params)
+    if isinstance(genome, split_strand.SpliceSiteCache):
+        splice_sites = genome
+    else:
+        if isinstance(genome, basestring):
+            from utils import packed_genome
+            genome = packed_genome.open_genome(genome, verbose=False)
+        splice_sites = split_strand.SpliceSiteCache(genome)
+
+    if isinstance(alignments, basestring):
+        alignments = [alignments]
+    partitions = partition_alignments(alignments, cache_alignments,
+                                        verbose=False)
+    for chrom in sorted(partitions):
+        transcripts = []
+        assemble_partition(splice_sites, chrom, partitions.pop(chrom),
+                            config, transcripts.append)
+        for transcript in transcripts:
+            yield transcript
+
+
+def report_fallbacks(genes, max_genes=10):
+    '''Prints genes exceeding a complexity budget.'''
+
+    if not genes:
+        return
+    print >> stderr, '%d gene(s) exceeded a complexity budget ' \
+                        'and were reported with fewer isoforms ' \
+                        '(item RGB %s):' % (len(genes), FALLBACK_RGB)
+    for name, reason in genes[:max_genes]:
+        print >> stderr, '  %s\t%s' % (name, reason)
+    if len(genes) > max_genes:
+        print >> stderr, '  ...'
+
+
+def main(input_files, config):
+    from utils import packed_genome
+
+    print >> stderr, 'Gimme : Alignment-based assembler'
+    print >> stderr, 'Version : %s' % (VERSION)
+    print >> stderr, 'Source code : https://github.com/ged-lab/gimme.git\n'
+    print >> stderr, 'Opening the genome...'
+    with profiler.stage('open_genome'):
+        genome = packed_genome.open_genome(args.reference)
+    if args.cache_splice_sites:
+        cache_path = args.reference + '.splice_sites'
+    else:
+        cache_path = None
+    splice_sites = split_strand.SpliceSiteCache(genome,
+                                                cache_path,
+                                                args.reference)
+
+    if args.debug:
+        print >> stderr, 'DEBBUG MODE\t' + \
+                'Use this mode for debugging only!\n'
+
+    print >> stderr, '[Run...]'
+
+    compression = output_writer.get_compression(args.output, args.bgzf)
+    output = output_writer.OutputWriter(args.output, compression)
+    writer = BedWriter(output)
+    try:
+        with profiler.stage('run'):
+            if args.db:
+                return_items = run_db(input_files, splice_sites,
+                                        args.db, args.add, config, writer,
+                                        args.threads, args.cache_alignments)
+            elif args.sorted:
+                return_items = run_sorted(input_files, splice_sites,
+                                            config, writer,
+                                            args.cache_alignments)
+            elif args.threads > 1:
+                return_items = run_parallel(input_files, splice_sites,
+                                            args.reference, args.threads,
+                                            config, writer,
+                                            args.cache_alignments)
+            else:
+                return_items = run_serial(input_files, splice_sites,
+                                            config, writer,
+                                            args.cache_alignments)
+    except:
+        exc_info = sys.exc_info()
+        try:
+            output.close()
+        except Exception:
+            pass  # report the original error
+        raise exc_info[0], exc_info[1], exc_info[2]
+    with profiler.stage('output'):
+        output.close()
+
+    splice_sites.save()
+    if args.profile:
+        profiler.save(args.profile)
+
+    gene_id, transcripts_num, single_exon_gene_num, excluded = return_items
 
     '''====Print out summary report to standard error===='''
     print >> stderr, '\n[Done]'
@@ -788,6 +2064,7 @@ def main(input_files):
         print >> stderr, '(%d transcripts do not pass criteria.)' % excluded
     else:
         print >> stderr, ''
+    report_fallbacks(writer.fallbacks)
 
 
 if __name__ == '__main__':
@@ -806,6 +2083,21 @@ if __name__ == '__main__':
             default=max_isoforms,
             help='the maximum number of isoforms reported ' +
             'without -x option (default: %(default)s)')
+    parser.add_argument('--max_paths', type=int, metavar='int',
+            default=max_paths,
+            help='the maximum number of isoforms of a gene reported ' +
+            'with -x option; minimal isoforms are reported for genes ' +
+            'with more isoforms (0 = no limit) (default: %(default)s)')
+    parser.add_argument('--max_gene_edges', type=int, metavar='int',
+            default=max_gene_edges,
+            help='the maximum number of edges in a splice graph of ' +
+            'a gene; larger genes are covered by greedy isoforms ' +
+            '(0 = no limit) (default: %(default)s)')
+    parser.add_argument('--max_gene_seconds', type=float, metavar='float',
+            default=max_gene_seconds,
+            help='the maximum time (sec) searching isoforms of a gene ' +
+            'before falling back to a cheaper search (0 = no limit) ' +
+            '(default: %(default)s)')
     parser.add_argument('--min_transcript_len', type=int,
             metavar='int', default=min_transcript_len,
             help='the minimum size of transcript (bp)' +
@@ -819,65 +2111,113 @@ if __name__ == '__main__':
     parser.add_argument('--debug', action='store_true',
             help='reset parameters (for debugging purpose only)')
     parser.add_argument('input', type=str, nargs='+',
-            help='input file(s) in PSL/BED format')
+            help='input file(s) in PSL/BED/BAM/CRAM format')
     parser.add_argument('-v', '--version', action='version',
             version='%(prog)s version ' + VERSION)
     parser.add_argument('-r','--reference', type=str,
             help='a reference genome in FASTA format')
+    parser.add_argument('-o', '--output', type=str, metavar='path',
+            help='write gene models to a file instead of standard ' +
+            'output; a file ending with .gz is compressed with gzip')
+    parser.add_argument('--bgzf', action='store_true',
+            help='compress output in BGZF format for indexing with tabix')
+    parser.add_argument('--profile', type=str, metavar='path',
+            help='write time, memory usage and counters of each stage ' +
+            'and the slowest loci to a report in JSON format')
+    parser.add_argument('--profile_loci', type=int, metavar='int',
+            default=20,
+            help='the number of slowest loci in a profile report ' +
+            '(default: %(default)s)')
+    parser.add_argument('-t', '--threads', type=int, metavar='int',
+            default=1,
+            help='the number of worker processes; input files are ' +
+            'parsed and alignments are assembled per chromosome ' +
+            'in parallel (default: %(default)s)')
+    parser.add_argument('--cache_splice_sites', action='store_true',
+            help='save splice sites of junctions next to the reference ' +
+            'genome and reuse them in later runs')
+    parser.add_argument('--cache_alignments', action='store_true',
+            help='save parsed alignments next to input files and ' +
+            'reuse them in later runs')
+    parser.add_argument('--db', type=str, metavar='path',
+            help='a splice graph database; gene models of components ' +
+            'not changed by new alignments are reused')
+    parser.add_argument('--add', action='store_true',
+            help='add input files to an existing database given by --db')
+    parser.add_argument('--sorted', action='store_true',
+            help='input files are sorted by chromosome and start ' +
+            'position; assemble one locus at a time to limit memory usage')
 
     args = parser.parse_args()
     if not args.reference:
         print >> sys.stderr, "A reference file is required."
         sys.exit()
 
+    if args.threads <= 0:
+        raise ValueError('Invalid number of threads (<=0)')
+    if args.sorted and args.threads > 1:
+        raise ValueError('--sorted cannot be used with --threads')
+    if args.add and not args.db:
+        raise ValueError('--add requires --db')
+    if args.profile:
+        profiler.enabled = True
+        profiler.max_loci = args.profile_loci
+    if args.db and args.sorted:
+        raise ValueError('--db cannot be used with --sorted')
+    config = Config(find_max=args.max,
+                    max_paths=args.max_paths,
+                    max_gene_edges=args.max_gene_edges,
+                    max_gene_seconds=args.max_gene_seconds)
+
     if args.debug:
         '''Parameters are set to retain all splice junctions for
         debugging.
 
         '''
-        gap_size = 0
-        max_intron = -1
-        min_utr = 0
-        min_transcript_len = 1
-        min_single_exon_len = 1
-        args.max = True
+        config.gap_size = 0
+        config.max_intron = -1
+        config.min_utr = 0
+        config.min_transcript_len = 1
+        config.min_single_exon_len = 1
+        config.find_max = True
     else:
         if args.min_utr <= 0:
             raise ValueError('Invalid UTRs size (<=0)')
         elif args.min_utr != min_utr:
-            min_utr = args.min_utr
-            print >> sys.stderr, 'User defined min_utr = %d' % min_utr
+            config.min_utr = args.min_utr
+            print >> sys.stderr, 'User defined min_utr = %d' % args.min_utr
 
         if args.gap_size < 0:
             raise ValueError('Invalid intron size (<0)')
         elif args.gap_size != gap_size:
-            gap_size = args.gap_size
-            print >> sys.stderr, 'User defined gap_size = %d' % gap_size
+            config.gap_size = args.gap_size
+            print >> sys.stderr, 'User defined gap_size = %d' % args.gap_size
 
         if args.max_intron <= 0:
             raise ValueError('Invalid intron size (<=0)')
         elif args.max_intron != max_intron:
-            max_intron = args.max_intron
-            print >> sys.stderr, 'User defined max_intron = %d' % max_intron
+            config.max_intron = args.max_intron
+            print >> sys.stderr, \
+                    'User defined max_intron = %d' % args.max_intron
 
         if args.max_isoforms <= 0:
             raise ValueError('Invalid number of isoforms (<=0)')
         elif args.max_isoforms != max_isoforms:
-            max_isoforms = args.max_isoforms
+            config.max_isoforms = args.max_isoforms
             print >> sys.stderr, \
-                    'User defined max_isoforms = %d' % max_isoforms
+                    'User defined max_isoforms = %d' % args.max_isoforms
 
         if args.min_transcript_len <= 0:
             raise ValueError('Invalid transcript size (<=0)')
         elif args.min_transcript_len != min_transcript_len:
-            min_transcript_len = args.min_transcript_len
+            config.min_transcript_len = args.min_transcript_len
             print >> sys.stderr, 'User defined min_transcript_len = %d' % \
-                                                        min_transcript_len
+                                                    args.min_transcript_len
         if args.min_single_exon_len <= 0:
             raise ValueError('Invalid transcript size (<=0)')
         elif args.min_single_exon_len != min_single_exon_len:
-            min_single_exon_len = args.min_single_exon_len
+            config.min_single_exon_len = args.min_single_exon_len
             print >> sys.stderr, 'User defined min_single_exon_len = %d' % \
-                                                        min_single_exon_len
+                                                    args.min_single_exon_len
     if args.input:
-        main(args.input)
+        main(args.input, config)
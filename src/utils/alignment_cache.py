@@ -0,0 +1,106 @@
+'''The script reads and writes a binary cache of alignments.
+
+A cache stores raw alignment blocks of an input file (before gaps
+are filled and exons are split at large introns) in chunks of flat
+integer arrays, so later runs with different parameters can skip
+parsing text.
+
+A cache is valid only for an input file with the same size,
+modification time and checksum of its first and last megabytes.
+
+File layout (numpy.save arrays):
+    key of the input file
+    for each chunk:
+        chromosome names
+        chromosome index of each alignment
+        block count of each alignment
+        block starts
+        block ends
+
+'''
+
+import os
+import hashlib
+
+import numpy
+
+EXTENSION = '.alignments'
+SAMPLE_SIZE = 1 << 20  # bytes read from each end of the input file
+
+
+def get_key(input_file):
+    '''Returns a key identifying the content of an input file.'''
+
+    stat = os.stat(input_file)
+    checksum = hashlib.md5()
+    with open(input_file, 'rb') as fp:
+        checksum.update(fp.read(SAMPLE_SIZE))
+        if stat.st_size > SAMPLE_SIZE:
+            fp.seek(max(SAMPLE_SIZE, stat.st_size - SAMPLE_SIZE))
+            checksum.update(fp.read(SAMPLE_SIZE))
+
+    return '%d\t%r\t%s' % (stat.st_size, stat.st_mtime, checksum.hexdigest())
+
+
+def is_valid(input_file, path):
+    '''Returns True if a cache file matches an input file.'''
+
+    if not os.path.exists(path):
+        return False
+
+    try:
+        with open(path, 'rb') as fp:
+            key = str(numpy.load(fp)[0])
+    except (IOError, ValueError):
+        return False
+
+    return key == get_key(input_file)
+
+
+def read(path):
+    '''Yields chromosomes, block counts, block starts and block ends
+    of each chunk in a cache file.
+
+    '''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fp:
+        numpy.load(fp)  # key
+        while fp.tell() < size:
+            names = numpy.load(fp)
+            chrom_ids = numpy.load(fp)
+            counts = numpy.load(fp).astype(numpy.int64)
+            starts = numpy.load(fp).astype(numpy.int64)
+            ends = numpy.load(fp).astype(numpy.int64)
+            yield names[chrom_ids].tolist(), counts, starts, ends
+
+
+class Writer(object):
+    '''Writes chunks of alignment blocks to a cache file.
+
+    The cache is written to a temporary file and renamed
+    when it is closed, so an incomplete cache is never used.
+
+    '''
+    def __init__(self, input_file, path):
+        self.path = path
+        self.fp = open(path + '.tmp', 'wb')
+        numpy.save(self.fp, numpy.array([get_key(input_file)]))
+
+    def write(self, chroms, counts, starts, ends):
+        if not len(counts):
+            return
+        names, chrom_ids = numpy.unique(chroms, return_inverse=True)
+        numpy.save(self.fp, names)
+        numpy.save(self.fp, chrom_ids.astype(numpy.int32))
+        numpy.save(self.fp, counts.astype(numpy.int32))
+        # coordinates of long chromosomes do not fit in 32 bits
+        numpy.save(self.fp, starts.astype(numpy.int64))
+        numpy.save(self.fp, ends.astype(numpy.int64))
+
+    def close(self):
+        self.fp.close()
+        os.rename(self.path + '.tmp', self.path)
+
+    def discard(self):
+        self.fp.close()
+        os.remove(self.path + '.tmp')
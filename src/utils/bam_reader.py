@@ -0,0 +1,153 @@
+'''The script reads spliced alignments from BAM and CRAM files
+with pysam and returns them as chunks of alignment blocks like
+parsers of PSL and BED files in gimme.py.
+
+Aligned blocks of a read are M, = and X operations in its CIGAR.
+D and N operations skip reference bases between blocks and
+other operations do not consume the reference. Gaps are later
+filled and exons are split at large introns as for other input,
+so a deletion or a short N operation no longer than gap_size
+is filled (see get_exon_groups() in gimme.py).
+
+Unmapped reads and secondary, supplementary and QC-failed
+alignments are skipped.
+
+pysam is imported only when a file is opened.
+
+'''
+
+import gzip
+
+from array import array
+
+BLOCK_OPS = (0, 7, 8)  # M, =, X
+SKIP_OPS = (2, 3)  # D, N
+SKIP_FLAGS = 0x4 | 0x100 | 0x200 | 0x800
+
+
+def detect_format(path):
+    '''Returns 'BAM' or 'CRAM' if a file is in one of these formats
+    and None otherwise.
+
+    '''
+    with open(path, 'rb') as fp:
+        magic = fp.read(4)
+    if magic == 'CRAM':
+        return 'CRAM'
+    if magic[:2] == '\x1f\x8b':
+        try:
+            if gzip.open(path).read(4) == 'BAM\x01':
+                return 'BAM'
+        except IOError:
+            pass
+    return None
+
+
+def add_blocks(pos, cigar, starts, ends):
+    '''Appends starts and ends of aligned blocks of a read at
+    leftmost position pos to starts and ends and returns the number
+    of blocks. cigar is a list of (operation, length) pairs.
+
+    '''
+    n = 0
+    block_end = None
+    for op, length in cigar:
+        if op in BLOCK_OPS:
+            if pos == block_end:  # blocks separated by an insertion
+                ends[-1] = pos + length
+            else:
+                starts.append(pos)
+                ends.append(pos + length)
+                n += 1
+            pos += length
+            block_end = pos
+        elif op in SKIP_OPS:
+            pos += length
+    return n
+
+
+def open_alignments(path):
+    '''Returns a pysam file of BAM or CRAM alignments.'''
+
+    import pysam
+
+    if detect_format(path) == 'CRAM':
+        return pysam.AlignmentFile(path, 'rc')
+    return pysam.AlignmentFile(path, 'rb')
+
+
+def get_references(path):
+    '''Returns names of references in the header of a file, which is
+    the order of chromosomes in a file sorted by samtools.
+
+    '''
+    bam = open_alignments(path)
+    try:
+        return list(bam.references)
+    finally:
+        bam.close()
+
+
+def get_regions(path):
+    '''Returns names of references with alignments in an indexed file
+    or None if the file is not indexed.
+
+    '''
+    bam = open_alignments(path)
+    try:
+        if not bam.has_index():
+            return None
+        if bam.is_cram:  # no index statistics in CRAM indices
+            return list(bam.references)
+        return [stat.contig for stat in bam.get_index_statistics()
+                    if stat.mapped]
+    finally:
+        bam.close()
+
+
+def to_chunk(chroms, counts, starts, ends):
+    '''Returns a chunk of alignments with block counts, starts and
+    ends in arrays converted to NumPy arrays.
+
+    '''
+    import numpy
+
+    return (chroms,) + tuple(
+                numpy.frombuffer(a, dtype=a.typecode).astype(numpy.int64)
+                for a in (counts, starts, ends))
+
+
+def read_chunks(path, region=None, chunk_size=100000):
+    '''Yields chromosomes, block counts, block starts and block ends
+    of chunks of up to chunk_size alignments in a file or, if region
+    is given, in a region of an indexed file.
+
+    '''
+    bam = open_alignments(path)
+    try:
+        if region is None:
+            reads = bam.fetch(until_eof=True)
+        else:
+            reads = bam.fetch(region)
+        names = bam.references
+
+        chroms, counts = [], array('l')
+        starts, ends = array('l'), array('l')
+        for read in reads:
+            if read.flag & SKIP_FLAGS or read.cigartuples is None:
+                continue  # no CIGAR ('*') means no aligned blocks
+            n = add_blocks(read.reference_start, read.cigartuples,
+                            starts, ends)
+            if not n:
+                continue
+            chroms.append(names[read.reference_id])
+            counts.append(n)
+            if len(counts) == chunk_size:
+                yield to_chunk(chroms, counts, starts, ends)
+                chroms, counts = [], array('l')
+                starts, ends = array('l'), array('l')
+
+        if counts:
+            yield to_chunk(chroms, counts, starts, ends)
+    finally:
+        bam.close()
@@ -8,8 +8,8 @@ of minimum isoforms, the script return the original transcripts.
 
 import sys
 import csv
-
-import networkx as nx
+import time
+import heapq
 
 
 class ExonObj(object):
@@ -47,169 +47,268 @@ def parseBed(filename):
             yield geneId, exons, row
 
 
-def create_bipartite_graph(G):
-    '''Return a bipartite graph with top nodes = G.nodes and
-    bottom nodes = {1,2,3...} which 1=G.nodes[1], etc.
-    Each edge has capacity=1.0.
+def max_matching(adj, n):
+    '''Returns a maximum matching of a bipartite graph by
+    Hopcroft-Karp algorithm.
 
-    G is a directed graph. Start and End nodes are not included
-    in a bipartite graph.
+    Top and bottom nodes are integers from 0 to n - 1 and adj[u] is
+    a list of bottom nodes connected to a top node u. Returns a list
+    of a matched bottom node of each top node (-1 if not matched).
 
     '''
-    B = nx.DiGraph()
-    g = G.copy()
-    g.remove_nodes_from(['Start', 'End'])
-
-    bottom_nodes = {}
-    node_index = []  # note, nodes are not id'd in topological order
-
-    node_id = 0
-    for node in g.nodes():
-        B.add_edge('S', node, capacity=1.0)  # add edge to [S]ource node
-
-        bottom_nodes[node] = node_id
-        node_index.append(node)
-
-        B.add_edge(node_id, 'T', capacity=1.0)  # add edge to [T]arget node
-
-        node_id += 1
-    # print bottom_nodes;
-
-    for node in g.nodes():
-        for e in g[node].keys():
-            node_id = bottom_nodes[e]
-            B.add_edge(node, node_id, capacity=1.0)
-
-    # for edge in B.edges():
-    #     print edge
-    return B, node_index
-
-
-def run_max_flow(G):
-    '''Return edges in max flow analysis.
-
-    G is a bipartite graph created from create_bipartite_graph().
+    match_top = [-1] * n
+    match_bottom = [-1] * n
+
+    for u in xrange(n):  # start from a greedy matching
+        for v in adj[u]:
+            if match_bottom[v] == -1:
+                match_top[u] = v
+                match_bottom[v] = u
+                break
+
+    while True:
+        '''Build layers of alternating paths from free top nodes.'''
+        dist = [-1] * n
+        queue = [u for u in xrange(n) if match_top[u] == -1 and adj[u]]
+        for u in queue:
+            dist[u] = 0
+
+        found = False
+        i = 0
+        while i < len(queue):
+            u = queue[i]
+            i += 1
+            for v in adj[u]:
+                w = match_bottom[v]
+                if w == -1:
+                    found = True
+                elif dist[w] == -1:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+
+        if not found:
+            return match_top
+
+        '''Find vertex-disjoint augmenting paths along the layers.'''
+        pos = [0] * n
+        for root in xrange(n):
+            if match_top[root] != -1 or dist[root] != 0:
+                continue
+            stack = [root]
+            while stack:
+                u = stack[-1]
+                if pos[u] < len(adj[u]):
+                    v = adj[u][pos[u]]
+                    pos[u] += 1
+                    w = match_bottom[v]
+                    if w == -1:
+                        for u in stack:
+                            v = adj[u][pos[u] - 1]
+                            match_top[u] = v
+                            match_bottom[v] = u
+                        break
+                    elif dist[w] == dist[u] + 1:
+                        stack.append(w)
+                else:
+                    dist[u] = -1  # no augmenting path from this node
+                    stack.pop()
+
+
+def sort_nodes(G, key=None):
+    '''Returns nodes of a directed acyclic graph G in topological
+    order. Nodes available at the same time are taken in order of
+    key(node) (or of nodes if key is None), so the order does not
+    depend on the order in which nodes were added to G.
+    Start and End nodes are not passed to key.
 
     '''
-    edges = nx.max_flow_min_cost(G, 'S', 'T')
-    return edges
-
-
-def rebuild_edges(edges, node_index):
-    '''Rebuild edges from bipartite graph to orginal directed graph.
-
-    edges are output from run_max_flow().
+    def get_key(node):
+        if node in ('Start', 'End'):
+            return None
+        return key(node) if key else node
+
+    indegree = dict((node, len(G.predecessors(node))) for node in G)
+    heap = [(get_key(node), node)
+                for node, d in indegree.iteritems() if d == 0]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        k, node = heapq.heappop(heap)
+        order.append(node)
+        for succ in G.successors(node):
+            indegree[succ] -= 1
+            if indegree[succ] == 0:
+                heapq.heappush(heap, (get_key(succ), succ))
+    return order
+
+
+def get_shortest_paths(source, neighbors):
+    '''Returns a dictionary of a parent of each node in
+    a breadth-first search tree from a source node.
 
     '''
-    K = nx.DiGraph()
-    for node in edges:
-        if node == 'S':
-            continue  # ignore S node
-        for e in edges[node]:
-            if e == 'T':
-                continue  # ignore T node
+    parents = {source: None}
+    queue = [source]
+    i = 0
+    while i < len(queue):
+        node = queue[i]
+        i += 1
+        for neighbor in neighbors(node):
+            if neighbor not in parents:
+                parents[neighbor] = node
+                queue.append(neighbor)
+    return parents
+
+
+def trace(parents, node):
+    '''Returns a path from a node to the root of a search tree.'''
+
+    if node not in parents:
+        raise ValueError, "Error: %s is not connected." % str(node)
+    path = []
+    while node is not None:
+        path.append(node)
+        node = parents[node]
+    return path
+
+
+def get_greedy_paths(G, edges=None, key=None):
+    '''Returns paths including all edges or given edges of G.
+    G is a directed acyclic graph with Start and End nodes.
+
+    Paths are not minimal, but they are found in time linear
+    in their total length. Starting from the first uncovered edge
+    in topological order, a path is extended along uncovered edges
+    as far as possible and joined to Start and End nodes by
+    shortest paths. Nodes are ordered by sort_nodes() with key.
 
-            # print node, e
-
-            if edges[node][e] > 0.0:
-                K.add_edge(node, node_index[e])
+    '''
+    order = dict((node, i) for i, node in enumerate(sort_nodes(G, key)))
+
+    if edges is None:
+        edges = [(u, v) for u, v in G.edges()
+                    if u != 'Start' and v != 'End']
+
+    from_start = get_shortest_paths('Start',
+                    lambda node: sorted(G.successors(node), key=order.get))
+    to_end = get_shortest_paths('End',
+                    lambda node: sorted(G.predecessors(node), key=order.get))
+
+    uncovered = {}
+    for u, v in sorted(edges, key=lambda e: (order[e[0]], -order[e[1]])):
+        uncovered.setdefault(u, []).append(v)
+
+    paths = []
+    for node in sorted(uncovered, key=order.get):
+        while uncovered[node]:
+            path = trace(from_start, node)[::-1]
+            last = node
+            while uncovered.get(last):
+                last = uncovered[last].pop()
+                path.append(last)
+            path.extend(trace(to_end, last)[1:])
+            paths.append(path[1:-1])  # remove Start and End
 
-    return K.edges()
+    return paths
 
 
-def remove_maxflow_edges(mf_edges, B):
-    '''Remove edges from max flow path of bipartite graph B.'''
+def get_min_paths(G, verbose=True, stats=None, deadline=None, key=None):
+    '''Returns minimal paths including all edges.
+    G is a directed acyclic graph with Start and End nodes.
 
-    for node in mf_edges:
-        if node == 'S':
-            continue  # ignore S node
-        for e in mf_edges[node]:
-            if e == 'T':
-                continue  # ignore T node
-            if mf_edges[node][e] == 1.0:
-                B[node][e]['capacity'] = 0.0  # disable the edge
+    Each round finds a maximum matching of the remaining edges
+    in a bipartite graph of G. Matched edges form chains of exons,
+    which are extended to Start and End nodes by shortest paths.
+    Matched edges are then removed and the search is repeated
+    until all edges are covered.
 
+    Nodes are numbered in order of sort_nodes() with key, e.g.
+    positions of exons, so the same graph gets the same paths however
+    its nodes were added. Many sets of paths can be minimal and
+    a different order may find a different set.
 
-def add_path(edges, paths, G):
-    '''Build paths from a given edges.
+    If deadline (in seconds since the epoch) is passed, remaining
+    edges are covered by get_greedy_paths() instead.
 
-    G is an original directed graph.
+    If stats is given, the number of matching rounds is added
+    to stats['rounds'] and stats['timeout'] is set to True
+    if the deadline is passed.
 
     '''
-    K = nx.DiGraph()
-    J = nx.DiGraph()
-    K.add_edges_from(edges)
-    for SG in nx.algorithms.weakly_connected_component_subgraphs(K):
-        head_node = None
-        tail_node = None
-        for node in SG.nodes():
-            if not SG.predecessors(node):
-                head_node = node
-            if not SG.successors(node):
-                tail_node = node
-
-        # print 'head node= %s, tail node = %s' % (head_node, tail_node)
-
-        body = nx.algorithms.shortest_path(SG, head_node, tail_node)
-        head = nx.algorithms.shortest_path(G, 'Start', head_node)
-        tail = nx.algorithms.shortest_path(G, tail_node, 'End')
-
-        SG.add_path(head)
-        SG.add_path(body)
-        SG.add_path(tail)
-
-        path = [p for p in nx.algorithms.dfs_preorder_nodes(SG, 'Start')]
-
-        J.add_path(path)
-        if set(J.edges()).difference(set(G.edges())):
-            raise ValueError, "Error: edges are added."
-        # for e in SG.edges():
-        #     print e
-        path_str = '->'.join(path)
-        paths.add(path_str)
-
-
-def get_min_paths(G, verbose=True):
-    '''Returns minimal paths including all edges.
-    G is a directed graph.
+    total_edges = G.number_of_edges()
+    order = sort_nodes(G, key)
+    rank = dict((node, i) for i, node in enumerate(order))
+    nodes = [node for node in order if node not in ('Start', 'End')]
+    index = dict((node, i) for i, node in enumerate(nodes))
+    n = len(nodes)
+
+    adj = [sorted(index[e] for e in G.successors(node) if e in index)
+                for node in nodes]
+    all_edges = set((u, v) for u in xrange(n) for v in adj[u])
+
+    from_start = get_shortest_paths('Start',
+                    lambda node: sorted(G.successors(node), key=rank.get))
+    to_end = get_shortest_paths('End',
+                    lambda node: sorted(G.predecessors(node), key=rank.get))
+
+    paths = []
+    found_paths = set()  # store unique paths
+    covered_edges = set()
 
-    '''
-    total_edges = len(G.edges())
-    paths = set()  # store unique paths
-    B, node_index = create_bipartite_graph(G)
+    mf_round = 1
+    timeout = False
+    while True:
+        if deadline is not None and time.time() > deadline:
+            timeout = True
+            break
 
-    mf_edges = run_max_flow(B)
-    edges = set(rebuild_edges(mf_edges, node_index))
+        match = max_matching(adj, n)
+        edges = [(u, match[u]) for u in xrange(n) if match[u] != -1]
+        if not edges:
+            break
 
-    mf_round = 1
-    while edges:  # a max flow path is found
         if (total_edges > 50) and verbose:  # display progress
-            if verbose:
-                print >> sys.stderr, \
-                    '\t... #%d found %d junctions' % (mf_round, len(edges))
-
-        add_path(edges, paths, G)
-        remove_maxflow_edges(mf_edges, B)
-        mf_edges = run_max_flow(B)
-        edges = set(rebuild_edges(mf_edges, node_index))
+            print >> sys.stderr, \
+                '\t... #%d found %d junctions' % (mf_round, len(edges))
+
+        heads = set(match[u] for u, v in edges)
+        for u, v in edges:
+            if u in heads:
+                continue  # not the first exon of a chain
+            chain = [u]
+            while match[chain[-1]] != -1:
+                chain.append(match[chain[-1]])
+
+            head = trace(from_start, nodes[chain[0]])[::-1]
+            tail = trace(to_end, nodes[chain[-1]])
+            path = head[:-1] + [nodes[i] for i in chain] + tail[1:]
+
+            if tuple(path) not in found_paths:
+                found_paths.add(tuple(path))
+                paths.append(path[1:-1])  # remove Start and End
+
+        for u, v in edges:
+            adj[u].remove(v)
+            covered_edges.add((u, v))
         mf_round += 1
 
-    g = G.copy()
-    g.remove_nodes_from(['Start', 'End'])
-
-    paths = list(paths)
-    for i in range(len(paths)):
-        paths[i] = paths[i].split('->')
-        paths[i].remove('Start')
-        paths[i].remove('End')
+    if timeout:
+        edges = [(u, v) for u in xrange(n) for v in adj[u]]
+        for path in get_greedy_paths(G, [(nodes[u], nodes[v])
+                                            for u, v in edges], key):
+            if tuple(path) not in found_paths:
+                found_paths.add(tuple(path))
+                paths.append(path)
+        covered_edges.update(edges)
 
-    K = nx.DiGraph()
-    for path in paths:
-        K.add_path(path)
-
-    if set(K.edges()) != set(g.edges()):
+    if covered_edges != all_edges:
         raise ValueError, "Error: Some edges are added or removed."
 
+    if stats is not None:
+        stats['rounds'] = stats.get('rounds', 0) + mf_round - 1
+        if timeout:
+            stats['timeout'] = True
+
     return paths
 
 
@@ -249,6 +348,8 @@ def printBed(path, db, geneId, transId):
 
 
 def make_graph(bedfile, exon_db):
+    import networkx as nx
+
     def get_path(exons, exon_db):
         path = [str(e) for e in exons]
         for exon in exons:
@@ -304,7 +405,8 @@ def main(argv, verbose=True):
                                             (gene_id, len(G.nodes()))
         if len(transcripts) > 1:
             print >> sys.stderr, '\tSearch'
-            paths = get_min_paths(G, verbose)
+            paths = get_min_paths(G, verbose,
+                        key=lambda e: (exon_db[e].start, exon_db[e].end))
             print >> sys.stderr, '\tDone.'
             if len(paths) < total:
                 for n, path in enumerate(paths, start=1):
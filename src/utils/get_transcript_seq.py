@@ -1,6 +1,6 @@
 '''This script reads a gene model from BED file
 and writes a DNA sequence to standard output.
-The script requires pygr package.
+The genome is a FASTA file or a packed genome (see packed_genome.py).
 
 '''
 
@@ -8,7 +8,7 @@ import sys
 import csv
 
 from collections import namedtuple
-from pygr import seqdb, sequtil
+from packed_genome import open_genome, write_fasta
 
 Exon = namedtuple('Exon', 'chrom, start, end')
 
@@ -59,13 +59,13 @@ def write_seq(filename, genome, output, strand):
 
         if output == 'transcript':
             seq = get_sequence_transcript(genome, exons, strand)
-            sequtil.write_fasta(sys.stdout, seq, id=gene_id)
+            write_fasta(sys.stdout, seq, id=gene_id)
         elif output == 'exon':
             seqs = get_sequence_exon(genome, exons, strand)
 
             for n, seq in enumerate(seqs, start=1):
                 seq_id = gene_id + '_' + str(n)
-                sequtil.write_fasta(sys.stdout, seq, id=seq_id)
+                write_fasta(sys.stdout, seq, id=seq_id)
         else:
             print >> sys.stderr, 'Unsupported output format.'
             raise SystemExit
@@ -103,5 +103,5 @@ if __name__ == '__main__':
                 raise SystemExit
 
     # print >> sys.stderr, filename, genome_file, output, strand
-    genome = seqdb.SequenceFileDB(genome_file, verbose=False)
+    genome = open_genome(genome_file, verbose=False)
     write_seq(filename, genome, output, strand)
@@ -1,6 +1,6 @@
 '''This script reads a gene model from PSL file
 and writes a DNA sequence to standard output.
-The script requires pygr package.
+The genome is a FASTA file or a packed genome (see packed_genome.py).
 
 '''
 
@@ -8,7 +8,7 @@ import sys
 import csv
 
 from collections import namedtuple
-from pygr import seqdb, sequtil
+from packed_genome import open_genome, write_fasta
 
 Exon = namedtuple('Exon', 'chrom, start, end')
 
@@ -51,12 +51,12 @@ def parse_seq(filename, genome):
 
 def main():
     filename = sys.argv[1]
-    genome = seqdb.SequenceFileDB(sys.argv[2], verbose=False)
+    genome = open_genome(sys.argv[2], verbose=False)
     for n, (exons, gene_id) in enumerate(
                     parse_seq(filename, genome), start=1):
 
         seq = get_sequence(genome, exons)
-        sequtil.write_fasta(sys.stdout, seq, id=gene_id)
+        write_fasta(sys.stdout, seq, id=gene_id)
 
         if n % 1000 == 0:
             print >> sys.stderr, '...', n
@@ -0,0 +1,104 @@
+'''The script reads text input compressed in gzip or BGZF format
+on a background thread.
+
+BGZF files are gzip files made of many members and are read like
+other gzip files. Decompressed blocks of BUFFER_SIZE bytes are handed
+to the reading thread through a queue of at most QUEUE_SIZE blocks,
+so decompression overlaps with parsing without holding the whole
+file in memory. Uncompressed files are read directly.
+
+'''
+
+import gzip
+import threading
+import Queue
+
+from cStringIO import StringIO
+from itertools import chain
+
+BUFFER_SIZE = 1 << 20  # bytes of decompressed text in a block
+QUEUE_SIZE = 8  # blocks decompressed ahead of the reading thread
+GZIP_MAGIC = '\x1f\x8b'
+
+
+def is_compressed(path):
+    '''Returns True if a file is compressed in gzip or BGZF format.'''
+
+    with open(path, 'rb') as fp:
+        return fp.read(2) == GZIP_MAGIC
+
+
+def open_input(path):
+    '''Returns an iterable file-like object of lines of a text file,
+    which is decompressed by an InputReader if it is compressed.
+
+    '''
+    if is_compressed(path):
+        return InputReader(path)
+    return open(path)
+
+
+class InputReader(object):
+    '''An iterable file-like object of lines of a compressed file.
+
+    The file is decompressed on a background thread. Call close()
+    to stop the thread before the end of the file.
+
+    '''
+    def __init__(self, path):
+        self.fp = gzip.open(path, 'rb')
+        self.error = None
+        self.closed = False
+        self.finished = False
+        self.queue = Queue.Queue(maxsize=QUEUE_SIZE)
+        self.lines = chain.from_iterable(self.read_blocks())
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.closed:
+                data = self.fp.read(BUFFER_SIZE)
+                if not data:
+                    break
+                self.queue.put(data)
+        except Exception, e:
+            self.error = e
+        finally:
+            self.queue.put(None)
+
+    def read_blocks(self):
+        '''Yields file objects of blocks of complete lines.'''
+
+        remainder = ''
+        while True:
+            data = self.queue.get()
+            if data is None:
+                self.finished = True
+                if self.error:
+                    raise self.error
+                break
+            end = data.rfind('\n') + 1
+            if end:
+                yield StringIO(remainder + data[:end])
+                remainder = data[end:]
+            else:
+                remainder += data
+        if remainder:
+            yield StringIO(remainder)
+
+    def __iter__(self):
+        return self.lines
+
+    def readline(self):
+        return next(self.lines, '')
+
+    def close(self):
+        self.closed = True
+        if not self.finished:
+            while self.queue.get() is not None:
+                pass  # unblock the background thread
+            self.finished = True
+        self.thread.join()
+        self.fp.close()
@@ -0,0 +1,69 @@
+'''The script builds a static index of intervals from arrays of
+starts and ends and finds intervals overlapping query intervals.
+
+Intervals are sorted by start once and a running maximum of ends
+is kept. Intervals overlapping a query [start, end) lie between
+the first interval whose running maximum end exceeds start and
+the last interval starting before end, so both bounds are found
+by binary search. Queries can be done one at a time or in a batch
+with NumPy arrays.
+
+Intervals are half-open; intervals that only touch a query
+do not overlap it.
+
+'''
+
+import numpy
+
+
+class IntervalIndex(object):
+    '''A build-once, query-many index of intervals.
+
+    Indices returned by queries refer to intervals sorted by start,
+    which are kept in starts and ends.
+
+    '''
+    def __init__(self, starts, ends):
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        order = numpy.argsort(starts, kind='mergesort')
+        self.starts = starts[order]
+        self.ends = ends[order]
+        if len(self.ends):
+            self.max_ends = numpy.maximum.accumulate(self.ends)
+        else:
+            self.max_ends = self.ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, start, end):
+        '''Returns indices of intervals overlapping [start, end).'''
+
+        low = numpy.searchsorted(self.max_ends, start, side='right')
+        high = numpy.searchsorted(self.starts, end, side='left')
+        if high <= low:
+            return numpy.zeros(0, dtype=numpy.int64)
+        hits = numpy.arange(low, high)
+        return hits[self.ends[hits] > start]
+
+    def find_all(self, starts, ends):
+        '''Returns indices of queries and intervals of all pairs
+        of overlapping query and interval.
+
+        Pairs are ordered by query and by start of intervals.
+
+        '''
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        low = numpy.searchsorted(self.max_ends, starts, side='right')
+        high = numpy.searchsorted(self.starts, ends, side='left')
+        counts = numpy.maximum(high - low, 0)
+
+        queries = numpy.repeat(numpy.arange(len(starts)), counts)
+        offsets = numpy.cumsum(counts) - counts
+        hits = (numpy.repeat(low - offsets, counts) +
+                numpy.arange(counts.sum()))
+
+        overlap = self.ends[hits] > starts[queries]
+        return queries[overlap], hits[overlap]
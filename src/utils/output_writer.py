@@ -0,0 +1,124 @@
+'''The script writes text output in large blocks on a background thread.
+
+Output can be compressed in gzip or BGZF format. BGZF files are gzip
+files made of independent blocks that can be indexed by tabix.
+Compression runs on the background thread, overlapping with the work
+that produces the output.
+
+'''
+
+import sys
+import zlib
+import struct
+import threading
+import Queue
+
+BUFFER_SIZE = 1 << 20  # bytes buffered before a block is written
+BGZF_BLOCK_SIZE = 0xff00  # uncompressed bytes in a BGZF block
+BGZF_EOF = ('\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43'
+            '\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def get_compression(path, bgzf=False):
+    '''Returns a compression format for an output path.'''
+
+    if bgzf:
+        return 'bgzf'
+    elif path and path.endswith('.gz'):
+        return 'gzip'
+    else:
+        return None
+
+
+def compress_bgzf(data, level=6):
+    '''Returns data compressed in BGZF blocks.'''
+
+    blocks = []
+    for i in xrange(0, len(data), BGZF_BLOCK_SIZE):
+        block = data[i:i + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(block) + compressor.flush()
+        blocks.append(struct.pack('<4BI2BH2BHH',
+                                    0x1f, 0x8b, 8, 4,  # magic, flags
+                                    0, 0, 0xff,  # mtime, xfl, os
+                                    6, 66, 67, 2,  # BC extra field
+                                    len(cdata) + 25))  # block size - 1
+        blocks.append(cdata)
+        blocks.append(struct.pack('<2I', zlib.crc32(block) & 0xffffffff,
+                                    len(block)))
+    return ''.join(blocks)
+
+
+class OutputWriter(object):
+    '''A file-like object writing text to a file or standard output.
+
+    Text is buffered and handed to a background thread in blocks of
+    BUFFER_SIZE bytes. Call close() to write remaining text.
+
+    '''
+    def __init__(self, path=None, compression=None, level=6):
+        if path:
+            self.fp = open(path, 'wb')
+        else:
+            self.fp = sys.stdout
+        self.compression = compression
+        self.level = level
+        self.buffer = []
+        self.size = 0
+        self.error = None
+        self.queue = Queue.Queue(maxsize=8)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        if self.compression == 'gzip':
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        finished = False  # the end of the queue was taken
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    finished = True
+                    break
+                if self.compression == 'gzip':
+                    data = compressor.compress(data)
+                elif self.compression == 'bgzf':
+                    data = compress_bgzf(data, self.level)
+                self.fp.write(data)
+
+            if self.compression == 'gzip':
+                self.fp.write(compressor.flush())
+            elif self.compression == 'bgzf':
+                self.fp.write(BGZF_EOF)
+            self.fp.flush()
+        except Exception, e:
+            self.error = e
+            if not finished:
+                while self.queue.get() is not None:
+                    pass  # unblock the writing thread
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.error:
+            raise self.error
+        if self.buffer:
+            self.queue.put(''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            if self.fp is not sys.stdout:
+                self.fp.close()
+        if self.error:
+            raise self.error
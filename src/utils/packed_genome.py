@@ -0,0 +1,229 @@
+'''The script builds and reads a packed genome file.
+
+A packed genome stores each base in 4 bits (two bases per byte).
+The file is memory-mapped, so opening a genome takes milliseconds
+and pages are shared by all processes reading the same file.
+
+Bases are A, C, G, T and N in upper and lower case.
+Other IUPAC codes are stored as N.
+
+File layout:
+    magic string (8 bytes)
+    packed sequences of all chromosomes
+    index: one "name<tab>length<tab>offset" line per chromosome
+    offset of the index (8 bytes, little-endian)
+
+Usage: python packed_genome.py <genome file in FASTA format> [output]
+
+'''
+
+import os
+import sys
+import mmap
+import string
+import struct
+
+import numpy
+
+MAGIC = 'GIMMEG4\0'
+EXTENSION = '.packed'
+BASES = 'ACGTNacgtn'
+CHUNK_SIZE = 1 << 22  # bases packed at a time
+
+ENCODE = ''.join([chr(BASES.index(c)) if c in BASES else
+                    chr(9) if c.islower() else chr(4)
+                    for c in map(chr, range(256))])
+DECODE = [BASES[b >> 4] + BASES[b & 15] if (b >> 4) < 10 and (b & 15) < 10
+            else 'NN' for b in range(256)]
+COMPLEMENT = string.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+
+class Sequence(str):
+    '''A DNA sequence.
+
+    reverse_complement() works like that of pygr sequence objects.
+
+    '''
+    def reverse_complement(self, seq=None):
+        if seq is None:
+            seq = self
+        return str(seq).translate(COMPLEMENT)[::-1]
+
+
+class PackedSequence(object):
+    '''A chromosome in a packed genome.
+
+    Slicing returns a Sequence object.
+
+    '''
+    def __init__(self, name, data, offset, length):
+        self.name = name
+        self.data = data
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return str(self[:])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step != 1:
+                raise ValueError('Slice step is not supported.')
+        else:
+            if key < 0:
+                key += self.length
+            if key < 0 or key >= self.length:
+                raise IndexError('Sequence index out of range.')
+            start, stop = key, key + 1
+
+        if stop <= start:
+            return Sequence('')
+
+        first = self.offset + start // 2
+        last = self.offset + (stop + 1) // 2
+        seq = ''.join([DECODE[b] for b in bytearray(self.data[first:last])])
+        skip = start % 2
+        return Sequence(seq[skip:skip + stop - start])
+
+
+class PackedGenome(object):
+    '''A memory-mapped packed genome.
+
+    genome[chrom] returns a PackedSequence object.
+
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a packed genome file.' % path)
+
+        index_offset = struct.unpack('<Q', self.data[-8:])[0]
+        self.chroms = {}
+        for line in self.data[index_offset:-8].splitlines():
+            name, length, offset = line.split('\t')
+            self.chroms[name] = PackedSequence(name, self.data,
+                                                int(offset), int(length))
+
+    def __getitem__(self, chrom):
+        return self.chroms[chrom]
+
+    def __contains__(self, chrom):
+        return chrom in self.chroms
+
+    def __iter__(self):
+        return iter(self.chroms)
+
+    def __len__(self):
+        return len(self.chroms)
+
+    def close(self):
+        self.data.close()
+
+
+def write_fasta(output, seq, id, width=60):
+    '''Writes a sequence in FASTA format with lines of width bases
+    like write_fasta() of pygr sequtil.
+
+    '''
+    output.write('>%s\n' % id)
+    for i in xrange(0, len(seq), width):
+        output.write('%s\n' % seq[i:i + width])
+
+
+def is_packed(path):
+    '''Returns True if a file is a packed genome.'''
+
+    with open(path, 'rb') as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+def build(fasta_file, path):
+    '''Writes a packed genome from a genome in FASTA format.'''
+
+    index = []
+    with open(path + '.tmp', 'wb') as out:
+        out.write(MAGIC)
+
+        def write(seq):
+            '''Packs bases and returns a leftover base.'''
+            if len(seq) % 2:
+                seq, leftover = seq[:-1], seq[-1]
+            else:
+                leftover = ''
+            codes = numpy.frombuffer(seq.translate(ENCODE), dtype=numpy.uint8)
+            out.write(((codes[0::2] << 4) | codes[1::2]).tostring())
+            return leftover
+
+        name = None
+        chunk = []
+        chunk_size = 0
+        for line in open(fasta_file):
+            if line.startswith('>'):
+                if name is not None:
+                    seq = write(''.join(chunk))
+                    write(seq + 'N' * len(seq))  # pad an odd base
+                    index.append((name, length, offset))
+                name = line[1:].split()[0]
+                offset = out.tell()
+                length = 0
+                chunk = []
+                chunk_size = 0
+            else:
+                line = line.strip()
+                length += len(line)
+                chunk.append(line)
+                chunk_size += len(line)
+                if chunk_size >= CHUNK_SIZE:
+                    leftover = write(''.join(chunk))
+                    chunk = [leftover]
+                    chunk_size = len(leftover)
+
+        if name is not None:
+            seq = write(''.join(chunk))
+            write(seq + 'N' * len(seq))
+            index.append((name, length, offset))
+
+        index_offset = out.tell()
+        for name, length, offset in index:
+            out.write('%s\t%d\t%d\n' % (name, length, offset))
+        out.write(struct.pack('<Q', index_offset))
+
+    os.rename(path + '.tmp', path)
+
+
+def open_genome(reference, verbose=True):
+    '''Returns a packed genome from a reference genome.
+
+    The reference can be a packed genome file or a FASTA file.
+    A packed genome is built next to the FASTA file the first time
+    and rebuilt if the FASTA file is modified.
+
+    '''
+    if is_packed(reference):
+        return PackedGenome(reference)
+
+    path = reference + EXTENSION
+    if (not os.path.exists(path) or
+            os.path.getmtime(path) < os.path.getmtime(reference)):
+        if verbose:
+            print >> sys.stderr, 'Packing %s to %s...' % (reference, path)
+        build(reference, path)
+
+    return PackedGenome(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] == '-h':
+        print >> sys.stderr, __doc__
+        raise SystemExit
+
+    fasta_file = sys.argv[1]
+    path = sys.argv[2] if len(sys.argv) > 2 else fasta_file + EXTENSION
+    build(fasta_file, path)
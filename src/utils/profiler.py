@@ -0,0 +1,134 @@
+'''The script records time, memory usage and counters of stages
+of a program and writes a report in JSON format.
+
+A stage is timed with
+
+    with profiler.stage('name'):
+        ...
+
+Stages can be nested and the time of a nested stage is included in
+its parent. Names are not derived from the parent; by convention
+callers give a nested stage the full name with its parent as a prefix,
+e.g. 'gene_models/collapse_exon'.
+
+A disabled profiler does nothing, so stages can be left in the code.
+
+'''
+
+import os
+import json
+import time
+import heapq
+import resource
+from contextlib import contextmanager
+
+
+def get_cpu_time():
+    '''Returns user and system CPU time of the process.'''
+
+    times = os.times()
+    return times[0] + times[1]
+
+
+def get_peak_rss(who=resource.RUSAGE_SELF):
+    '''Returns peak resident set size in kilobytes.'''
+
+    return resource.getrusage(who).ru_maxrss
+
+
+class Profiler(object):
+    '''Records wall and CPU time, peak RSS and calls of each stage,
+    counters and the slowest loci.
+
+    '''
+    def __init__(self, enabled=True, max_loci=20):
+        self.enabled = enabled
+        self.max_loci = max_loci
+        self.reset()
+
+    def reset(self):
+        self.stages = {}  # name -> [wall, cpu, calls, peak RSS]
+        self.counters = {}
+        self.loci = []  # heap of (seconds, number, locus)
+        self.children_rss = 0  # peak RSS of worker processes
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        wall = time.time()
+        cpu = get_cpu_time()
+        try:
+            yield
+        finally:
+            wall = time.time() - wall
+            cpu = get_cpu_time() - cpu
+            try:
+                stage = self.stages[name]
+            except KeyError:
+                stage = self.stages[name] = [0.0, 0.0, 0, 0]
+            stage[0] += wall
+            stage[1] += cpu
+            stage[2] += 1
+            stage[3] = max(stage[3], get_peak_rss())
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_locus(self, seconds, **locus):
+        '''Keeps a locus if it is one of the slowest loci.'''
+
+        if not self.enabled:
+            return
+        locus['seconds'] = seconds
+        item = (seconds, len(self.loci), locus)
+        if len(self.loci) < self.max_loci:
+            heapq.heappush(self.loci, item)
+        elif seconds > self.loci[0][0]:
+            heapq.heapreplace(self.loci, item)
+
+    def get_report(self):
+        stages = {}
+        for name, (wall, cpu, calls, peak_rss) in self.stages.iteritems():
+            stages[name] = {'wall_seconds': round(wall, 6),
+                            'cpu_seconds': round(cpu, 6),
+                            'calls': calls,
+                            'peak_rss_kb': peak_rss}
+
+        loci = [locus for seconds, n, locus in
+                    sorted(self.loci, key=lambda x: x[0], reverse=True)]
+        return {'stages': stages,
+                'counters': dict(self.counters),
+                'peak_rss_kb': get_peak_rss(),
+                'peak_rss_children_kb': max(self.children_rss,
+                                        get_peak_rss(resource.RUSAGE_CHILDREN)),
+                'slowest_loci': loci}
+
+    def merge(self, report):
+        '''Adds a report from another process.'''
+
+        for name, values in report['stages'].iteritems():
+            try:
+                stage = self.stages[name]
+            except KeyError:
+                stage = self.stages[name] = [0.0, 0.0, 0, 0]
+            stage[0] += values['wall_seconds']
+            stage[1] += values['cpu_seconds']
+            stage[2] += values['calls']
+            stage[3] = max(stage[3], values['peak_rss_kb'])
+
+        for name, n in report['counters'].iteritems():
+            self.count(name, n)
+
+        for locus in report['slowest_loci']:
+            locus = dict(locus)
+            self.add_locus(locus.pop('seconds'), **locus)
+
+        self.children_rss = max(self.children_rss, report['peak_rss_kb'])
+
+    def save(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.get_report(), fp, indent=2, sort_keys=True)
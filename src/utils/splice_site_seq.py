@@ -8,10 +8,13 @@ cat junctions.txt | sort -k 1 | uniq -c | awk '$1==1' > junctions.nr.txt
 
 Junctions without a transcriptional direction are ignored.
 
+The genome is a FASTA file or a packed genome (see packed_genome.py).
+
 '''
 
 import sys
-from pygr import seqdb
+
+from packed_genome import open_genome
 
 SEQLEN = 21  # number of nucleotides on each side of the splice junction.
 
@@ -95,7 +98,7 @@ def main():
     infile = sys.argv[1]
     refseq = sys.argv[2]
 
-    refseq = seqdb.SequenceFileDB(refseq)
+    refseq = open_genome(refseq)
     # op1 = open('donor_sites', 'w')
     # op2 = open('acceptor_sites', 'w')
     for n, intron in enumerate(parse_input(infile), start=1):
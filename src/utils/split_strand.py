@@ -1,20 +1,5 @@
-import string
-
-import networkx as nx
-
-table = string.maketrans('ACGT', 'TGCA')
-
-
-def get_splice_sites(genome, exon1, exon2):
-    chrom, pos = exon1.split(':')
-    start, end = [int(p) for p in pos.split('-')]
-    donor = genome[chrom][end:end + 2]
-
-    chrom, pos = exon2.split(':')
-    start, end = [int(p) for p in pos.split('-')]
-    acceptor = genome[chrom][start - 2:start]
-
-    return str(donor), str(acceptor)
+import os
+import cPickle
 
 
 def identify_strand(splice_sites):
@@ -30,12 +15,94 @@ def identify_strand(splice_sites):
         return 0
 
 
-def compare_edges(edge):
-    return int(edge[0].split(':')[1].split('-')[0])
+class SpliceSiteCache(object):
+    '''Caches splice sites and a strand of each junction.
 
+    A junction is identified by a chromosome, the end of an upstream
+    exon and the start of a downstream exon. Splice sites are read
+    from a genome in sorted order, one chromosome at a time.
 
-def split(graph, genome):
-    '''genome = pygr sequence DB object'''
+    If a path is given, junctions are loaded from and saved to
+    the file so that later runs can reuse them.
+
+    '''
+    def __init__(self, genome, path=None, reference=None):
+        self.genome = genome
+        self.path = path
+        self.junctions = {}  # chromosome -> packed (end, start) -> sites
+        self.updated = {}  # junctions not in the file
+        self.reference_stat = None
+        if reference:
+            stat = os.stat(reference)
+            self.reference_stat = (stat.st_size, stat.st_mtime)
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def fetch(self, chrom, junctions):
+        '''Looks up splice sites of (end, start) junctions that are not
+        in the cache.
+
+        '''
+        chrom_junctions = self.junctions.setdefault(chrom, {})
+        keys = set((end << 32) | start for end, start in junctions)
+        missing = sorted(keys.difference(chrom_junctions))
+        if not missing:
+            return
+
+        sequence = self.genome[chrom]
+        updated = self.updated.setdefault(chrom, {})
+        for key in missing:
+            end, start = key >> 32, key & 0xffffffff
+            donor = str(sequence[end:end + 2])
+            acceptor = str(sequence[start - 2:start])
+            sites = (donor, acceptor, identify_strand((donor, acceptor)))
+            chrom_junctions[key] = updated[key] = sites
+
+    def get(self, chrom, end, start):
+        '''Returns donor and acceptor sites and a strand of
+        a junction.
+
+        '''
+        try:
+            return self.junctions[chrom][(end << 32) | start]
+        except KeyError:
+            self.fetch(chrom, [(end, start)])
+            return self.junctions[chrom][(end << 32) | start]
+
+    def update(self, junctions):
+        '''Adds junctions found by another cache.'''
+
+        for chrom in junctions:
+            self.junctions.setdefault(chrom, {}).update(junctions[chrom])
+            self.updated.setdefault(chrom, {}).update(junctions[chrom])
+
+    def load(self, path):
+        with open(path, 'rb') as fp:
+            reference_stat, junctions = cPickle.load(fp)
+        if reference_stat == self.reference_stat:
+            self.junctions = junctions
+
+    def save(self, path=None):
+        '''Writes junctions to a file if new junctions are found.'''
+
+        path = path or self.path
+        if not path or not any(self.updated.itervalues()):
+            return
+        with open(path + '.tmp', 'wb') as fp:
+            cPickle.dump((self.reference_stat, self.junctions), fp,
+                            cPickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+        self.updated = {}
+
+
+def split(graph, splice_sites, exon_db):
+    '''splice_sites = SpliceSiteCache object
+
+    exon_db = exon objects indexed by nodes of the graph
+
+    '''
+    import networkx as nx
 
     class Edgeobj(object):
         def __init__(self, edge, ss, strand):
@@ -50,11 +117,19 @@ def split(graph, genome):
     neg_graph = nx.DiGraph(strand='-')  # a graph for negative strand
 
     strand_scores = []
+    def compare_edges(edge):
+        exon1, exon2 = exon_db[edge[0]], exon_db[edge[1]]
+        return exon1.start, exon1.end, exon2.start, exon2.end
+
     sorted_edges = sorted(graph.edges(), key=compare_edges)
-    for edge in sorted_edges:
-        splice_sites = get_splice_sites(genome, *edge)
-        strand = identify_strand(splice_sites)
-        edges[edge] = Edgeobj(edge, splice_sites, strand)
+    junctions = [(exon_db[u].end, exon_db[v].start) for u, v in sorted_edges]
+    if junctions:
+        chrom = exon_db[sorted_edges[0][0]].chrom
+        splice_sites.fetch(chrom, junctions)
+
+    for edge, junction in zip(sorted_edges, junctions):
+        donor, acceptor, strand = splice_sites.get(chrom, *junction)
+        edges[edge] = Edgeobj(edge, (donor, acceptor), strand)
         strand_scores.append(strand)
 
     score_matrix = [sum(strand_scores[0:3]) / 3.0]
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from utils import alignment_cache
+
+
+class TestAlignmentCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.dir, 'input.bed')
+        with open(self.input_file, 'w') as fp:
+            fp.write('chr1\t1000\t1300\ta\t0\t+\t1000\t1300\t0,0,0\t2\t'
+                        '100,100\t0,200\n')
+        self.path = self.input_file + alignment_cache.EXTENSION
+        self.chunks = [(['chr2', 'chr1', 'chr2'],
+                        numpy.array([2, 1, 1]),
+                        numpy.array([1000, 1200, 500, 3000]),
+                        numpy.array([1100, 1300, 600, 3100])),
+                        (['chr1'],
+                        numpy.array([3]),
+                        numpy.array([10, 20, 30]),
+                        numpy.array([15, 25, 35]))]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self):
+        writer = alignment_cache.Writer(self.input_file, self.path)
+        for chunk in self.chunks:
+            writer.write(*chunk)
+        writer.close()
+
+    def test_read(self):
+        self.write()
+        self.assertTrue(alignment_cache.is_valid(self.input_file, self.path))
+        chunks = list(alignment_cache.read(self.path))
+        self.assertEqual(len(chunks), len(self.chunks))
+        for chunk, expected in zip(chunks, self.chunks):
+            self.assertEqual(chunk[0], expected[0])
+            for array, expected_array in zip(chunk[1:], expected[1:]):
+                self.assertEqual(array.tolist(), expected_array.tolist())
+
+    def test_no_cache(self):
+        self.assertFalse(alignment_cache.is_valid(self.input_file,
+                                                    self.path))
+
+    def test_modified_input(self):
+        self.write()
+        with open(self.input_file, 'a') as fp:
+            fp.write('chr1\t10\t20\tb\t0\t+\t10\t20\t0,0,0\t1\t10\t0\n')
+        self.assertFalse(alignment_cache.is_valid(self.input_file,
+                                                    self.path))
+
+    def test_discard(self):
+        writer = alignment_cache.Writer(self.input_file, self.path)
+        writer.write(*self.chunks[0])
+        writer.discard()
+        self.assertEqual(os.listdir(self.dir), ['input.bed'])
+
+    def test_large_coordinates(self):
+        self.chunks = [(['chr1'],
+                        numpy.array([1]),
+                        numpy.array([2 ** 31 + 10]),
+                        numpy.array([2 ** 32 + 20]))]
+        self.write()
+        chunk = list(alignment_cache.read(self.path))[0]
+        self.assertEqual(chunk[2].tolist(), [2 ** 31 + 10])
+        self.assertEqual(chunk[3].tolist(), [2 ** 32 + 20])
@@ -0,0 +1,126 @@
+import os
+import gzip
+import tempfile
+import unittest
+
+from array import array
+
+from utils.bam_reader import add_blocks, detect_format, get_references
+from utils.bam_reader import read_chunks
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+
+class TestAddBlocks(unittest.TestCase):
+    def setUp(self):
+        self.starts = array('l')
+        self.ends = array('l')
+
+    def test_spliced(self):
+        '''5S 50M 200N 30M 10D 20M 3H'''
+        n = add_blocks(100, [(4, 5), (0, 50), (3, 200), (0, 30), (2, 10),
+                                (0, 20), (5, 3)], self.starts, self.ends)
+        self.assertEqual(n, 3)
+        self.assertEqual(zip(self.starts, self.ends),
+                            [(100, 150), (350, 380), (390, 410)])
+
+    def test_insertion(self):
+        '''Blocks separated by an insertion are joined: 20= 2I 10X'''
+        n = add_blocks(0, [(7, 20), (1, 2), (8, 10)], self.starts, self.ends)
+        self.assertEqual(n, 1)
+        self.assertEqual(zip(self.starts, self.ends), [(0, 30)])
+
+    def test_no_blocks(self):
+        self.assertEqual(add_blocks(0, [(4, 50)], self.starts, self.ends), 0)
+
+
+class TestDetectFormat(unittest.TestCase):
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def get_path(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.paths.append(path)
+        return path
+
+    def test_bam(self):
+        path = self.get_path()
+        fp = gzip.open(path, 'wb')
+        fp.write('BAM\x01')
+        fp.close()
+        self.assertEqual(detect_format(path), 'BAM')
+
+    def test_cram(self):
+        path = self.get_path()
+        with open(path, 'wb') as fp:
+            fp.write('CRAM\x03\x00')
+        self.assertEqual(detect_format(path), 'CRAM')
+
+    def test_text(self):
+        path = self.get_path()
+        with open(path, 'w') as fp:
+            fp.write('chr1\t0\t100\n')
+        self.assertEqual(detect_format(path), None)
+
+        fp = gzip.open(path, 'wb')
+        fp.write('chr1\t0\t100\n')
+        fp.close()
+        self.assertEqual(detect_format(path), None)
+
+
+@unittest.skipIf(pysam is None, 'pysam is not installed')
+class TestReadChunks(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.bam')
+        os.close(fd)
+        header = {'HD': {'VN': '1.0', 'SO': 'coordinate'},
+                    'SQ': [{'SN': 'chr1', 'LN': 10000},
+                            {'SN': 'chr2', 'LN': 10000}]}
+        bam = pysam.AlignmentFile(self.path, 'wb', header=header)
+        for name, tid, pos, cigar, flag in [
+                ('a', 0, 100, [(0, 50), (3, 200), (0, 50)], 0),
+                ('b', 0, 120, [(0, 30)], 0x100),
+                ('c', 0, 200, None, 0),
+                ('d', 1, 500, [(0, 40), (3, 100), (0, 40)], 0)]:
+            read = pysam.AlignedSegment()
+            read.query_name = name
+            read.reference_id = tid
+            read.reference_start = pos
+            read.cigartuples = cigar
+            read.flag = flag
+            read.query_sequence = 'A' * sum(l for op, l in cigar or []
+                                            if op == 0)
+            bam.write(read)
+        bam.close()
+        pysam.index(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+        os.remove(self.path + '.bai')
+
+    def test_read_chunks(self):
+        chunks = list(read_chunks(self.path, chunk_size=1))
+        self.assertEqual([(chroms, counts.tolist(), starts.tolist(),
+                            ends.tolist())
+                            for chroms, counts, starts, ends in chunks],
+                        [(['chr1'], [2], [100, 350], [150, 400]),
+                            (['chr2'], [2], [500, 640], [540, 680])])
+
+    def test_region(self):
+        chunks = list(read_chunks(self.path, 'chr2'))
+        self.assertEqual(chunks[0][0], ['chr2'])
+
+    def test_get_references(self):
+        self.assertEqual(get_references(self.path), ['chr1', 'chr2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import networkx as nx
+
+from utils.get_min_isoforms import get_min_paths, get_greedy_paths
+from utils.get_min_isoforms import max_matching, sort_nodes
+
+
+def get_edges(paths):
+    edges = set()
+    for path in paths:
+        edges.update(zip(path[:-1], path[1:]))
+    return edges
+
+
+class TestMaxMatching(unittest.TestCase):
+    def test_max_matching(self):
+        '''greedy matching 0-0 must be augmented to 0-1, 1-0.'''
+        match = max_matching([[0, 1], [0]], 2)
+        self.assertEqual(match, [1, 0])
+
+    def test_no_edges(self):
+        self.assertEqual(max_matching([[], []], 2), [-1, -1])
+
+
+class TestGetMinPaths(unittest.TestCase):
+    def setUp(self):
+        '''A gene with three cassette exons (B, D and F)
+        has eight maximum isoforms.
+
+        '''
+        self.graph = nx.DiGraph()
+        self.graph.add_path(['Start', 'A', 'B', 'C', 'D',
+                                'E', 'F', 'G', 'End'])
+        self.graph.add_edge('A', 'C')
+        self.graph.add_edge('C', 'E')
+        self.graph.add_edge('E', 'G')
+
+    def test_cover_all_edges(self):
+        paths = get_min_paths(self.graph, False)
+        g = self.graph.copy()
+        g.remove_nodes_from(['Start', 'End'])
+        self.assertEqual(get_edges(paths), set(g.edges()))
+
+    def test_min_paths(self):
+        paths = get_min_paths(self.graph, False)
+        self.assertEqual(len(paths), 2)
+        for path in paths:
+            self.assertEqual(path[0], 'A')
+            self.assertEqual(path[-1], 'G')
+
+    def test_stats(self):
+        stats = {}
+        get_min_paths(self.graph, False, stats)
+        self.assertEqual(stats['rounds'], 2)
+
+    def test_integer_nodes(self):
+        graph = nx.relabel_nodes(self.graph,
+                dict((n, i) for i, n in enumerate('ABCDEFG')))
+        paths = get_min_paths(graph, False)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(get_edges(paths),
+                set(graph.subgraph(range(7)).edges()))
+
+    def test_deadline(self):
+        '''Edges are covered greedily after the deadline.'''
+        stats = {}
+        paths = get_min_paths(self.graph, False, stats, deadline=0)
+        self.assertTrue(stats['timeout'])
+        self.assertEqual(stats['rounds'], 0)
+        g = self.graph.copy()
+        g.remove_nodes_from(['Start', 'End'])
+        self.assertEqual(get_edges(paths), set(g.edges()))
+
+
+class TestNodeOrder(unittest.TestCase):
+    '''Exons 0 and 1 are joined to exon 2 and then to exons 3 or 4,
+    so 0-2-3, 1-2-4 and 0-2-4, 1-2-3 are both minimal.
+
+    '''
+    def get_graph(self, edges):
+        graph = nx.DiGraph()
+        for u, v in edges:
+            graph.add_edge(u, v)
+        return graph
+
+    def setUp(self):
+        self.edges = [('Start', 0), ('Start', 1), (0, 2), (1, 2),
+                        (2, 3), (2, 4), (3, 'End'), (4, 'End')]
+        self.positions = {0: (100, 200), 1: (150, 200), 2: (300, 400),
+                            3: (500, 600), 4: (500, 650)}
+
+    def test_sort_nodes(self):
+        graph = self.get_graph(self.edges)
+        self.assertEqual(sort_nodes(graph), ['Start', 0, 1, 2, 3, 4, 'End'])
+        self.assertEqual(sort_nodes(graph, key=lambda x: -x),
+                            ['Start', 1, 0, 2, 4, 3, 'End'])
+
+    def test_min_paths(self):
+        '''Paths depend on positions of exons, not on their IDs
+        or the order they were added.
+
+        '''
+        for edges in (self.edges, self.edges[::-1]):
+            graph = self.get_graph(edges)
+            self.assertEqual(get_min_paths(graph, False,
+                                key=self.positions.get),
+                            [[0, 2, 3], [1, 2, 4]])
+
+        relabel = {0: 4, 1: 3, 2: 2, 3: 1, 4: 0}
+        graph = nx.relabel_nodes(self.get_graph(self.edges), relabel)
+        positions = dict((relabel[e], p)
+                            for e, p in self.positions.iteritems())
+        self.assertEqual(get_min_paths(graph, False, key=positions.get),
+                            [[4, 2, 1], [3, 2, 0]])
+
+    def test_greedy_paths(self):
+        for edges in (self.edges, self.edges[::-1]):
+            graph = self.get_graph(edges)
+            self.assertEqual(get_greedy_paths(graph,
+                                key=self.positions.get),
+                            [[0, 2, 3], [1, 2, 4]])
+
+
+class TestGetGreedyPaths(unittest.TestCase):
+    def test_cover_all_edges(self):
+        graph = nx.DiGraph()
+        graph.add_path(['Start', 'A', 'B', 'C', 'D', 'End'])
+        graph.add_path(['Start', 'E', 'C'])
+        graph.add_edge('A', 'C')
+        graph.add_edge('B', 'End')
+        paths = get_greedy_paths(graph)
+        self.assertEqual(get_edges(paths),
+                set(graph.subgraph('ABCDE').edges()))
+        for path in paths:
+            self.assertTrue(graph.has_edge('Start', path[0]))
+            self.assertTrue(graph.has_edge(path[-1], 'End'))
+
+    def test_given_edges(self):
+        graph = nx.DiGraph()
+        graph.add_path(['Start', 'A', 'B', 'C', 'End'])
+        graph.add_edge('A', 'C')
+        self.assertEqual(get_greedy_paths(graph, [('A', 'C')]),
+                            [['A', 'C']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,14 @@
 
 import sys
 import os
+import shutil
+import subprocess
+import tempfile
 
 from unittest import TestCase
+from cStringIO import StringIO
 import unittest
+import numpy
 import networkx as nx
 
 source_path = os.path.abspath('src')
@@ -12,6 +17,12 @@ if source_path not in sys.path:
     sys.path.append(os.path.abspath('src'))
 
 import gimme
+from utils.interval_index import IntervalIndex
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
 
 
 class TestCollapseExons(TestCase):
@@ -23,8 +34,8 @@ class TestCollapseExons(TestCase):
 
         while n < 7:
             e = gimme.ExonObj('chr1', start, start + 100)
-            self.align_db.exon_db[str(e)] = e
-            exons.append(str(e))
+            self.align_db.intern_exon(e)
+            exons.append(e.id)
             start += 300
             n += 1
 
@@ -34,18 +45,33 @@ class TestCollapseExons(TestCase):
         self.exon_graph = nx.DiGraph()
         self.exon_graph.add_path(exons)
 
+    def exon_id(self, name):
+        '''Returns an ID of an exon from its coordinate.'''
+        for exon in self.align_db.exon_db:
+            if str(exon) == name:
+                return exon.id
+
+    def node_names(self):
+        exon_db = self.align_db.exon_db
+        return [str(exon_db[n]) for n in self.exon_graph.nodes()]
+
+    def edge_names(self):
+        exon_db = self.align_db.exon_db
+        return [(str(exon_db[u]), str(exon_db[v]))
+                    for u, v in self.exon_graph.edges()]
+
     def test_building_base_exon_db_and_exon_graph(self):
         self.assertEqual(len(self.align_db.exon_db), 6)
         self.assertEqual(len(self.exon_graph.nodes()), 6)
         self.assertEqual(len(self.exon_graph.edges()), 5)
-        self.assertItemsEqual(self.exon_graph.nodes(), ['chr1:1000-1100',
+        self.assertItemsEqual(self.node_names(), ['chr1:1000-1100',
                                                     'chr1:1300-1400',
                                                     'chr1:1600-1700',
                                                     'chr1:1900-2000',
                                                     'chr1:2200-2300',
                                                     'chr1:2500-2600'])
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
                     ('chr1:1600-1700', 'chr1:1900-2000'),
@@ -65,8 +91,8 @@ class TestCollapseExons(TestCase):
 
         e = gimme.ExonObj('chr1', 1050, 1100)
         e.terminal = 1
-        self.align_db.exon_db[str(e)] = e
-        self.exon_graph.add_edge(str(e), 'chr1:1300-1400')
+        self.align_db.intern_exon(e)
+        self.exon_graph.add_edge(e.id, self.exon_id('chr1:1300-1400'))
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
@@ -88,8 +114,8 @@ class TestCollapseExons(TestCase):
 
         e = gimme.ExonObj('chr1', 2500, 2550)
         e.terminal = 2
-        self.align_db.exon_db[str(e)] = e
-        self.exon_graph.add_edge('chr1:2200-2300', str(e))
+        self.align_db.intern_exon(e)
+        self.exon_graph.add_edge(self.exon_id('chr1:2200-2300'), e.id)
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
@@ -111,12 +137,12 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 700, 800)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 900, 1100)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.align_db.intern_exon(e2)
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -126,7 +152,7 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:700-800', 'chr1:900-1100'),
                     ('chr1:900-1100', 'chr1:1300-1400'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
@@ -147,12 +173,12 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 2550, 2600)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 2800, 2900)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.align_db.intern_exon(e2)
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -162,7 +188,7 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
                     ('chr1:1600-1700', 'chr1:1900-2000'),
@@ -185,12 +211,12 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1900, 2000)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 2500, 2550)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.align_db.intern_exon(e2)
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -206,7 +232,7 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.nodes()), 6)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
                     ('chr1:1600-1700', 'chr1:1900-2000'),
@@ -229,12 +255,12 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1050, 1100)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1700)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.align_db.intern_exon(e2)
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -244,7 +270,7 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.nodes()), 6)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1000-1100', 'chr1:1600-1700'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
@@ -267,17 +293,17 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1050, 1100)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1700)
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 1900, 1950)
         e3.terminal = 2
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -287,7 +313,7 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.nodes()), 6)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1000-1100', 'chr1:1600-1700'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
@@ -310,17 +336,17 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1190, 1400)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1700)
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 1900, 1950)
         e3.terminal = 2
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -329,7 +355,7 @@ class TestCollapseExons(TestCase):
 
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1190-1400', 'chr1:1600-1700'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
@@ -351,17 +377,17 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1250, 1400)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1700)
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 1900, 1950)
         e3.terminal = 2
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -385,17 +411,17 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1050, 1100)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1300, 1400)
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 1600, 1850)
         e3.terminal = 2
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -405,7 +431,7 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.nodes()), 7)
         self.assertEqual(len(self.exon_graph.edges()), 6)
 
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
                     ('chr1:1300-1400', 'chr1:1600-1850'),
@@ -428,13 +454,13 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1150, 1400)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1850)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -443,7 +469,7 @@ class TestCollapseExons(TestCase):
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 6)
-        self.assertItemsEqual(self.exon_graph.edges(),
+        self.assertItemsEqual(self.edge_names(),
                 [('chr1:1000-1100', 'chr1:1300-1400'),
                     ('chr1:1300-1400', 'chr1:1600-1700'),
                     ('chr1:1150-1400', 'chr1:1600-1850'),
@@ -465,13 +491,13 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1250, 1400)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1750)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -494,17 +520,17 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1050, 1100)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1300, 1400)
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 1600, 1750)
         e3.terminal = 2
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -527,13 +553,13 @@ class TestCollapseExons(TestCase):
 
         e1 = gimme.ExonObj('chr1', 1350, 1400)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1600, 1650)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
+        self.exon_graph.add_edge(e1.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 6)
@@ -557,22 +583,22 @@ class TestCollapseExons(TestCase):
         '''
         e1 = gimme.ExonObj('chr1', 990, 1010)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 1300, 1400)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 950, 1100)
         e3.terminal = 1
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
         e4 = gimme.ExonObj('chr1', 1030, 1040)
-        self.align_db.exon_db[str(e4)] = e4
+        self.align_db.intern_exon(e4)
 
-        self.exon_graph.add_edge(str(e1), str(e4))
-        self.exon_graph.add_edge(str(e3), str(e2))
-        self.exon_graph.add_edge(str(e4), str(e2))
+        self.exon_graph.add_edge(e1.id, e4.id)
+        self.exon_graph.add_edge(e3.id, e2.id)
+        self.exon_graph.add_edge(e4.id, e2.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 9)
         self.assertEqual(len(self.exon_graph.edges()), 8)
@@ -594,18 +620,18 @@ class TestCollapseExons(TestCase):
         '''
         e1 = gimme.ExonObj('chr1', 2510, 2520)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 2530, 2600)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 2700, 2800)
         e3.terminal = 1
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 9)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -627,18 +653,18 @@ class TestCollapseExons(TestCase):
         '''
         e1 = gimme.ExonObj('chr1', 2400, 2450)
         e1.terminal = 1
-        self.align_db.exon_db[str(e1)] = e1
+        self.align_db.intern_exon(e1)
 
         e2 = gimme.ExonObj('chr1', 2500, 2600)
         e2.terminal = 2
-        self.align_db.exon_db[str(e2)] = e2
+        self.align_db.intern_exon(e2)
 
         e3 = gimme.ExonObj('chr1', 2700, 2800)
         e3.terminal = 1
-        self.align_db.exon_db[str(e3)] = e3
+        self.align_db.intern_exon(e3)
 
-        self.exon_graph.add_edge(str(e1), str(e2))
-        self.exon_graph.add_edge(str(e2), str(e3))
+        self.exon_graph.add_edge(e1.id, e2.id)
+        self.exon_graph.add_edge(e2.id, e3.id)
 
         self.assertEqual(len(self.exon_graph.nodes()), 8)
         self.assertEqual(len(self.exon_graph.edges()), 7)
@@ -649,6 +675,45 @@ class TestCollapseExons(TestCase):
         self.assertEqual(len(self.exon_graph.edges()), 7)
 
 
+class TestExonGraph(TestCase):
+    def setUp(self):
+        '''
+            |===|------|=====|------|===|
+                       |===|--------|===|
+                    |=====|---------|===|
+
+        '''
+        self.align_db = gimme.AlignmentDB()
+        self.exons = []
+        for start, end in [(100, 200), (300, 400), (300, 350),
+                            (280, 350), (500, 600)]:
+            exon = gimme.ExonObj('chr1', start, end)
+            self.align_db.intern_exon(exon)
+            self.exons.append(exon.id)
+        a, b, c, d, e = self.exons
+        self.edges = [(a, b), (b, e), (c, e), (d, e)]
+
+    def test_numbering(self):
+        graph = gimme.ExonGraph(self.align_db.exon_db, self.edges)
+        self.assertEqual(graph.starts, [100, 280, 300, 300, 500])
+        self.assertEqual(graph.ends, [200, 350, 350, 400, 600])
+        self.assertEqual([graph.ends[i] for i in graph.by_end],
+                            [200, 350, 350, 400, 600])
+        self.assertItemsEqual(graph.edges(), self.edges)
+
+    def test_subgraph(self):
+        '''Terminals of a subgraph are marked by its edges.'''
+
+        graph = gimme.ExonGraph(self.align_db.exon_db, self.edges)
+        a, b, c, d, e = self.exons
+        subgraph = graph.subgraph([(c, e), (d, e)])
+        self.assertTrue(subgraph.starts is graph.starts)
+        self.assertItemsEqual(subgraph.nodes(), [c, d, e])
+        subgraph.collapse(gimme.min_utr)
+        self.assertItemsEqual(subgraph.edges(), [(d, e)])
+        self.assertItemsEqual(graph.edges(), self.edges)
+
+
 class TestAddIntrons(TestCase):
     def setUp(self):
         self.align_db = gimme.AlignmentDB()
@@ -666,104 +731,228 @@ class TestAddIntrons(TestCase):
         self.exons[-1].terminal = 2  # mark a right terminal
 
     def test_simple(self):
-        gimme.add_intron(self.exons, self.align_db, {}, 0)
+        gimme.add_intron(self.exons, self.align_db)
 
         self.assertEqual(len(self.align_db.intron_db), 5)
+        self.assertEqual(len(self.align_db.intron_db.get_components()), 1)
+
+    def test_merge_components(self):
+        exons1 = [gimme.ExonObj('chr1', 1000, 1100),
+                    gimme.ExonObj('chr1', 1300, 1400)]
+        exons2 = [gimme.ExonObj('chr1', 1300, 1400),
+                    gimme.ExonObj('chr1', 1600, 1700)]
+        exons3 = [gimme.ExonObj('chr1', 5000, 5100),
+                    gimme.ExonObj('chr1', 5300, 5400)]
+        for exons in (exons1, exons2, exons3):
+            gimme.add_intron(exons, self.align_db)
+        self.assertEqual(len(self.align_db.intron_db.get_components()), 3)
+
+        gimme.add_intron(self.exons[:3], self.align_db)
+        self.assertItemsEqual(self.align_db.intron_db.get_components(),
+                                [[0, 1], [2]])
+
+    def test_merge_components_by_exon(self):
+        exons1 = [gimme.ExonObj('chr1', 1000, 1100),
+                    gimme.ExonObj('chr1', 1300, 1400)]
+        exons2 = [gimme.ExonObj('chr1', 1300, 1400),
+                    gimme.ExonObj('chr1', 1600, 1700)]
+        for exons in (exons1, exons2):
+            gimme.add_exon(self.align_db, exons)
+            gimme.add_intron(exons, self.align_db)
+        self.assertEqual(len(self.align_db.intron_db.get_components()), 1)
+
+    def test_changed_introns(self):
+        def add(start, end):
+            exons = [gimme.ExonObj('chr1', start, 1100),
+                        gimme.ExonObj('chr1', 1300, end)]
+            gimme.add_exon(self.align_db, exons)
+            gimme.add_intron(exons, self.align_db)
+
+        add(1000, 1400)
+        self.assertEqual(self.align_db.intron_db.changed, set([0]))
+
+        self.align_db.intron_db.changed = set()
+        add(1000, 1400)  # the same alignment
+        self.assertEqual(self.align_db.intron_db.changed, set())
+
+        add(1000, 1500)  # a new pair of exons
+        self.assertEqual(self.align_db.intron_db.changed, set([0]))
+
+        self.align_db.intron_db.changed = set()
+        gimme.add_exon(self.align_db, [gimme.ExonObj('chr1', 500, 600),
+                                        gimme.ExonObj('chr1', 1000, 1100),
+                                        gimme.ExonObj('chr1', 1300, 1400)])
+        self.assertEqual(self.align_db.intron_db.changed, set([0]))
+
+
+class TestCountPaths(TestCase):
+    def setUp(self):
+        '''
+            Start-|A|--|B|--|C|--|D|-End
+                   |----------|  |
+                   |---------------|
+
+        '''
+        self.graph = nx.DiGraph()
+        self.graph.add_path(['Start', 'A', 'B', 'C', 'D', 'End'])
+        self.graph.add_edge('A', 'C')
+        self.graph.add_edge('A', 'D')
+
+    def test_count_paths(self):
+        self.assertEqual(gimme.count_paths(self.graph), 3)
+        self.assertEqual(gimme.count_paths(self.graph),
+                len(list(nx.all_simple_paths(self.graph, 'Start', 'End'))))
+
+    def test_count_paths_limit(self):
+        self.assertEqual(gimme.count_paths(self.graph, limit=1), 2)
+        self.assertEqual(gimme.count_paths(self.graph, limit=3), 3)
+
+    def test_count_paths_combinatorial(self):
+        graph = nx.DiGraph()
+        nodes = ['Start'] + range(60) + ['End']
+        graph.add_path(nodes)
+        for i in range(1, len(nodes) - 2):
+            graph.add_edge(nodes[i - 1], nodes[i + 1])
+        self.assertEqual(gimme.count_paths(graph, limit=20), 21)
+        self.assertTrue(gimme.count_paths(graph) > 2 ** 40)
+
+
+class TestRemoveRedundantExon(TestCase):
+    def test_remove_redundant_exon(self):
+        '''Single exons within an exon or extending beyond it by less
+        than min_utr are removed.
+
+        '''
+        singles = (IntervalIndex([100, 250, 400, 1000, 2000, 3000],
+                                    [200, 380, 700, 1150, 2100, 3500]),
+                    numpy.zeros(6, dtype=bool))
+        exons = [gimme.ExonObj('chr1', start, end) for start, end in
+                        [(3100, 3200), (1050, 1200), (90, 300),
+                            (350, 500), (390, 800)]]
+        gimme.remove_redundant_exon(exons, singles)
+        self.assertEqual(singles[1].tolist(),
+                            [True, True, True, True, False, False])
+
+    def test_no_overlaps(self):
+        singles = (IntervalIndex([100], [200]), numpy.zeros(1, dtype=bool))
+        gimme.remove_redundant_exon([gimme.ExonObj('chr1', 200, 300),
+                                    gimme.ExonObj('chr1', 0, 100)], singles)
+        self.assertFalse(singles[1][0])
+
+
+class TestGetPaths(TestCase):
+    def setUp(self):
+        '''A gene with 12 cassette exons has 4096 isoforms.'''
+
+        self.graph = nx.DiGraph()
+        nodes = range(25)
+        self.graph.add_path(['Start'] + nodes + ['End'])
+        for i in range(1, 25, 2):
+            self.graph.add_edge(i - 1, i + 1)
+
+    def test_within_budget(self):
+        config = gimme.Config(find_max=True)
+        paths, reason = gimme.get_paths(self.graph, config)
+        self.assertEqual(len(paths), 4096)
+        self.assertEqual(reason, None)
+
+    def test_max_paths(self):
+        config = gimme.Config(find_max=True, max_paths=1000)
+        paths, reason = gimme.get_paths(self.graph, config)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(reason, 'paths')
+
+    def test_max_gene_edges(self):
+        config = gimme.Config(max_gene_edges=20)
+        paths, reason = gimme.get_paths(self.graph, config)
+        self.assertEqual(reason, 'edges')
+        edges = set()
+        for path in paths:
+            edges.update(zip(path[:-1], path[1:]))
+        self.assertEqual(edges, set(self.graph.subgraph(range(25)).edges()))
+
+    def test_max_gene_seconds(self):
+        config = gimme.Config(find_max=True, max_gene_seconds=1e-9)
+        paths, reason = gimme.get_paths(self.graph, config)
+        self.assertEqual(reason, 'time')
+        self.assertTrue(len(paths) < 4096)
+
+    def test_invalid_budget(self):
+        self.assertRaises(ValueError, gimme.Config, max_paths=-1)
 
 
 class TestMergeExons(TestCase):
     def setUp(self):
         self.align_db = gimme.AlignmentDB()
-        self.align_db.single_exons_db = {'chr1': []}
-        self.e1 = gimme.ExonObj('chr1', 1000, 2000)
-        self.e2 = gimme.ExonObj('chr1', 3000, 4000)
-        self.e3 = gimme.ExonObj('chr1', 5000, 6000)
-        self.e4 = gimme.ExonObj('chr1', 7000, 8000)
-
-        self.align_db.single_exons_db['chr1'].append(self.e1)
-        self.align_db.single_exons_db['chr1'].append(self.e2)
-        self.align_db.single_exons_db['chr1'].append(self.e3)
-        self.align_db.single_exons_db['chr1'].append(self.e4)
-
-    def print_items(self, items):
-        for e in items['chr1']:
-            print >> sys.stderr, e,
-        print >> sys.stderr, ''
+        for start, end in [(1000, 2000), (3000, 4000),
+                            (5000, 6000), (7000, 8000)]:
+            self.align_db.add_single_exon('chr1', start, end)
 
-    def test_no_merge_single_exons(self):
-        self.align_db.single_exons_db = {'chr1': []}
-        self.align_db.single_exons_db['chr1'].append(self.e1)
-        self.merged_exons = gimme.merge_exon(self.align_db)
+    def get_merged_exons(self):
+        starts, ends = gimme.merge_exon(self.align_db)['chr1']
+        return zip(starts.tolist(), ends.tolist())
 
-        self.assertEqual(len(self.merged_exons['chr1']), 1)
+    def test_no_merge_single_exons(self):
+        self.align_db = gimme.AlignmentDB()
+        self.align_db.add_single_exon('chr1', 1000, 2000)
+        self.assertEqual(self.get_merged_exons(), [(1000, 2000)])
 
     def test_no_merge_multiple_exons(self):
-        self.merged_exons = gimme.merge_exon(self.align_db)
-
-        self.assertEqual(len(self.merged_exons['chr1']), 4)
+        self.assertEqual(len(self.get_merged_exons()), 4)
 
     def test_subset_merge(self):
-        self.e5 = gimme.ExonObj('chr1', 1100, 1800)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
-
-        self.assertEqual(len(self.merged_exons['chr1']), 4)
+        self.align_db.add_single_exon('chr1', 1100, 1800)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 4)
+        self.assertEqual(merged_exons[0], (1000, 2000))
 
     def test_extend_front(self):
-        self.e5 = gimme.ExonObj('chr1', 500, 1800)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
-
-        self.assertEqual(len(self.merged_exons['chr1']), 4)
+        self.align_db.add_single_exon('chr1', 500, 1800)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 4)
+        self.assertEqual(merged_exons[0], (500, 2000))
 
     def test_extend_back_first(self):
-        self.e5 = gimme.ExonObj('chr1', 1100, 2200)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-        self.merged_exons = gimme.merge_exon(self.align_db)
-
-        self.assertEqual(len(self.merged_exons['chr1']), 4)
+        self.align_db.add_single_exon('chr1', 1100, 2200)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 4)
+        self.assertEqual(merged_exons[0], (1000, 2200))
 
     def test_extend_back_last(self):
-        self.e5 = gimme.ExonObj('chr1', 7100, 8200)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
-        self.assertEqual(len(self.merged_exons['chr1']), 4)
+        self.align_db.add_single_exon('chr1', 7100, 8200)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 4)
+        self.assertEqual(merged_exons[-1], (7000, 8200))
 
     def test_extend_back_first_last(self):
-        self.e5 = gimme.ExonObj('chr1', 7100, 8200)
-        self.e6 = gimme.ExonObj('chr1', 1100, 2200)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-        self.align_db.single_exons_db['chr1'].append(self.e6)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
-        self.assertEqual(len(self.merged_exons['chr1']), 4)
+        self.align_db.add_single_exon('chr1', 7100, 8200)
+        self.align_db.add_single_exon('chr1', 1100, 2200)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 4)
+        self.assertEqual(merged_exons[0], (1000, 2200))
+        self.assertEqual(merged_exons[-1], (7000, 8200))
 
     def test_single_merge(self):
-        self.e5 = gimme.ExonObj('chr1', 500, 8200)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
-
-        self.assertEqual(len(self.merged_exons['chr1']), 1)
+        self.align_db.add_single_exon('chr1', 500, 8200)
+        self.assertEqual(self.get_merged_exons(), [(500, 8200)])
 
     def test_merge_two_exons(self):
-        self.e5 = gimme.ExonObj('chr1', 1300, 3200)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
-
-        self.assertEqual(len(self.merged_exons['chr1']), 3)
+        self.align_db.add_single_exon('chr1', 1300, 3200)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 3)
+        self.assertEqual(merged_exons[0], (1000, 4000))
 
     def test_merge_two_exons_extend(self):
-        self.e5 = gimme.ExonObj('chr1', 1300, 4200)
-        self.align_db.single_exons_db['chr1'].append(self.e5)
-
-        self.merged_exons = gimme.merge_exon(self.align_db)
+        self.align_db.add_single_exon('chr1', 1300, 4200)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 3)
+        self.assertEqual(merged_exons[0], (1000, 4200))
 
-        self.assertEqual(len(self.merged_exons['chr1']), 3)
+    def test_merge_adjacent_exons(self):
+        self.align_db.add_single_exon('chr1', 2000, 2500)
+        merged_exons = self.get_merged_exons()
+        self.assertEqual(len(merged_exons), 4)
+        self.assertEqual(merged_exons[0], (1000, 2500))
 
 
 class TestSplitExonGroups(TestCase):
@@ -778,21 +967,27 @@ class TestSplitExonGroups(TestCase):
         self.exons.append(e1)
         self.exons.append(e2)
 
+    def split(self):
+        '''Returns exon groups of an alignment of self.exons.'''
+
+        config = gimme.Config(max_intron=TestSplitExonGroups.max_intron)
+        starts = numpy.array([exon.start for exon in self.exons])
+        ends = numpy.array([exon.end for exon in self.exons])
+        return next(gimme.get_exon_groups(['chr1'],
+                                            numpy.array([len(self.exons)]),
+                                            starts, ends, config=config))
+
     def test_no_split_one_exon(self):
         self.exons = []
         e1 = gimme.ExonObj('chr1', 1000, 1100)
 
         self.exons.append(e1)
 
-        split = gimme.remove_large_intron(self.exons,
-                                            TestSplitExonGroups.max_intron,
-                                        )
+        split = self.split()
         self.assertEqual(len(split), 1)
 
     def test_no_split_two_exons(self):
-        split = gimme.remove_large_intron(self.exons,
-                                            TestSplitExonGroups.max_intron,
-                                        )
+        split = self.split()
         self.assertEqual(len(split), 1)
 
     def test_split_one_two_exons(self):
@@ -803,9 +998,7 @@ class TestSplitExonGroups(TestCase):
         self.exons.append(e1)
         self.exons.append(e2)
 
-        split = gimme.remove_large_intron(self.exons,
-                                            TestSplitExonGroups.max_intron,
-                                        )
+        split = self.split()
         self.assertEqual(len(split), 2)
 
     def test_split_one_back(self):
@@ -813,9 +1006,7 @@ class TestSplitExonGroups(TestCase):
 
         self.exons.append(e3)
 
-        split = gimme.remove_large_intron(self.exons,
-                                            TestSplitExonGroups.max_intron,
-                                        )
+        split = self.split()
         self.assertEqual(len(split), 2)
 
     def test_split_one_front(self):
@@ -823,9 +1014,7 @@ class TestSplitExonGroups(TestCase):
 
         self.exons.insert(0, e3)
 
-        split = gimme.remove_large_intron(self.exons,
-                                            TestSplitExonGroups.max_intron,
-                                        )
+        split = self.split()
         self.assertEqual(len(split), 2)
 
     def test_split_two(self):
@@ -836,10 +1025,526 @@ class TestSplitExonGroups(TestCase):
 
         self.exons += [e3, e4, e5, e6]
 
-        split = gimme.remove_large_intron(self.exons,
-                                            TestSplitExonGroups.max_intron,
-                                        )
+        split = self.split()
         self.assertEqual(len(split), 3)
 
+
+class TestParseAlignments(TestCase):
+    def setUp(self):
+        self.config = gimme.Config(gap_size=10, max_intron=500)
+
+        self.bed = ['chr1\t1000\t2400\ta\t0\t+\t1000\t2400\t0,0,0\t4\t'
+                        '100,95,100,100\t0,105,300,1300\n',
+                    'chr2\t50\t150\tb\t0\t+\t50\t150\t0,0,0\t1\t100,\t0,\n',
+                    'track name=empty\n']
+        self.psl = ['100\t0\t0\t0\t0\t0\t0\t0\t+\ta\t400\t0\t395\tchr1\t'
+                        '5000\t1000\t2400\t4\t100,95,100,100,\t'
+                        '0,100,195,295,\t1000,1105,1300,2300,\n',
+                    'psLayout version 3\n']
+
+    def get_coords(self, alignments):
+        return [[[(e.chrom, e.start, e.end) for e in group]
+                    for group in groups] for groups in alignments]
+
+    def parse(self, parse_chunk, lines):
+        chunk = parse_chunk(lines)
+        return self.get_coords(gimme.get_exon_groups(*chunk,
+                                                        config=self.config))
+
+    def test_parse_bed(self):
+        alignments = self.parse(gimme.parse_bed_chunk, self.bed)
+        self.assertEqual(alignments,
+                            [[[('chr1', 1000, 1200), ('chr1', 1300, 1400)],
+                                [('chr1', 2300, 2400)]],
+                            [[('chr2', 50, 150)]]])
+
+    def test_parse_psl(self):
+        alignments = self.parse(gimme.parse_psl_chunk, self.psl)
+        self.assertEqual(alignments,
+                            [[[('chr1', 1000, 1200), ('chr1', 1300, 1400)],
+                                [('chr1', 2300, 2400)]]])
+
+    def test_duplicate_chains(self):
+        chain_counts = {}
+        chunk = gimme.parse_bed_chunk(self.bed * 2)
+        alignments = self.get_coords(gimme.get_exon_groups(*chunk,
+                                            chain_counts=chain_counts,
+                                            config=self.config))
+        self.assertEqual(alignments,
+                            [[[('chr1', 1000, 1200), ('chr1', 1300, 1400)],
+                                [('chr1', 2300, 2400)]],
+                            [[('chr2', 50, 150)]]])
+        self.assertEqual(chain_counts,
+                            {('chr1', 1000, 1200, 1300, 1400): 2,
+                            ('chr1', 2300, 2400): 2,
+                            ('chr2', 50, 150): 2})
+
+        exons = [gimme.ExonObj('chr2', 50, 150)]
+        self.assertTrue(gimme.get_chain_key(exons) in chain_counts)
+
+    def test_skipped_rows(self):
+        '''Rows with fewer than 12 columns are reported like
+        invalid PSL rows.
+
+        '''
+        stderr = gimme.stderr
+        gimme.stderr = StringIO()
+        try:
+            chunk = gimme.parse_bed_chunk(['chr1\t100\t200\n', self.bed[0]])
+            skipped = gimme.stderr.getvalue()
+        finally:
+            gimme.stderr = stderr
+        self.assertEqual(list(chunk[0]), ['chr1'])
+        self.assertEqual(list(chunk[1]), [4])
+        self.assertEqual(skipped, 'Skipped: chr1\t100\t200\n')
+
+    def test_chunks(self):
+        alignments = list(gimme.read_chunks(self.bed * 3, chunk_size=2))
+        self.assertEqual([len(lines) for lines in alignments], [2, 2, 2, 2, 1])
+
+
+class TestAddChains(TestCase):
+    def setUp(self):
+        '''The second file repeats an alignment of the first file.'''
+
+        self.config = gimme.Config(gap_size=10, max_intron=500)
+        lines = ['chr1\t1000\t2400\ta\t0\t+\t1000\t2400\t0,0,0\t4\t'
+                    '100,95,100,100\t0,105,300,1300\n',
+                'chr1\t1300\t1600\tb\t0\t+\t1300\t1600\t0,0,0\t2\t'
+                    '100,100\t0,200\n',
+                'chr2\t50\t150\tc\t0\t+\t50\t150\t0,0,0\t1\t100,\t0,\n']
+        self.files = []
+        for file_lines in [lines[:2], lines[1:] + lines[1:]]:
+            fd, path = tempfile.mkstemp(suffix='.bed')
+            with os.fdopen(fd, 'w') as fp:
+                fp.writelines(file_lines)
+            self.files.append(path)
+
+    def tearDown(self):
+        for path in self.files:
+            os.remove(path)
+
+    def get_exons(self, align_db):
+        return [(e.chrom, e.start, e.end, e.terminal)
+                    for e in align_db.exon_db]
+
+    def test_same_as_add_alignment(self):
+        align_db = gimme.AlignmentDB()
+        for path in self.files:
+            for groups in gimme.read_alignments(path,
+                                        chain_counts=align_db.chain_counts,
+                                        config=self.config):
+                gimme.add_alignment(align_db, groups)
+
+        merged_db = gimme.AlignmentDB()
+        for path in self.files:
+            n, chains, report = gimme.parse_input_file((path, False,
+                                                        self.config))
+            gimme.add_chains(merged_db, chains)
+
+        self.assertEqual(n, 4)
+        self.assertEqual(merged_db.chain_counts, align_db.chain_counts)
+        self.assertEqual(merged_db.chain_counts[('chr1', 1300, 1400,
+                                                    1500, 1600)], 3)
+        self.assertEqual(self.get_exons(merged_db),
+                            self.get_exons(align_db))
+        self.assertEqual(merged_db.intron_db.get_components(),
+                            align_db.intron_db.get_components())
+
+
+class TestAssemble(TestCase):
+    def setUp(self):
+        '''A two-exon transcript with GT-AG splice sites on chr1
+        and a single exon on chr2.
+
+        '''
+        sequence = ['A'] * 2000
+        sequence[1200:1202] = 'GT'
+        sequence[1298:1300] = 'AG'
+        self.genome = {'chr1': ''.join(sequence), 'chr2': 'A' * 1000}
+
+        fd, self.bed = tempfile.mkstemp(suffix='.bed')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write('chr1\t1000\t1500\ta\t0\t+\t1000\t1500\t0,0,0\t2\t'
+                        '200,200\t0,300\n'
+                    'chr2\t50\t700\tb\t0\t+\t50\t700\t0,0,0\t1\t'
+                        '650\t0\n')
+
+    def tearDown(self):
+        os.remove(self.bed)
+
+    def test_transcripts(self):
+        transcripts = list(gimme.assemble(self.bed, self.genome))
+        self.assertEqual([(t.name, t.strand, list(t.starts), list(t.ends),
+                            t.fallback) for t in transcripts],
+                        [('chr1:1.1', '+', [1000, 1300], [1200, 1500], None),
+                        ('chr2:1.1', '+', [50], [700], None)])
+        self.assertEqual(transcripts[0].gene_id, 1)
+
+    def test_params(self):
+        transcripts = list(gimme.assemble([self.bed], self.genome,
+                                            min_single_exon_len=1000))
+        self.assertEqual([t.chrom for t in transcripts], ['chr1'])
+        self.assertRaises(TypeError, list,
+                            gimme.assemble(self.bed, self.genome, foo=1))
+
+    def test_warm_splice_sites(self):
+        '''Splice sites are kept between samples.'''
+
+        splice_sites = gimme.split_strand.SpliceSiteCache(self.genome)
+        first = list(gimme.assemble(self.bed, splice_sites))
+        splice_sites.genome = None
+        self.assertEqual(list(gimme.assemble(self.bed, splice_sites)),
+                            first)
+
+    def test_bed_writer(self):
+        output = StringIO()
+        writer = gimme.BedWriter(output)
+        for transcript in gimme.assemble(self.bed, self.genome):
+            writer.add(transcript._replace(fallback='time'))
+        self.assertEqual(output.getvalue().splitlines()[0].split('\t'),
+                        ['chr1', '1000', '1500', 'chr1:1.1', '1000', '+',
+                            '1000', '1500', gimme.FALLBACK_RGB, '2',
+                            '200,200', '0,300'])
+        self.assertEqual(writer.fallbacks, [('chr1:1', 'time'),
+                                            ('chr2:1', 'time')])
+
+    def test_run_without_args(self):
+        '''Runs of the command line do not need its arguments.'''
+
+        outputs = []
+        for run in (gimme.run_serial, gimme.run_sorted):
+            writer = gimme.BedWriter(StringIO())
+            run([self.bed], gimme.split_strand.SpliceSiteCache(self.genome),
+                gimme.Config(), writer)
+            outputs.append(writer.output.getvalue())
+        self.assertEqual(len(outputs[0].splitlines()), 2)
+        self.assertEqual(outputs[1], outputs[0])
+
+
+class TestRunParallel(TestCase):
+    def setUp(self):
+        '''Exons A (100-300) and B (400-600) are joined to exon C
+        (800-1000) and then to exons D (1200-1400) or E (1600-1800),
+        so A-C-D, B-C-E and A-C-E, B-C-D are both minimal.
+        Alignments of chr2 are read in a different order.
+
+        '''
+        sequence = ['A'] * 2000
+        for end in (300, 600, 1000):
+            sequence[end:end + 2] = 'GT'
+        for start in (800, 1200, 1600):
+            sequence[start - 2:start] = 'AG'
+        sequence = ''.join(sequence)
+
+        self.dir = tempfile.mkdtemp()
+        self.reference = os.path.join(self.dir, 'genome.fa')
+        with open(self.reference, 'w') as fp:
+            for chrom in ('chr1', 'chr2'):
+                fp.write('>%s\n%s\n' % (chrom, sequence))
+
+        pairs = [(100, 800), (400, 800), (800, 1200), (800, 1600)]
+        self.bed = os.path.join(self.dir, 'alignments.bed')
+        with open(self.bed, 'w') as fp:
+            chr2_pairs = [pairs[i] for i in (0, 2, 1, 3)]
+            for chrom, pairs_ in (('chr1', pairs), ('chr2', chr2_pairs)):
+                for start, next_start in pairs_:
+                    fp.write('%s\t%d\t%d\tr\t0\t+\t%d\t%d\t0,0,0\t2\t'
+                                '200,200\t0,%d\n' %
+                                (chrom, start, next_start + 200, start,
+                                    next_start + 200, next_start - start))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_gimme(self, threads, sorted_=False):
+        '''Returns BED lines without names, which are numbered
+        per chromosome with threads.
+
+        '''
+        from utils import packed_genome
+
+        splice_sites = gimme.split_strand.SpliceSiteCache(
+                            packed_genome.open_genome(self.reference, False))
+        config = gimme.Config(max_isoforms=2)
+        writer = gimme.BedWriter(StringIO())
+        if threads > 1:
+            gimme.run_parallel([self.bed], splice_sites, self.reference,
+                                threads, config, writer)
+        elif sorted_:
+            path = self.bed + '.sorted'
+            with open(path, 'w') as fp:
+                fp.writelines(sorted(open(self.bed), key=lambda x:
+                                        (x.split()[0], int(x.split()[1]))))
+            gimme.run_sorted([path], splice_sites, config, writer)
+        else:
+            gimme.run_serial([self.bed], splice_sites, config, writer)
+        rows = [line.split('\t') for line in
+                    writer.output.getvalue().splitlines()]
+        return sorted(row[:3] + row[4:] for row in rows)
+
+    def test_same_as_serial(self):
+        '''Minimal isoforms do not depend on exon IDs, which are
+        numbered per chromosome with threads.
+
+        '''
+        serial = self.run_gimme(1)
+        self.assertEqual(len(serial), 4)
+        self.assertEqual(self.run_gimme(2), serial)
+
+    def test_sorted_same_as_serial(self):
+        self.assertEqual(self.run_gimme(1, sorted_=True), self.run_gimme(1))
+
+
+class TestRunDB(TestCase):
+    def setUp(self):
+        '''Exons A (100-300) and B (400-600) are joined to exon C
+        (800-1000) and then to exons D (1200-1400) or E (1600-1800)
+        in chr1 and chr2.
+
+        '''
+        sequence = ['A'] * 2000
+        for end in (300, 600, 1000):
+            sequence[end:end + 2] = 'GT'
+        for start in (800, 1200, 1600):
+            sequence[start - 2:start] = 'AG'
+        sequence = ''.join(sequence)
+        self.genome = {'chr1': sequence, 'chr2': sequence}
+
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'genes.db')
+        self.first = self.write_bed('first.bed', [('chr1', 100, 800),
+                                                    ('chr1', 800, 1200),
+                                                    ('chr2', 100, 800),
+                                                    ('chr2', 800, 1200)])
+        self.second = self.write_bed('second.bed', [('chr1', 400, 800),
+                                                    ('chr1', 800, 1600)])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_bed(self, name, alignments):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as fp:
+            for chrom, start, next_start in alignments:
+                fp.write('%s\t%d\t%d\tr\t0\t+\t%d\t%d\t0,0,0\t2\t'
+                            '200,200\t0,%d\n' %
+                            (chrom, start, next_start + 200, start,
+                                next_start + 200, next_start - start))
+        return path
+
+    def run_gimme(self, input_files, db=False, add=False, **params):
+        splice_sites = gimme.split_strand.SpliceSiteCache(self.genome)
+        writer = gimme.BedWriter(StringIO())
+        config = gimme.Config(**params)
+        if db:
+            gimme.run_db(input_files, splice_sites, self.db, add, config,
+                            writer)
+        else:
+            gimme.run_serial(input_files, splice_sites, config, writer)
+        return writer.output.getvalue()
+
+    def test_add(self):
+        self.run_gimme([self.first], db=True)
+        self.assertEqual(self.run_gimme([self.second], db=True, add=True),
+                            self.run_gimme([self.first, self.second]))
+        params, align_db, model_params, models, size = \
+                                    gimme.load_splice_graph(self.db)
+        self.assertEqual(len(align_db.chain_counts), 6)
+        self.assertEqual(len(models), 2)
+        self.assertEqual(size, os.path.getsize(self.db))
+
+    def test_builtin_types(self):
+        '''The database can be loaded without classes of gimme.'''
+
+        self.run_gimme([self.first], db=True)
+        self.assertFalse('ExonObj' in open(self.db, 'rb').read())
+
+    def test_parameters_changed(self):
+        self.run_gimme([self.first], db=True)
+        self.assertEqual(self.run_gimme([self.second], db=True, add=True,
+                                        min_transcript_len=500),
+                        self.run_gimme([self.first, self.second],
+                                        min_transcript_len=500))
+        self.assertRaises(ValueError, self.run_gimme, [self.second],
+                            db=True, add=True, gap_size=10)
+
+    def test_incomplete_record(self):
+        '''A record of an interrupted run is ignored and replaced.'''
+
+        self.run_gimme([self.first], db=True)
+        size = os.path.getsize(self.db)
+        self.run_gimme([self.second], db=True, add=True)
+        with open(self.db, 'r+b') as fp:
+            fp.truncate(size + 10)
+        self.assertEqual(gimme.load_splice_graph(self.db)[-1], size)
+        self.assertEqual(self.run_gimme([self.second], db=True, add=True),
+                            self.run_gimme([self.first, self.second]))
+
+    def test_truncated_record(self):
+        '''A record cut anywhere after its header is ignored.'''
+
+        self.run_gimme([self.first], db=True)
+        size = os.path.getsize(self.db)
+        self.run_gimme([self.second], db=True, add=True)
+        end = os.path.getsize(self.db)
+        for cut in (size + 4, (size + end) // 2, end - 1):
+            with open(self.db, 'r+b') as fp:
+                fp.truncate(cut)
+            self.assertEqual(gimme.load_splice_graph(self.db)[-1], size)
+        self.assertEqual(self.run_gimme([self.second], db=True, add=True),
+                            self.run_gimme([self.first, self.second]))
+
+
+class TestReadBlocks(TestCase):
+    def test_unrecognized_format(self):
+        fd, path = tempfile.mkstemp(suffix='.gff')
+        os.write(fd, 'chr1\tsrc\texon\t100\t200\t.\t+\t.\tID=a\n')
+        os.close(fd)
+        stderr = gimme.stderr
+        gimme.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, list,
+                                gimme.read_blocks(path, verbose=False))
+            self.assertTrue('Unrecognized input format' in
+                            gimme.stderr.getvalue())
+        finally:
+            gimme.stderr = stderr
+            os.remove(path)
+
+
+class TestReadSorted(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config = gimme.Config()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_bed(self, name, alignments):
+        '''Writes two-exon alignments at (chrom, start) to a BED file.'''
+
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as fp:
+            for chrom, start in alignments:
+                fp.write('%s\t%d\t%d\tr\t0\t+\t%d\t%d\t0,0,0\t2\t'
+                            '100,100\t0,200\n' %
+                            (chrom, start, start + 300, start, start + 300))
+        return path
+
+    def read(self, input_files):
+        return [(groups[0][0].chrom, groups[0][0].start) for groups in
+                    gimme.read_sorted(input_files, self.config)]
+
+    def test_natural_order(self):
+        '''chr2 is before chr10 as sorted by samtools or sort -V.'''
+
+        alignments = [('chr2', 500), ('chr2', 900), ('chr10', 100)]
+        path = self.write_bed('a.bed', alignments)
+        self.assertEqual(self.read([path]), alignments)
+
+    def test_not_sorted(self):
+        path = self.write_bed('a.bed', [('chr2', 100), ('chr10', 100),
+                                        ('chr2', 500)])
+        self.assertRaises(ValueError, self.read, [path])
+        path = self.write_bed('b.bed', [('chr2', 500), ('chr2', 100)])
+        self.assertRaises(ValueError, self.read, [path])
+
+    def test_merge(self):
+        '''b.bed has no alignments in chr2.'''
+
+        a = self.write_bed('a.bed', [('chr1', 500), ('chr2', 100),
+                                        ('chr10', 300)])
+        b = self.write_bed('b.bed', [('chr1', 100), ('chr10', 200)])
+        expected = [('chr1', 100), ('chr1', 500), ('chr2', 100),
+                    ('chr10', 200), ('chr10', 300)]
+        self.assertEqual(self.read([a, b]), expected)
+        self.assertEqual(self.read([b, a]), expected)
+
+    def test_different_orders(self):
+        a = self.write_bed('a.bed', [('chr2', 100), ('chr10', 100)])
+        b = self.write_bed('b.bed', [('chr10', 100), ('chr2', 100)])
+        self.assertRaises(ValueError, self.read, [a, b])
+
+    @unittest.skipIf(pysam is None, 'pysam is not installed')
+    def test_bam(self):
+        '''Chromosomes of a BAM file are in order of its header.'''
+
+        path = os.path.join(self.dir, 'a.bam')
+        header = {'HD': {'VN': '1.0', 'SO': 'coordinate'},
+                    'SQ': [{'SN': 'chr2', 'LN': 10000},
+                            {'SN': 'chr10', 'LN': 10000}]}
+        bam = pysam.AlignmentFile(path, 'wb', header=header)
+        for tid, pos in [(0, 100), (0, 500), (1, 100)]:
+            read = pysam.AlignedSegment()
+            read.query_name = 'r'
+            read.reference_id = tid
+            read.reference_start = pos
+            read.cigartuples = [(0, 100), (3, 100), (0, 100)]
+            read.query_sequence = 'A' * 200
+            bam.write(read)
+        bam.close()
+
+        bed = self.write_bed('b.bed', [('chr10', 300)])
+        self.assertEqual(self.read([path, bed]),
+                        [('chr2', 100), ('chr2', 500), ('chr10', 100),
+                            ('chr10', 300)])
+
+    def test_chromosome_order(self):
+        ranks = gimme.get_chromosome_order([['chr1', 'chr3'],
+                                            ['chr1', 'chr2', 'chr3']])
+        self.assertEqual(ranks, {'chr1': 0, 'chr2': 1, 'chr3': 2})
+
+
+class TestProfileLoci(TestCase):
+    def test_import_not_timed(self):
+        '''The first gene locus is not charged for importing networkx,
+        which is slowed down here by 0.5 seconds.
+
+        '''
+        fd, bed = tempfile.mkstemp(suffix='.bed')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write('chr1\t1000\t1500\ta\t0\t+\t1000\t1500\t0,0,0\t2\t'
+                        '200,200\t0,300\n')
+        code = '''if 1:
+            import sys, time
+            class SlowImport(object):
+                def find_module(self, name, path=None):
+                    if name == 'networkx':
+                        sys.meta_path.remove(self)
+                        time.sleep(0.5)
+            sys.meta_path.insert(0, SlowImport())
+            import gimme
+            gimme.profiler.enabled = True
+            list(gimme.assemble(%r, {'chr1': 'A' * 2000}))
+            loci = gimme.profiler.get_report()['slowest_loci']
+            print len(loci), max(locus['seconds'] for locus in loci)
+            ''' % bed
+        cwd = os.path.dirname(os.path.abspath(gimme.__file__))
+        try:
+            output = subprocess.check_output([sys.executable, '-c', code],
+                                                cwd=cwd)
+        finally:
+            os.remove(bed)
+        loci, seconds = output.split()
+        self.assertEqual(loci, '1')
+        self.assertTrue(float(seconds) < 0.25)
+
+
+class TestStartup(TestCase):
+    def test_lazy_imports(self):
+        '''Importing gimme does not load numpy, networkx or
+        multiprocessing.
+
+        '''
+        code = ('import sys; import gimme; '
+                'print [m for m in ("numpy", "networkx", "multiprocessing") '
+                'if m in sys.modules]')
+        cwd = os.path.dirname(os.path.abspath(gimme.__file__))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                            cwd=cwd)
+        self.assertEqual(output.strip(), '[]')
+
+
 if __name__ == '__main__':
     unittest.main()
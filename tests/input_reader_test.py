@@ -0,0 +1,87 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from itertools import islice
+
+from utils import input_reader
+from utils.input_reader import InputReader, open_input
+from utils.output_writer import OutputWriter
+
+
+class TestInputReader(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lines = ['chr1\t%d\t%d\n' % (i, i + 100) for i in range(50000)]
+        self.text = ''.join(self.lines)
+        self.buffer_size = input_reader.BUFFER_SIZE
+
+    def tearDown(self):
+        input_reader.BUFFER_SIZE = self.buffer_size
+        shutil.rmtree(self.dir)
+
+    def write(self, name, compression):
+        path = os.path.join(self.dir, name)
+        writer = OutputWriter(path, compression)
+        writer.write(self.text)
+        writer.close()
+        return path
+
+    def test_plain(self):
+        path = self.write('alignments.bed', None)
+        self.assertFalse(input_reader.is_compressed(path))
+        self.assertEqual(list(open_input(path)), self.lines)
+
+    def test_gzip(self):
+        path = self.write('alignments.bed.gz', 'gzip')
+        reader = open_input(path)
+        self.assertTrue(isinstance(reader, InputReader))
+        self.assertEqual(list(reader), self.lines)
+        reader.close()
+
+    def test_bgzf(self):
+        path = self.write('alignments.bed.gz', 'bgzf')
+        self.assertEqual(list(open_input(path)), self.lines)
+
+    def test_partial_lines(self):
+        '''Lines split between blocks are joined.'''
+        input_reader.BUFFER_SIZE = 7
+        path = self.write('alignments.bed.gz', 'gzip')
+        reader = open_input(path)
+        self.assertEqual(list(islice(reader, 1000)), self.lines[:1000])
+        reader.close()
+
+    def test_no_final_newline(self):
+        path = os.path.join(self.dir, 'alignments.bed.gz')
+        fp = gzip.open(path, 'wb')
+        fp.write('a\nb')
+        fp.close()
+        self.assertEqual(list(open_input(path)), ['a\n', 'b'])
+
+    def test_readline(self):
+        path = self.write('alignments.bed.gz', 'gzip')
+        reader = open_input(path)
+        self.assertEqual(reader.readline(), self.lines[0])
+        reader.close()
+
+    def test_close(self):
+        '''The background thread stops when a reader is closed early.'''
+        input_reader.BUFFER_SIZE = 100
+        path = self.write('alignments.bed.gz', 'gzip')
+        reader = open_input(path)
+        reader.readline()
+        reader.close()
+        self.assertFalse(reader.thread.is_alive())
+
+    def test_error(self):
+        path = self.write('alignments.bed.gz', 'gzip')
+        data = open(path, 'rb').read()
+        with open(path, 'wb') as fp:
+            fp.write(data[:len(data) // 2])
+        self.assertRaises(Exception, list, open_input(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
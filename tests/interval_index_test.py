@@ -0,0 +1,71 @@
+import random
+import unittest
+
+import numpy
+
+from utils.interval_index import IntervalIndex
+
+
+class TestIntervalIndex(unittest.TestCase):
+    def setUp(self):
+        '''Intervals are not sorted and the long one at 100
+        overlaps others.
+
+        '''
+        self.intervals = [(500, 600), (100, 1000), (200, 300), (650, 700)]
+        self.index = IntervalIndex([s for s, e in self.intervals],
+                                    [e for s, e in self.intervals])
+
+    def get_intervals(self, hits):
+        return [(self.index.starts[i], self.index.ends[i]) for i in hits]
+
+    def test_sorted(self):
+        self.assertEqual(self.index.starts.tolist(), [100, 200, 500, 650])
+        self.assertEqual(len(self.index), 4)
+
+    def test_find(self):
+        self.assertEqual(self.get_intervals(self.index.find(250, 550)),
+                            [(100, 1000), (200, 300), (500, 600)])
+        self.assertEqual(self.get_intervals(self.index.find(610, 640)),
+                            [(100, 1000)])
+        self.assertEqual(self.get_intervals(self.index.find(1000, 1100)), [])
+
+    def test_touching(self):
+        self.assertEqual(self.get_intervals(self.index.find(300, 500)),
+                            [(100, 1000)])
+        self.assertEqual(self.get_intervals(self.index.find(0, 100)), [])
+
+    def test_find_all(self):
+        queries, hits = self.index.find_all([0, 250, 1000, 620],
+                                            [100, 550, 1100, 660])
+        self.assertEqual(zip(queries.tolist(), self.get_intervals(hits)),
+                            [(1, (100, 1000)), (1, (200, 300)),
+                                (1, (500, 600)), (3, (100, 1000)),
+                                (3, (650, 700))])
+
+    def test_empty(self):
+        index = IntervalIndex([], [])
+        self.assertEqual(len(index.find(0, 100)), 0)
+        queries, hits = index.find_all([0], [100])
+        self.assertEqual(len(queries), 0)
+
+    def test_random(self):
+        '''Batched queries match a linear scan.'''
+
+        rand = random.Random(1)
+        starts = [rand.randint(0, 10000) for i in range(300)]
+        ends = [s + rand.randint(1, 500) for s in starts]
+        index = IntervalIndex(starts, ends)
+        query_starts = [rand.randint(0, 10000) for i in range(200)]
+        query_ends = [s + rand.randint(1, 300) for s in query_starts]
+
+        queries, hits = index.find_all(query_starts, query_ends)
+        pairs = set(zip(queries.tolist(), hits.tolist()))
+        expected = set((q, i) for q in range(200) for i in range(300)
+                        if index.starts[i] < query_ends[q] and
+                            index.ends[i] > query_starts[q])
+        self.assertEqual(pairs, expected)
+        for q in range(200):
+            self.assertEqual(
+                    sorted(index.find(query_starts[q], query_ends[q])),
+                    sorted(i for p, i in pairs if p == q))
@@ -0,0 +1,67 @@
+import os
+import gzip
+import struct
+import shutil
+import tempfile
+import unittest
+
+from utils import output_writer
+from utils.output_writer import OutputWriter, get_compression
+
+
+class TestOutputWriter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lines = ['chr1\t%d\t%d\n' % (i, i + 100) for i in range(50000)]
+        self.text = ''.join(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, path, compression):
+        writer = OutputWriter(path, compression)
+        for line in self.lines:
+            writer.write(line)
+        writer.close()
+
+    def test_get_compression(self):
+        self.assertEqual(get_compression(None), None)
+        self.assertEqual(get_compression('genes.bed'), None)
+        self.assertEqual(get_compression('genes.bed.gz'), 'gzip')
+        self.assertEqual(get_compression('genes.bed.gz', True), 'bgzf')
+
+    def test_plain(self):
+        path = os.path.join(self.dir, 'genes.bed')
+        self.write(path, None)
+        self.assertEqual(open(path).read(), self.text)
+
+    def test_gzip(self):
+        path = os.path.join(self.dir, 'genes.bed.gz')
+        self.write(path, 'gzip')
+        self.assertEqual(gzip.open(path).read(), self.text)
+
+    def test_bgzf(self):
+        path = os.path.join(self.dir, 'genes.bed.gz')
+        self.write(path, 'bgzf')
+        self.assertEqual(gzip.open(path).read(), self.text)
+
+        data = open(path, 'rb').read()
+        self.assertTrue(data.endswith(output_writer.BGZF_EOF))
+        offset = 0
+        while offset < len(data):
+            self.assertEqual(data[offset + 12:offset + 16], 'BC\x02\x00')
+            block_size = struct.unpack('<H', data[offset + 16:offset + 18])
+            isize = struct.unpack('<I', data[offset + block_size[0] - 3:
+                                                offset + block_size[0] + 1])
+            self.assertTrue(isize[0] <= output_writer.BGZF_BLOCK_SIZE)
+            offset += block_size[0] + 1
+        self.assertEqual(offset, len(data))
+
+    @unittest.skipIf(not os.path.exists('/dev/full'), 'no /dev/full')
+    def test_write_error(self):
+        '''An error after the end of output is raised by close().'''
+
+        writer = OutputWriter('/dev/full')
+        writer.write('small\n')
+        self.assertRaises(IOError, writer.close)
+        self.assertFalse(writer.thread.is_alive())
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cStringIO import StringIO
+
+from utils.packed_genome import open_genome, build, is_packed, PackedGenome
+from utils.packed_genome import write_fasta
+from utils import splice_site_seq
+
+
+class TestPackedGenome(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fasta = os.path.join(self.dir, 'genome.fa')
+        self.seqs = {'chr1': 'ACGTacgtNNnnRYACGTGGGGCAT',
+                     'chr2': 'TTAGC'}
+        with open(self.fasta, 'w') as fp:
+            fp.write('>chr1 description\n')
+            fp.write('ACGTacgtNN\nnnRYACGTGG\nGGCAT\n')
+            fp.write('>chr2\n')
+            fp.write('TTAGC\n')
+        self.expected = {'chr1': 'ACGTacgtNNnnNNACGTGGGGCAT',
+                         'chr2': 'TTAGC'}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_open_fasta(self):
+        genome = open_genome(self.fasta, verbose=False)
+        self.assertTrue(is_packed(self.fasta + '.packed'))
+        self.assertEqual(sorted(genome), ['chr1', 'chr2'])
+        for chrom, seq in self.expected.items():
+            self.assertEqual(len(genome[chrom]), len(seq))
+            self.assertEqual(str(genome[chrom]), seq)
+
+    def test_slices(self):
+        genome = open_genome(self.fasta, verbose=False)
+        seq = self.expected['chr1']
+        chrom = genome['chr1']
+        for start in range(len(seq) + 1):
+            for end in range(start, len(seq) + 2):
+                self.assertEqual(chrom[start:end], seq[start:end])
+        self.assertEqual(chrom[3], 'T')
+        self.assertEqual(chrom[-1], 'T')
+        self.assertRaises(IndexError, chrom.__getitem__, len(seq))
+
+    def test_reverse_complement(self):
+        genome = open_genome(self.fasta, verbose=False)
+        seq = genome['chr1'][0:10]
+        self.assertEqual(seq.reverse_complement(), 'NNacgtACGT')
+        self.assertEqual(seq.reverse_complement('ACGTNacgt'), 'acgtNACGT')
+
+    def test_write_fasta(self):
+        output = StringIO()
+        write_fasta(output, 'ACGTACGTAC', id='seq1', width=4)
+        self.assertEqual(output.getvalue(), '>seq1\nACGT\nACGT\nAC\n')
+
+    def test_junction_seq(self):
+        '''Sequences next to an intron at 5-16 in chr1.'''
+
+        genome = open_genome(self.fasta, verbose=False)
+        seqlen = splice_site_seq.SEQLEN
+        splice_site_seq.SEQLEN = 3
+        try:
+            self.assertEqual(splice_site_seq.get_junction_seq(genome,
+                                ('chr1', 5, 16, '+')), 'CGTTGG')
+            self.assertEqual(splice_site_seq.get_junction_seq(genome,
+                                ('chr1', 5, 16, '-')), 'CCAACG')
+        finally:
+            splice_site_seq.SEQLEN = seqlen
+
+    def test_open_packed(self):
+        path = os.path.join(self.dir, 'genome.packed')
+        build(self.fasta, path)
+        genome = open_genome(path)
+        self.assertEqual(str(genome['chr2']), 'TTAGC')
+        self.assertRaises(ValueError, PackedGenome, self.fasta)
+
+    def test_rebuild(self):
+        genome = open_genome(self.fasta, verbose=False)
+        genome.close()
+        with open(self.fasta, 'w') as fp:
+            fp.write('>chr3\nGATTACA\n')
+        mtime = os.path.getmtime(self.fasta + '.packed')
+        os.utime(self.fasta, (mtime + 1, mtime + 1))
+        genome = open_genome(self.fasta, verbose=False)
+        self.assertEqual(list(genome), ['chr3'])
+        self.assertEqual(str(genome['chr3']), 'GATTACA')
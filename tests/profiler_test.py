@@ -0,0 +1,75 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from utils.profiler import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_stage(self):
+        profiler = Profiler()
+        for i in range(3):
+            with profiler.stage('parse'):
+                pass
+        report = profiler.get_report()
+        self.assertEqual(report['stages']['parse']['calls'], 3)
+        self.assertTrue(report['stages']['parse']['peak_rss_kb'] > 0)
+
+    def test_stage_exception(self):
+        profiler = Profiler()
+
+        def fail():
+            with profiler.stage('parse'):
+                raise ValueError
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(profiler.stages['parse'][2], 1)
+
+    def test_disabled(self):
+        profiler = Profiler(enabled=False)
+        with profiler.stage('parse'):
+            profiler.count('alignments', 10)
+            profiler.add_locus(1.0, chrom='chr1')
+        report = profiler.get_report()
+        self.assertEqual(report['stages'], {})
+        self.assertEqual(report['counters'], {})
+        self.assertEqual(report['slowest_loci'], [])
+
+    def test_slowest_loci(self):
+        profiler = Profiler(max_loci=2)
+        for seconds in [0.1, 0.5, 0.2, 0.4]:
+            profiler.add_locus(seconds, chrom='chr1', exons=1)
+        loci = profiler.get_report()['slowest_loci']
+        self.assertEqual([locus['seconds'] for locus in loci], [0.5, 0.4])
+
+    def test_merge(self):
+        worker = Profiler()
+        with worker.stage('add_alignments'):
+            pass
+        worker.count('exons', 5)
+        worker.add_locus(0.3, chrom='chr2')
+
+        profiler = Profiler()
+        with profiler.stage('add_alignments'):
+            pass
+        profiler.count('exons', 2)
+        profiler.merge(worker.get_report())
+
+        report = profiler.get_report()
+        self.assertEqual(report['stages']['add_alignments']['calls'], 2)
+        self.assertEqual(report['counters']['exons'], 7)
+        self.assertEqual(report['slowest_loci'],
+                            [{'chrom': 'chr2', 'seconds': 0.3}])
+
+    def test_save(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'report.json')
+            profiler = Profiler()
+            profiler.count('genes', 3)
+            profiler.save(path)
+            self.assertEqual(json.load(open(path))['counters'], {'genes': 3})
+        finally:
+            shutil.rmtree(directory)